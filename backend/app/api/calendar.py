@@ -0,0 +1,31 @@
+"""低价日历 API"""
+from fastapi import APIRouter, HTTPException
+from fastapi.responses import StreamingResponse
+
+from app.api.chat import build_filter_options, sessions
+from app.core.config import settings
+from app.core.json_codec import sse_event
+from app.schemas.chat import CalendarRequest
+from app.services.price_calendar import price_calendar_service
+
+router = APIRouter()
+
+
+@router.post("/calendar")
+async def price_calendar(request: CalendarRequest):
+    """低价日历 (SSE)：每搜完一天下发一个 cell 事件，最后下发 done 事件"""
+    trip_info = request.trip_info
+    if not trip_info and request.session_id:
+        trip_info = sessions.get(request.session_id, {}).get("trip_info")
+    if not trip_info or not trip_info.get("dep_date"):
+        raise HTTPException(status_code=400, detail="缺少行程信息或出发日期")
+    if request.days > settings.CALENDAR_MAX_DAYS:
+        raise HTTPException(status_code=400, detail=f"窗口最多 ±{settings.CALENDAR_MAX_DAYS} 天")
+
+    filter_options = build_filter_options(trip_info)
+
+    async def event_generator():
+        async for event in price_calendar_service.stream(trip_info, request.days, filter_options):
+            yield sse_event(event)
+
+    return StreamingResponse(event_generator(), media_type="text/event-stream")
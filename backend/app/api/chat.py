@@ -1,16 +1,24 @@
 """对话 API 路由"""
-from fastapi import APIRouter, HTTPException, Depends
+from fastapi import APIRouter, HTTPException, Depends, Query
 from fastapi.responses import StreamingResponse
 from typing import Optional
 import uuid
-import json
 import asyncio
 
 from app.schemas.chat import ChatRequest, ChatResponse, TripInfo, ClarifyInfo, FlightInfo, DebugInfo
 from app.services.llm_service import llm_service
+from app.services.intent_rules import rule_intent_parser
 from app.services.flight_search import flight_search_service
 from app.services.flight_mock import flight_mock_service
+from app.services.mock_speculation import mock_speculation, race_mock
+from app.services.search_speculation import search_speculation
+from app.services.flight_filter import FlightResultSet
+from app.services.flight_table import FlightTable
+from app.core.cache import TTLCache
 from app.core.config import settings
+from app.core.debug_store import debug_store
+from app.core.json_codec import sse_event
+from app.core.reference_index import reference_index
 
 def extract_mock_flights(mock_request: dict, travel_type: str = "OW", passengers: list = None) -> list:
     """从 Mock 请求中直接提取结构化的航班数据"""
@@ -19,13 +27,19 @@ def extract_mock_flights(mock_request: dict, travel_type: str = "OW", passengers
     req_passengers = mock_request.get("searchParamRequest", {}).get("userCommonReq", {}).get("reqPassengers", [{"passengerType": "ADT", "passengerCount": 1}])
     passenger_counts = {p.get("passengerType"): p.get("passengerCount") for p in req_passengers}
     
+    key_map = {"ADT": "adultPrice", "CHD": "childPrice", "INF": "infantPrice"}
+    converted = {}  # segment_key -> 转换后的航段主体（多个 tripProduct 共享同一航段时只转换一次）
+    
     flights = []
     for tp in trip_products:
         flight_segments = []
         for fk in tp.get("flightKeys", []):
             segment_key = str(fk.get("flightKey"))
-            segment = segments_map.get(segment_key)
-            if segment:
+            base = converted.get(segment_key)
+            if base is None:
+                segment = segments_map.get(segment_key)
+                if not segment:
+                    continue
                 # 转换时间格式: 202602241200 -> 2026-02-24 12:00:00
                 dep_dt = segment.get("depDateTime", "")
                 dep_time = f"{dep_dt[:4]}-{dep_dt[4:6]}-{dep_dt[6:8]} {dep_dt[8:10]}:{dep_dt[10:12]}:00" if len(dep_dt) >= 12 else dep_dt
@@ -33,8 +47,7 @@ def extract_mock_flights(mock_request: dict, travel_type: str = "OW", passengers
                 arr_dt = segment.get("arrDateTime", "")
                 arr_time = f"{arr_dt[:4]}-{arr_dt[4:6]}-{arr_dt[6:8]} {arr_dt[8:10]}:{arr_dt[10:12]}:00" if len(arr_dt) >= 12 else arr_dt
                 
-                flight_segments.append({
-                    "sequence": fk.get("index", 1),
+                base = converted[segment_key] = {
                     "flight_no": segment.get("operatingFlightNo", ""),
                     "airline": {
                         "code": segment.get("marketingAirCode", ""),
@@ -55,9 +68,13 @@ def extract_mock_flights(mock_request: dict, travel_type: str = "OW", passengers
                         "time": arr_time
                     },
                     "duration": str(segment.get("duration", 0)),
-                    "equip": "",
-                    "is_transfer": fk.get("index", 1) > 1
-                })
+                    "equip": ""
+                }
+            flight_segments.append({
+                "sequence": fk.get("index", 1),
+                **base,
+                "is_transfer": fk.get("index", 1) > 1
+            })
         
         # 提取价格
         min_price = tp.get("minPrice", 0)
@@ -73,7 +90,6 @@ def extract_mock_flights(mock_request: dict, travel_type: str = "OW", passengers
         for p_type, count in passenger_counts.items():
             if count <= 0: continue
             
-            key_map = {"ADT": "adultPrice", "CHD": "childPrice", "INF": "infantPrice"}
             price_key = key_map.get(p_type)
             if price_key and price_key in first_detail:
                 p_detail = first_detail[price_key]
@@ -125,11 +141,57 @@ def extract_mock_flights(mock_request: dict, travel_type: str = "OW", passengers
         
     return flights
 
+def build_filter_options(trip_info: dict) -> dict:
+    """根据行程信息生成 filter_flights 的过滤参数"""
+    flight_no = trip_info.get("flight_no")
+    
+    # 判断用户是否有中转意图
+    wants_transfer = bool(trip_info.get("transfer_cities") or (flight_no and "/" in flight_no))
+    
+    # 检查是否需要按机场过滤
+    dep_code_input = trip_info.get("departure_code")
+    arr_code_input = trip_info.get("arrival_code")
+    
+    dep_airport = dep_code_input if reference_index.is_specific_airport(dep_code_input) else None
+    arr_airport = arr_code_input if reference_index.is_specific_airport(arr_code_input) else None
+    
+    return {
+        "airline_code": trip_info.get("airline_code"),
+        "flight_no": flight_no,
+        "direct_only": not wants_transfer,
+        "dep_airport_code": dep_airport,
+        "arr_airport_code": arr_airport
+    }
+
+
+def build_mock_params(trip_info: dict) -> dict:
+    """根据行程信息生成 mock_flight 的参数"""
+    channel = trip_info.get("channel")
+    return {
+        "dep_city": trip_info.get("departure_code") or trip_info.get("departure_city", "PEK"),
+        "arr_city": trip_info.get("arrival_code") or trip_info.get("arrival_city", "SHA"),
+        "dep_date": trip_info.get("dep_date"),
+        "travel_type": trip_info.get("travel_type", "OW"),
+        "return_date": trip_info.get("return_date"),
+        "flight_no": trip_info.get("flight_no"),
+        "airline_code": trip_info.get("airline_code"),
+        "transfer_cities": trip_info.get("transfer_cities"),
+        "passengers": trip_info.get("passengers", [{"type": "ADT", "count": 1}]),
+        "cabin_class": trip_info.get("cabin_class"),
+        "cabin_name": trip_info.get("cabin_name"),
+        "flat_type": channel if channel else "TC",
+        "legs": trip_info.get("legs")
+    }
+
 router = APIRouter()
 
 # 内存会话存储 (简单实现)
 sessions = {}
 
+# 会话最近一次的航班结果集 {session_id: {"result_set": FlightResultSet, "is_mocked": bool}}
+# 不放在 sessions 中，避免 /session/{id} 序列化整个结果集；按 TTL + LRU 淘汰，避免常驻进程内存无限增长
+result_sets = TTLCache(maxsize=settings.FLIGHT_RESULT_SET_MAX_SIZE, ttl=settings.FLIGHT_RESULT_SET_TTL)
+
 @router.post("/chat")
 async def chat(request: ChatRequest):
     """对话接口 (流式进度版)"""
@@ -148,130 +210,214 @@ async def chat(request: ChatRequest):
             session["trip_info"][field] = request.selected_option
 
         # 发送进度：正在解析意图
-        yield f"data: {json.dumps({'type': 'progress', 'status': 'UNDERSTANDING', 'message': '正在解析您的航班需求...'})}\n\n"
+        yield sse_event({'type': 'progress', 'status': 'UNDERSTANDING', 'message': '正在解析您的航班需求...'})
         
-        # 调用 LLM 解析意图
-        llm_result = await llm_service.parse_intent(
-            request.message,
-            history=session["history"],
-            current_trip_info=session["trip_info"]
-        )
+        # 句式固定的查询先走规则快速通道，无法确定时再调用 LLM 解析意图
+        llm_result = None
+        if settings.INTENT_FAST_PATH:
+            llm_result = rule_intent_parser.parse(request.message, current_trip_info=session["trip_info"])
+            if llm_result and settings.DEBUG:
+                print(f"[Intent] 规则快速通道命中: {llm_result.get('message')}")
+        speculative_search = None
+        if llm_result is None and settings.LLM_STREAMING:
+            # 流式解析：生成过程中推送已识别的行程字段和回复文本，航线确定后预启动搜索
+            intent_events = llm_service.parse_intent_stream(
+                request.message,
+                history=session["history"],
+                current_trip_info=session["trip_info"]
+            )
+            try:
+                async for event in intent_events:
+                    if event["type"] == "result":
+                        llm_result = event["result"]
+                    else:
+                        yield sse_event({'type': 'intent', 'message': event['message'], 'trip_info': event['trip_info']})
+                        if speculative_search is None and event["trip_info_complete"]:
+                            speculative_trip = llm_service.merge_trip_info(session["trip_info"], event["trip_info"])
+                            if search_speculation.ready(event["status"], speculative_trip):
+                                speculative_search = search_speculation.start(
+                                    speculative_trip, flight_search_service.search_stream
+                                )
+            finally:
+                await intent_events.aclose()
+                if llm_result is None:
+                    search_speculation.claim(speculative_search, None)  # 解析被中断
+                    speculative_search = None
+        if llm_result is None:
+            llm_result = await llm_service.parse_intent(
+                request.message,
+                history=session["history"],
+                current_trip_info=session["trip_info"]
+            )
         
-        if llm_result.get("status") == "error":
-            yield f"data: {json.dumps({'type': 'error', 'message': llm_result.get('message')})}\n\n"
-            return
+        # 从这里到搜索结束之间客户端随时可能断开（生成器在 yield 处被关闭），
+        # 未被消费的预启动搜索和预判的 Mock 必须在 finally 中取消，否则后台会继续轮询/上传
+        speculative_mock = None
+        try:
+            if llm_result.get("status") == "error":
+                search_speculation.claim(speculative_search, None)
+                if llm_result.get("code"):
+                    yield sse_event({'type': 'error', 'code': llm_result['code'], 'message': llm_result.get('message')})
+                else:
+                    yield sse_event({'type': 'error', 'message': llm_result.get('message')})
+                return
         
-        # 发送进度：意图解析完成
-        yield f"data: {json.dumps({'type': 'progress', 'status': 'UNDERSTANDING_DONE', 'message': '需求理解完成，准备检索...'})}\n\n"
+            # 发送进度：意图解析完成
+            yield sse_event({'type': 'progress', 'status': 'UNDERSTANDING_DONE', 'message': '需求理解完成，准备检索...'})
 
-        # 更新会话中的行程信息
-        updated_trip_info = llm_result.get("trip_info", {})
-        if updated_trip_info:
-            session["trip_info"] = llm_service.merge_trip_info(session["trip_info"], updated_trip_info)
+            # 更新会话中的行程信息
+            updated_trip_info = llm_result.get("trip_info", {})
+            if updated_trip_info:
+                session["trip_info"] = llm_service.merge_trip_info(session["trip_info"], updated_trip_info)
         
-        # 更新历史
-        if "history" not in session: session["history"] = []
-        session["history"].append({"role": "user", "content": request.message})
-        session["history"].append({"role": "assistant", "content": llm_result.get("message", "")})
+            # 更新历史
+            if "history" not in session: session["history"] = []
+            session["history"].append({"role": "user", "content": request.message})
+            session["history"].append({"role": "assistant", "content": llm_result.get("message", "")})
         
-        # 准备响应
-        response_type = "clarify" if llm_result.get("status") == "need_clarify" else "result"
+            # 准备响应
+            response_type = "clarify" if llm_result.get("status") == "need_clarify" else "result"
+
+            # 预启动的搜索只在最终需要搜索且参数一致时继续使用，否则立即取消
+            if speculative_search is not None:
+                needs_search = response_type == "result" and not (
+                    session["trip_info"].get("flight_no") or session["trip_info"].get("transfer_cities")
+                )
+                speculative_search = search_speculation.claim(speculative_search, session["trip_info"] if needs_search else None)
         
-        # 发送进度：提取到的需求内容，在此前置下发，让它紧贴着 UNDERSTANDING 节点展示
-        if llm_result.get("message"):
-            yield f"data: {json.dumps({'type': 'progress', 'status': 'UNDERSTANDING_DONE', 'message': llm_result.get('message')})}\n\n"
-        else:
-            yield f"data: {json.dumps({'type': 'progress', 'status': 'UNDERSTANDING_DONE', 'message': '需求理解完成'})}\n\n"
+            # 发送进度：提取到的需求内容，在此前置下发，让它紧贴着 UNDERSTANDING 节点展示
+            if llm_result.get("message"):
+                yield sse_event({'type': 'progress', 'status': 'UNDERSTANDING_DONE', 'message': llm_result.get('message')})
+            else:
+                yield sse_event({'type': 'progress', 'status': 'UNDERSTANDING_DONE', 'message': '需求理解完成'})
         
-        # 短暂休眠1秒，让前端有足够的时间停顿在“理解完毕”这一步供用户阅读提取的文字，不要瞬间冲刷掉
-        await asyncio.sleep(1.0)
+            # 短暂休眠1秒，让前端有足够的时间停顿在“理解完毕”这一步供用户阅读提取的文字，不要瞬间冲刷掉
+            await asyncio.sleep(1.0)
         
-        flights = []
-        is_mocked = False
-        debug_info = None
+            result_set = FlightResultSet(FlightTable())
+            is_mocked = False
+            debug_info = None
         
-        # 如果信息完整，执行搜索
-        if response_type == "result":
-            # 检查是否强制 mock（如果用户指定了航班号或中转城市，大概率是为了造特定数据）
-            force_mock = bool(session["trip_info"].get("flight_no") or session["trip_info"].get("transfer_cities"))
+            # 如果信息完整，执行搜索
+            if response_type == "result":
+                # 检查是否强制 mock（如果用户指定了航班号或中转城市，大概率是为了造特定数据）
+                force_mock = bool(session["trip_info"].get("flight_no") or session["trip_info"].get("transfer_cities"))
             
-            if not force_mock:
-                # 发送进度：正在检索
-                yield f"data: {json.dumps({'type': 'progress', 'status': 'SEARCHING', 'message': '正在检索实时航线信息...'})}\n\n"
-                search_res = await flight_search_service.search(session["trip_info"])
-            else:
+                filter_options = build_filter_options(session["trip_info"])
                 search_res = {"success": False, "flights": []}
             
-            if search_res.get("success") and search_res.get("flights"):
-                raw_flights = search_res["flights"]
-                airline_code = session["trip_info"].get("airline_code")
-                flight_no = session["trip_info"].get("flight_no")
+                mock_res = None
+                if not force_mock:
+                    # 大概率需要 Mock 时，搜索的同时准备 Mock 数据，先可用的一方胜出
+                    reason = mock_speculation.reason(session["trip_info"])
+                    if reason:
+                        mock_speculation.speculated += 1
+                        if settings.DEBUG:
+                            print(f"[Mock] 预判需要 Mock（{reason}），与搜索并发准备")
+                        speculative_mock = asyncio.ensure_future(flight_mock_service.mock_flight(
+                            **build_mock_params(session["trip_info"]), upload=settings.MOCK_SPECULATIVE_UPLOAD
+                        ))
                 
-                # 判断用户是否有中转意图
-                wants_transfer = bool(session["trip_info"].get("transfer_cities") or (flight_no and "/" in flight_no))
-                direct_only = not wants_transfer
+                    # 发送进度：正在检索
+                    yield sse_event({'type': 'progress', 'status': 'SEARCHING', 'message': '正在检索实时航线信息...'})
+                    partial_sent = 0
+                    search_stream = speculative_search.events() if speculative_search is not None \
+                        else flight_search_service.search_stream(session["trip_info"])
+                    search_events = race_mock(search_stream, speculative_mock)
+                    try:
+                        async for event in search_events:
+                            if event["type"] == "mock":
+                                if partial_sent == 0:
+                                    # Mock 先准备好且搜索还没有可用航班：采用 Mock，放弃搜索
+                                    mock_res = event["result"]
+                                    mock_speculation.mock_won += 1
+                                    break
+                            elif event["type"] == "partial":
+                                # 轮询尚未结束，先下发本轮新出现且符合条件的航班（最多一页，final 会整体替换）
+                                remaining = settings.FLIGHT_PAGE_SIZE - partial_sent
+                                if remaining <= 0:
+                                    continue
+                                partial_flights = flight_search_service.filter_flights(
+                                    event["flights"], **filter_options, limit=remaining
+                                )
+                                if partial_flights:
+                                    if speculative_mock is not None:
+                                        speculative_mock.cancel()  # 搜索已有可用航班，预判的 Mock 作废
+                                    partial_sent += len(partial_flights)
+                                    yield sse_event({'type': 'partial', 'flights': partial_flights})
+                            else:
+                                search_res = event["result"]
+                    finally:
+                        await search_events.aclose()  # Mock 胜出时立即关闭搜索事件流，取消上游轮询
                 
-                # 检查是否需要按机场过滤
-                dep_code_input = session["trip_info"].get("departure_code")
-                arr_code_input = session["trip_info"].get("arrival_code")
-                
-                dep_airport = dep_code_input if dep_code_input != flight_search_service.get_city_code_by_airport(dep_code_input) else None
-                arr_airport = arr_code_input if arr_code_input != flight_search_service.get_city_code_by_airport(arr_code_input) else None
-
-                filtered_flights = flight_search_service.filter_flights(
-                    raw_flights,
-                    airline_code=airline_code,
-                    flight_no=flight_no,
-                    direct_only=direct_only,
-                    dep_airport_code=dep_airport,
-                    arr_airport_code=arr_airport
-                )
+                    if search_res.get("overloaded"):
+                        # 准入队列已满：不降级 Mock（Mock 同样是二方调用），直接提示繁忙
+                        if speculative_mock is not None:
+                            speculative_mock.cancel()
+                        sessions[session_id] = session
+                        yield sse_event({'type': 'error', 'code': 'OVERLOADED', 'message': '当前查询人数较多，请稍后再试'})
+                        return
                 
-                if filtered_flights:
-                    flights = filtered_flights
+                    if search_res.get("success") and search_res.get("flights"):
+                        result_set = FlightResultSet.build(search_res["flights"], **filter_options)
+                    if mock_res is None:
+                        if not search_res.get("circuit_open"):
+                            mock_speculation.record(session["trip_info"], bool(result_set))
+                        if speculative_mock is not None:
+                            if result_set or speculative_mock.cancelled():
+                                speculative_mock.cancel()
+                                mock_speculation.search_won += 1
+                            else:
+                                # 搜索结束仍无结果，直接使用已在准备中的 Mock
+                                mock_res = await speculative_mock
+                                mock_speculation.fallback_used += 1
 
-            # 如果未找到航班或过滤后为空，则执行 Mock 降级
-            if not flights:
-                # 发送进度：正在 Mock
-                msg = '未找到匹配航线，正在为您安排 Mock 数据...' if not force_mock else '正在为您生成符合条件的 Mock 数据...'
-                yield f"data: {json.dumps({'type': 'progress', 'status': 'MOCKING', 'message': msg})}\n\n"
-                
-                dep_code = session["trip_info"].get("departure_code") or session["trip_info"].get("departure_city", "PEK")
-                arr_code = session["trip_info"].get("arrival_code") or session["trip_info"].get("arrival_city", "SHA")
+                # 如果未找到航班或过滤后为空，则执行 Mock 降级
+                if not result_set:
+                    # 发送进度：正在 Mock
+                    if force_mock:
+                        msg = '正在为您生成符合条件的 Mock 数据...'
+                    elif search_res.get("circuit_open"):
+                        # 搜索熔断中：上游未被请求，直接降级
+                        msg = '实时搜索暂时不可用，正在为您安排 Mock 数据...'
+                    else:
+                        msg = '未找到匹配航线，正在为您安排 Mock 数据...'
+                    yield sse_event({'type': 'progress', 'status': 'MOCKING', 'message': msg})
                 
-                channel = session["trip_info"].get("channel")
+                    if mock_res is None:
+                        # 如果搜索无结果，执行 Mock
+                        mock_res = await flight_mock_service.mock_flight(**build_mock_params(session["trip_info"]))
+                    elif not mock_res.get("uploaded"):
+                        # 预判时只构建了数据，采用后再上传
+                        mock_res = await flight_mock_service.upload_mock(mock_res["mock_request"])
                 
-                # 如果搜索无结果，执行 Mock
-                mock_res = await flight_mock_service.mock_flight(
-                    dep_city=dep_code,
-                    arr_city=arr_code,
-                    dep_date=session["trip_info"].get("dep_date"),
-                    travel_type=session["trip_info"].get("travel_type", "OW"),
-                    return_date=session["trip_info"].get("return_date"),
-                    flight_no=session["trip_info"].get("flight_no"),
-                    airline_code=session["trip_info"].get("airline_code"),
-                    transfer_cities=session["trip_info"].get("transfer_cities"),
-                    passengers=session["trip_info"].get("passengers", [{"type": "ADT", "count": 1}]),
-                    cabin_class=session["trip_info"].get("cabin_class"),
-                    cabin_name=session["trip_info"].get("cabin_name"),
-                    flat_type=channel if channel else "TC"
-                )
+                    if settings.DEBUG:
+                        print(f"[Mock] mock_res success={mock_res.get('success')}, error={mock_res.get('error')}")
                 
-                if settings.DEBUG:
-                    print(f"[Mock] mock_res success={mock_res.get('success')}, error={mock_res.get('error')}")
+                    if mock_res.get("code") == "OVERLOADED":
+                        # Mock 准入队列已满：数据未上传，与搜索一样直接提示繁忙
+                        sessions[session_id] = session
+                        yield sse_event({'type': 'error', 'code': 'OVERLOADED', 'message': '当前查询人数较多，请稍后再试'})
+                        return
                 
-                # 无论二方 Mock 接口返回成功与否，利用已生成的 mock 数据供前端展示
-                mock_request_data = mock_res.get("mock_request", {})
-                if mock_request_data:
-                    flights = extract_mock_flights(mock_request_data, session["trip_info"].get("travel_type", "OW"), session["trip_info"].get("passengers"))
-                    is_mocked = True
+                    # 无论二方 Mock 接口返回成功与否，利用已生成的 mock 数据供前端展示
+                    mock_request_data = mock_res.get("mock_request", {})
+                    if mock_request_data:
+                        result_set = FlightResultSet.build(extract_mock_flights(mock_request_data, session["trip_info"].get("travel_type", "OW"), session["trip_info"].get("passengers")))
+                        is_mocked = True
 
                 
-                # 记录调试信息
-                debug_info = {
-                    "mock_request": mock_res.get("mock_request"),
-                    "search_response": search_res.get("raw_response")
-                }
+                    # 记录调试信息
+                    # 原始数据压缩存入调试存储，final 只带 debug_id 和大小
+                    debug_info = debug_store.put({
+                        "mock_request": mock_res.get("mock_request"),
+                        "search_response": search_res.get("raw_response")
+                    })
+        finally:
+            if speculative_search is not None:
+                speculative_search.cancel()
+            if speculative_mock is not None and not speculative_mock.done():
+                speculative_mock.cancel()
 
         # 保存会话状态
         if response_type == "clarify" and llm_result.get("clarify"):
@@ -279,7 +425,14 @@ async def chat(request: ChatRequest):
         else:
             session["last_clarify_field"] = None
             
+        # 保存本轮结果集，final 只下发第一页，后续页通过 /session/{id}/flights 获取
+        if result_set:
+            result_sets.set(session_id, {"result_set": result_set, "is_mocked": is_mocked})
+        else:
+            result_sets.pop(session_id, None)
+        session["has_flight_results"] = bool(result_set)
         sessions[session_id] = session
+        flights = result_set.page(0, settings.FLIGHT_PAGE_SIZE, sort=settings.FLIGHT_DEFAULT_SORT)
         
         # 发送最终结果
         final_payload = {
@@ -290,10 +443,13 @@ async def chat(request: ChatRequest):
             "trip_info": session["trip_info"] if session["trip_info"] else None,
             "clarify": llm_result.get("clarify"),
             "flights": flights,
+            "total": len(result_set),
+            "page_size": settings.FLIGHT_PAGE_SIZE,
+            "sort": settings.FLIGHT_DEFAULT_SORT,
             "is_mocked": is_mocked,
             "debug_info": debug_info
         }
-        yield f"data: {json.dumps(final_payload)}\n\n"
+        yield sse_event(final_payload)
 
     return StreamingResponse(event_generator(), media_type="text/event-stream")
 
@@ -313,3 +469,39 @@ async def get_session(session_id: str):
     if session_id not in sessions:
         raise HTTPException(status_code=404, detail="Session not found")
     return sessions[session_id]
+
+@router.get("/session/{session_id}/flights")
+async def get_session_flights(
+    session_id: str,
+    offset: int = Query(default=0, ge=0),
+    limit: int = Query(default=None, ge=1, le=200),
+    sort: Optional[str] = Query(default=None, description="排序字段 price/duration/departure/stops，前缀 - 表示倒序")
+):
+    """分页获取会话最近一次的航班结果（不重新搜索）"""
+    if session_id not in sessions:
+        raise HTTPException(status_code=404, detail="Session not found")
+    stored = result_sets.get(session_id)
+    if not stored:
+        if sessions[session_id].get("has_flight_results"):
+            raise HTTPException(status_code=410, detail="Flight results expired, please search again")
+        raise HTTPException(status_code=404, detail="No flight results for this session")
+    
+    limit = limit or settings.FLIGHT_PAGE_SIZE
+    sort = sort or settings.FLIGHT_DEFAULT_SORT
+    descending = sort.startswith("-")
+    result_set = stored["result_set"]
+    try:
+        flights = result_set.page(offset, limit, sort=sort.lstrip("-"), descending=descending)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e)) from e
+    
+    return {
+        "session_id": session_id,
+        "offset": offset,
+        "limit": limit,
+        "sort": sort,
+        "total": len(result_set),
+        "has_more": offset + len(flights) < len(result_set),
+        "is_mocked": stored["is_mocked"],
+        "flights": flights
+    }
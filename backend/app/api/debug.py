@@ -0,0 +1,31 @@
+"""调试数据 API"""
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import Response, StreamingResponse
+
+from app.core.debug_store import debug_store
+
+router = APIRouter()
+
+
+@router.get("/debug/{debug_id}")
+async def get_debug_payload(debug_id: str, request: Request):
+    """按需获取调试数据 {mock_request, search_response}
+
+    客户端支持 deflate 时直接下发存储中的压缩数据，否则分块解压后流式返回。
+    """
+    compressed = debug_store.get_compressed(debug_id)
+    if compressed is None:
+        raise HTTPException(status_code=404, detail="Debug payload not found or expired")
+
+    # 同一 URL 按 Accept-Encoding 返回不同编码，需声明 Vary，避免缓存把压缩体发给不支持的客户端
+    if "deflate" in request.headers.get("accept-encoding", ""):
+        return Response(
+            content=compressed,
+            media_type="application/json",
+            headers={"Content-Encoding": "deflate", "Vary": "Accept-Encoding"}
+        )
+    return StreamingResponse(
+        debug_store.iter_decompressed(compressed),
+        media_type="application/json",
+        headers={"Vary": "Accept-Encoding"}
+    )
@@ -0,0 +1,37 @@
+"""运行指标 API"""
+from fastapi import APIRouter
+
+from app.api.chat import result_sets
+from app.core.admission import admission
+from app.core.debug_store import debug_store
+from app.services.flight_search import flight_search_service
+from app.services.intent_rules import rule_intent_parser
+from app.services.llm_service import llm_service
+from app.services.mock_speculation import mock_speculation
+from app.services.price_calendar import price_calendar_service
+from app.services.prompt_assembler import prompt_assembler
+from app.services.search_speculation import search_speculation
+
+router = APIRouter()
+
+
+@router.get("/metrics")
+async def get_metrics():
+    """各组件运行指标（缓存命中率等），供运维排查和调参"""
+    return {
+        "admission": admission.stats(),
+        "intent_fast_path": rule_intent_parser.stats(),
+        "llm_cache": llm_service.cache_stats(),
+        "llm_prompt": prompt_assembler.stats(),
+        "llm_usage": llm_service.usage_stats(),
+        "llm_output": llm_service.output_stats(),
+        "search_cache": flight_search_service.cache_stats(),
+        "search_polling": flight_search_service.polling_stats.stats(),
+        "search_breaker": flight_search_service.breaker.stats(),
+        "search_hedging": flight_search_service.hedging.stats(),
+        "search_speculation": search_speculation.stats(),
+        "calendar_cache": price_calendar_service.stats(),
+        "mock_speculation": mock_speculation.stats(),
+        "debug_store": debug_store.stats(),
+        "result_sets": result_sets.stats()
+    }
@@ -0,0 +1,152 @@
+"""准入控制 - 限制对各二方服务的并发调用
+
+搜索、Mock 上传、LLM 调用共用一个 AdmissionController，每个上游一个闸门：
+- 并发上限：同时进行的调用数不超过 limit，其余调用排队等待
+- 有界优先队列：交互请求（对话）优先于批量任务（低价日历），同优先级先到先得
+- 削峰：队列已满时，新请求优先级更高则挤掉队尾最低优先级的等待者，否则直接拒绝（AdmissionRejectedError）
+请求优先级通过 contextvar 传递，调用方无需逐层传参。
+"""
+import asyncio
+import heapq
+import itertools
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from contextvars import ContextVar
+from typing import Callable
+
+from app.core.config import settings
+
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BATCH = 1
+
+# 当前请求的优先级，默认按交互请求处理；批量任务在自己的 task 内设置为 PRIORITY_BATCH
+request_priority: ContextVar[int] = ContextVar("request_priority", default=PRIORITY_INTERACTIVE)
+
+
+class AdmissionRejectedError(Exception):
+    """等待队列已满，请求被拒绝"""
+
+    def __init__(self, upstream: str):
+        super().__init__(f"{upstream} 服务繁忙，请稍后再试")
+        self.upstream = upstream
+
+
+class _Gate:
+    """单个上游的并发闸门"""
+
+    def __init__(self, name: str, limit: int, max_queue: int, clock: Callable[[], float] = time.monotonic):
+        self.name = name
+        self.limit = limit
+        self.max_queue = max_queue
+        self._clock = clock
+        self.active = 0
+        self._waiters: list = []  # 堆: (优先级, 序号, future)
+        self._seq = itertools.count()
+        self._waits: deque = deque(maxlen=200)  # 最近的排队耗时（秒）
+        self.admitted = 0
+        self.queued = 0
+        self.rejected = 0
+        self.shed = 0  # 排队中被更高优先级请求挤掉的次数
+
+    async def acquire(self, priority: int):
+        if self.active < self.limit and not self._waiters:
+            self.active += 1
+            self._admit(0.0)
+            return
+
+        if len(self._waiters) >= self.max_queue:
+            worst = max(self._waiters, default=None)
+            if worst is None or worst[0] <= priority:
+                self.rejected += 1
+                raise AdmissionRejectedError(self.name)
+            self._remove(worst)
+            worst[2].set_exception(AdmissionRejectedError(self.name))
+            self.shed += 1
+
+        entry = (priority, next(self._seq), asyncio.get_running_loop().create_future())
+        heapq.heappush(self._waiters, entry)
+        self.queued += 1
+        start = self._clock()
+        try:
+            await entry[2]
+        except asyncio.CancelledError:
+            if entry[2].done() and not entry[2].cancelled() and entry[2].exception() is None:
+                self.release()  # 已分到名额但调用方被取消，转交给下一个
+            elif entry in self._waiters:
+                self._remove(entry)
+            raise
+        self._admit(self._clock() - start)
+
+    def release(self):
+        """释放名额：直接转交给优先级最高的等待者，没有等待者时并发数减一"""
+        while self._waiters:
+            _, _, future = heapq.heappop(self._waiters)
+            if not future.done():
+                future.set_result(None)
+                return
+        self.active -= 1
+
+    def _admit(self, wait: float):
+        self.admitted += 1
+        self._waits.append(wait)
+
+    def _remove(self, entry: tuple):
+        self._waiters.remove(entry)
+        heapq.heapify(self._waiters)
+
+    def stats(self) -> dict:
+        waits = sorted(self._waits)
+        return {
+            "limit": self.limit,
+            "active": self.active,
+            "queue_depth": len(self._waiters),
+            "max_queue": self.max_queue,
+            "admitted": self.admitted,
+            "queued": self.queued,
+            "rejected": self.rejected,
+            "shed": self.shed,
+            "avg_wait_ms": round(sum(waits) / len(waits) * 1000, 1) if waits else 0,
+            "p95_wait_ms": round(waits[min(len(waits) - 1, int(len(waits) * 0.95))] * 1000, 1) if waits else 0,
+            "max_wait_ms": round(waits[-1] * 1000, 1) if waits else 0
+        }
+
+
+class AdmissionController:
+    """各二方服务共用的准入控制器"""
+
+    def __init__(self, limits: dict, enabled: bool = True):
+        """
+        Args:
+            limits: {上游名: (并发上限, 等待队列长度)}
+            enabled: 关闭时 slot 直接放行
+        """
+        self.enabled = enabled
+        self.gates = {name: _Gate(name, limit, max_queue) for name, (limit, max_queue) in limits.items()}
+
+    @asynccontextmanager
+    async def slot(self, upstream: str, priority: int = None):
+        """占用一个上游调用名额；priority 默认取当前请求的优先级"""
+        gate = self.gates.get(upstream)
+        if not self.enabled or gate is None:
+            yield
+            return
+        await gate.acquire(request_priority.get() if priority is None else priority)
+        try:
+            yield
+        finally:
+            gate.release()
+
+    def stats(self) -> dict:
+        return {"enabled": self.enabled, **{name: gate.stats() for name, gate in self.gates.items()}}
+
+
+# 全局单例
+admission = AdmissionController(
+    {
+        "search": (settings.ADMISSION_SEARCH_CONCURRENCY, settings.ADMISSION_SEARCH_QUEUE),
+        "mock": (settings.ADMISSION_MOCK_CONCURRENCY, settings.ADMISSION_MOCK_QUEUE),
+        "llm": (settings.ADMISSION_LLM_CONCURRENCY, settings.ADMISSION_LLM_QUEUE)
+    },
+    enabled=settings.ADMISSION_ENABLED
+)
@@ -0,0 +1,119 @@
+"""通用内存缓存 - TTL + LRU，以及并发请求合并（single-flight）"""
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Hashable
+
+
+class TTLCache:
+    """带过期时间的有界 LRU 缓存，记录命中/未命中次数"""
+
+    def __init__(self, maxsize: int = 256, ttl: float = 300.0, clock: Callable[[], float] = time.monotonic):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._clock = clock
+        self._data: OrderedDict[Hashable, tuple[float, Any]] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        """读取缓存，过期视为未命中；命中时刷新 LRU 顺序"""
+        entry = self._data.get(key)
+        if entry is not None:
+            expires_at, value = entry
+            if expires_at > self._clock():
+                self._data.move_to_end(key)
+                self.hits += 1
+                return value
+            del self._data[key]
+        self.misses += 1
+        return default
+
+    def set(self, key: Hashable, value: Any, ttl: float = None):
+        """写入缓存，超出容量时淘汰最久未使用的条目"""
+        self._data[key] = (self._clock() + (self.ttl if ttl is None else ttl), value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+            self.evictions += 1
+
+    def pop(self, key: Hashable, default: Any = None) -> Any:
+        entry = self._data.pop(key, None)
+        return default if entry is None else entry[1]
+
+    def clear(self):
+        self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "maxsize": self.maxsize,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / total, 4) if total else 0.0,
+        }
+
+
+class _Call:
+    """一次进行中的调用及其等待方数量"""
+
+    __slots__ = ("task", "waiters")
+
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    """相同 key 的并发调用只执行一次，其余调用方共享同一结果
+
+    调用在独立的任务中执行，按等待方计数：任一等待方被取消只影响它自己，
+    最后一个等待方离开（被取消）时才取消调用本身，上游请求随之停止。
+    """
+
+    def __init__(self):
+        self._inflight: dict[Hashable, _Call] = {}
+        self.shared = 0
+        self.cancelled = 0  # 所有等待方都离开而被取消的调用数
+
+    def in_flight(self, key: Hashable) -> bool:
+        return key in self._inflight
+
+    def waiters(self, key: Hashable) -> int:
+        call = self._inflight.get(key)
+        return call.waiters if call is not None else 0
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        """执行 fn 或等待已在执行中的同 key 调用；调用失败时所有等待方收到同样的异常"""
+        call = self._inflight.get(key)
+        if call is None:
+            call = self._inflight[key] = _Call(asyncio.ensure_future(fn()))
+            call.task.add_done_callback(lambda task: self._finished(key, call))
+        else:
+            self.shared += 1
+        call.waiters += 1
+        try:
+            return await asyncio.shield(call.task)
+        finally:
+            call.waiters -= 1
+            if call.waiters == 0 and not call.task.done():
+                self._forget(key, call)
+                call.task.cancel()
+                self.cancelled += 1
+
+    def _forget(self, key: Hashable, call: _Call):
+        if self._inflight.get(key) is call:
+            del self._inflight[key]
+
+    def _finished(self, key: Hashable, call: _Call):
+        self._forget(key, call)
+        # 没有等待方时避免 "exception was never retrieved" 警告
+        if not call.task.cancelled():
+            call.task.exception()
@@ -0,0 +1,135 @@
+"""熔断器 - 按最近调用的失败率/慢调用率熔断
+
+- closed：正常放行，记录最近 window 次调用的结果与耗时
+- open：失败率或慢调用率超过阈值后熔断，冷却期内直接拒绝
+- half_open：冷却结束后只放行一次探测调用，成功则恢复，失败则重新熔断
+
+allow() 返回的许可（Permit）跟随调用，record/release 只对发放它的那次调用生效。
+"""
+import time
+from collections import deque
+from typing import Callable, Optional
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class Permit:
+    """一次被放行调用的许可：记录放行时的代数，以及是否为半开状态下的探测"""
+
+    __slots__ = ("generation", "probe")
+
+    def __init__(self, generation: int, probe: bool = False):
+        self.generation = generation
+        self.probe = probe
+
+
+class CircuitBreaker:
+    """滑动窗口熔断器"""
+
+    def __init__(
+        self,
+        window: int = 20,
+        min_calls: int = 5,
+        failure_rate: float = 0.5,
+        slow_call: float = 20.0,
+        slow_rate: float = 0.8,
+        cooldown: float = 30.0,
+        enabled: bool = True,
+        clock: Callable[[], float] = time.monotonic
+    ):
+        self.min_calls = min_calls
+        self.failure_rate = failure_rate
+        self.slow_call = slow_call
+        self.slow_rate = slow_rate
+        self.cooldown = cooldown
+        self.enabled = enabled
+        self._clock = clock
+        self._calls: deque = deque(maxlen=window)  # (是否失败, 是否慢调用, 耗时)
+        self.state = CLOSED
+        self.opened_at = 0.0
+        self._generation = 0  # 每次状态切换加一，用于识别熔断前放行的过期调用
+        self._probe: Optional[Permit] = None  # 半开状态下放行的唯一探测
+        self.opened = 0
+        self.rejected = 0
+
+    def allow(self) -> Optional["Permit"]:
+        """本次调用是否放行：放行时返回许可（结果和释放都要带上它），熔断中返回 None"""
+        if not self.enabled or self.state == CLOSED:
+            return Permit(self._generation)
+        if self.state == OPEN:
+            if self._clock() - self.opened_at < self.cooldown:
+                self.rejected += 1
+                return None
+            self.state = HALF_OPEN
+        if self._probe is not None:
+            self.rejected += 1
+            return None
+        self._probe = Permit(self._generation, probe=True)
+        return self._probe
+
+    def record(self, success: bool, latency: float, permit: "Permit" = None):
+        """记录一次调用结果
+
+        只有当前探测许可的结果能关闭或重新打开熔断器；在熔断前一轮放行的调用（许可代数已过期）
+        以及熔断/探测期间结束的普通调用不计入窗口，避免用别的调用的结果改变状态。
+        permit 为 None 时视为当前代数的普通调用。
+        """
+        slow = latency >= self.slow_call
+        if permit is not None and permit.probe:
+            if permit is not self._probe or self.state != HALF_OPEN:
+                return
+            self._probe = None
+            if success and not slow:
+                self._close()
+            else:
+                self._open()
+            return
+        if self.state != CLOSED or (permit is not None and permit.generation != self._generation):
+            return
+        self._calls.append((not success, slow, latency))
+        if len(self._calls) >= self.min_calls:
+            failures, slow_calls = self._rates()
+            if failures >= self.failure_rate or slow_calls >= self.slow_rate:
+                self._open()
+
+    def release(self, permit: "Permit"):
+        """调用结束时调用（finally 中）：探测未记录结果就结束（如被取消）时允许下一次探测，其余许可无操作"""
+        if permit is not None and permit is self._probe:
+            self._probe = None
+
+    def _close(self):
+        self.state = CLOSED
+        self._calls.clear()
+        self._generation += 1
+
+    def _open(self):
+        self.state = OPEN
+        self._generation += 1
+        self.opened_at = self._clock()
+        self.opened += 1
+
+    def _rates(self) -> tuple:
+        total = len(self._calls)
+        if not total:
+            return 0.0, 0.0
+        return (
+            sum(1 for failed, _, _ in self._calls if failed) / total,
+            sum(1 for _, slow, _ in self._calls if slow) / total
+        )
+
+    def stats(self) -> dict:
+        failures, slow_calls = self._rates()
+        latencies = [latency for _, _, latency in self._calls]
+        return {
+            "enabled": self.enabled,
+            "state": self.state,
+            "calls": len(self._calls),
+            "failure_rate": round(failures, 4),
+            "slow_rate": round(slow_calls, 4),
+            "avg_latency_ms": round(sum(latencies) / len(latencies) * 1000, 1) if latencies else 0,
+            "opened": self.opened,
+            "rejected": self.rejected,
+            "retry_in_s": round(max(0.0, self.opened_at + self.cooldown - self._clock()), 1) if self.state == OPEN else 0
+        }
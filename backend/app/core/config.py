@@ -14,7 +14,115 @@ class Settings(BaseSettings):
     SEARCH_API_URL: str = "http://localhost:8080/search/simplifySearch"
     SEARCH_API_TOKEN: str = ""  # Labrador-Token
     MOCK_API_URL: str = "http://dispatchmng.uat.ie.17usoft.com/service/wiki"
+
+    # JSON 编解码后端：auto（有 orjson 用 orjson，否则标准库）/ orjson / stdlib；orjson 已列入依赖
+    JSON_BACKEND: str = "auto"
+
+    # 二方接口连接池配置（每个服务一个长连接池，随应用 lifespan 创建/关闭）
+    SEARCH_TIMEOUT: float = 90.0
+    MOCK_TIMEOUT: float = 30.0
+    HTTP_MAX_CONNECTIONS: int = 100
+    HTTP_MAX_KEEPALIVE_CONNECTIONS: int = 20
+    HTTP_KEEPALIVE_EXPIRY: float = 30.0
+    HTTP2_ENABLED: bool = False  # 需要安装 h2，未安装时自动回退 HTTP/1.1
+
+    # 搜索轮询：总时间预算与等待间隔（秒）
+    SEARCH_TIME_BUDGET: float = 30.0
+    SEARCH_POLL_MIN_SLEEP: float = 0.2
+    SEARCH_POLL_MAX_SLEEP: float = 3.0
+    SEARCH_POLL_TIMEOUT: float = 15.0  # 单次轮询请求超时，不超过剩余预算
+
+    # 搜索熔断：最近 N 次上游搜索的失败率或慢调用率超过阈值时熔断（直接降级 Mock），冷却后放行一次探测
+    SEARCH_BREAKER_ENABLED: bool = True
+    SEARCH_BREAKER_WINDOW: int = 20
+    SEARCH_BREAKER_MIN_CALLS: int = 5
+    SEARCH_BREAKER_FAILURE_RATE: float = 0.5
+    SEARCH_BREAKER_SLOW_CALL: float = 20.0  # 整次搜索超过该秒数记为慢调用
+    SEARCH_BREAKER_SLOW_RATE: float = 0.8
+    SEARCH_BREAKER_COOLDOWN: float = 30.0
+
+    # 准入控制：每个二方服务的并发上限与等待队列长度，队列满时拒绝（交互请求优先于批量任务）
+    ADMISSION_ENABLED: bool = True
+    ADMISSION_SEARCH_CONCURRENCY: int = 32
+    ADMISSION_SEARCH_QUEUE: int = 64
+    ADMISSION_MOCK_CONCURRENCY: int = 8
+    ADMISSION_MOCK_QUEUE: int = 32
+    ADMISSION_LLM_CONCURRENCY: int = 16
+    ADMISSION_LLM_QUEUE: int = 64
+
+    # 对冲轮询：单次轮询超过最近轮询耗时的分位数仍未返回时，再发一次相同的轮询，取先成功的
+    SEARCH_HEDGE_ENABLED: bool = True
+    SEARCH_HEDGE_PERCENTILE: float = 0.95
+    SEARCH_HEDGE_MIN_SAMPLES: int = 20  # 样本不足时不对冲
+    SEARCH_HEDGE_MIN_DELAY: float = 0.5
+
+    # 流式解析搜索响应：按块读取，航段/产品逐个解析并精简，原始响应体压缩保存
+    SEARCH_STREAM_PARSE: bool = True
+    SEARCH_STREAM_CHUNK_SIZE: int = 64 * 1024
+
+    # 搜索结果缓存（按规范化的 trip_info 缓存，并合并并发的相同搜索）
+    SEARCH_CACHE_ENABLED: bool = True
+    SEARCH_CACHE_TTL: float = 300.0
+    SEARCH_CACHE_MAX_SIZE: int = 256
+    
+    # 分程搜索：往返/缺口程按程并发搜索后拼接（缺口程总是拆分；往返默认走合并请求以保留往返打包价）
+    SEARCH_SPLIT_RT: bool = False
+    SEARCH_LEG_TOP_K: int = 30  # 每一程参与拼接的最便宜航班数
+    SEARCH_MAX_ITINERARIES: int = 200
+    SEARCH_MIN_CONNECTION_MINUTES: int = 60  # 相邻两程最短衔接时间
+    
+    # 机场扇出：城市级单程搜索按机场对并发查询后合并去重（上游需支持按机场码查询）
+    SEARCH_AIRPORT_FANOUT: bool = False
     
+    # 低价日历：±N 天并发搜索，格子短时缓存
+    CALENDAR_MAX_DAYS: int = 7  # 窗口上限（单侧天数）
+    CALENDAR_MAX_CONCURRENCY: int = 4
+    CALENDAR_TIME_BUDGET: float = 15.0  # 每天的轮询预算，比单次搜索更短
+    CALENDAR_CELL_TTL: float = 600.0
+    CALENDAR_CACHE_MAX_SIZE: int = 1024
+    
+    # 结果分页：final 事件只下发第一页，其余通过 /api/session/{id}/flights 获取
+    FLIGHT_PAGE_SIZE: int = 20
+    FLIGHT_DEFAULT_SORT: str = "price"
+    FLIGHT_RESULT_SET_TTL: float = 1800.0  # 会话结果集保留时间（秒），过期后翻页返回 410
+    FLIGHT_RESULT_SET_MAX_SIZE: int = 256  # 最多保留的会话结果集数，超出时淘汰最久未访问的
+
+    # Mock 预判：可能需要 Mock 的请求在搜索的同时准备 Mock 数据，先可用的一方胜出
+    MOCK_SPECULATIVE: bool = True
+    MOCK_SPECULATIVE_UPLOAD: bool = True  # 预判时同时上传；False 时只构建，Mock 胜出后再上传
+    MOCK_SPECULATIVE_EMPTY_STREAK: int = 2  # 同一航线连续无结果次数达到该值时预判需要 Mock
+    MOCK_ROUTE_HISTORY_TTL: float = 3600.0
+
+    # 调试数据存储：原始响应/Mock 请求压缩后按 debug_id 存放，通过 /api/debug/{id} 按需获取
+    DEBUG_STORE_MAX_BYTES: int = 64 * 1024 * 1024  # 压缩后总字节上限
+    DEBUG_STORE_MAX_ENTRIES: int = 512
+    DEBUG_STORE_TTL: float = 3600.0
+
+    # 意图解析规则快速通道：句式固定的查询在本地解析，不调用 LLM
+    INTENT_FAST_PATH: bool = True
+
+    # LLM 意图解析缓存：相同输入（含当天日期）直接复用解析结果；LLM_CACHE_DB_PATH 为空时只用内存缓存
+    LLM_CACHE_ENABLED: bool = True
+    LLM_CACHE_TTL: float = 3600.0
+    LLM_CACHE_MAX_SIZE: int = 1024
+    LLM_CACHE_DB_PATH: str = ""  # 如 data/llm_cache.sqlite3，进程重启后仍可命中
+
+    # 系统提示词裁剪：城市/航司/渠道参考表只保留对话涉及的条目和少量常用城市
+    LLM_PROMPT_TRIM: bool = True
+    # 提示词缓存：Anthropic 协议下静态前缀标记 cache_control（网关不支持时关闭）
+    LLM_PROMPT_CACHE: bool = True
+
+    # LLM 流式输出：生成过程中增量解析 JSON，以 intent 事件推送已识别的字段和回复文本
+    LLM_STREAMING: bool = True
+    LLM_STREAM_EVENT_INTERVAL: float = 0.1  # 回复文本推送的最小间隔（秒），字段识别完成时立即推送
+    # 流式解析出完整航线后立即预启动搜索，最终解析结果不一致时取消
+    SEARCH_SPECULATIVE: bool = True
+
+    # 意图解析输出模式：text 从文本中提取 JSON；tool 使用工具调用（schema 由 TripInfo/ClarifyInfo 生成）
+    LLM_OUTPUT_MODE: str = "text"
+    LLM_TOOL_MAX_TOKENS: int = 1024
+    LLM_TOOL_TEMPERATURE: float = 0.0
+
     # LLM API 配置 (OpenAI 兼容)
     ANTHROPIC_API_KEY: str = ""
     ANTHROPIC_API_URL: str = "https://oneai.17usoft.com/anthropic"
@@ -0,0 +1,127 @@
+"""调试数据存储
+
+搜索原始响应、Mock 请求体是系统里最大的对象，只有打开调试弹窗时才需要。
+final 事件不再内联它们，而是压缩（zlib）后存入有界存储，只下发 debug_id 和大小，
+前端按需通过 /api/debug/{id} 获取。超出条数/字节上限时按 LRU 淘汰，条目过期后删除。
+"""
+import time
+import uuid
+import zlib
+from collections import OrderedDict
+from typing import Callable, Iterator, Optional
+
+from app.core import json_codec
+from app.core.config import settings
+from app.core.json_stream import expand_compressed
+
+# 流式解压时每次产出的块大小
+CHUNK_SIZE = 64 * 1024
+
+
+class DebugStore:
+    """压缩后的调试数据存储（内存上限 + 条数上限 + TTL）"""
+
+    def __init__(
+        self,
+        max_bytes: int = 64 * 1024 * 1024,
+        max_entries: int = 512,
+        ttl: float = 3600.0,
+        level: int = 6,
+        clock: Callable[[], float] = time.monotonic
+    ):
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.level = level
+        self._clock = clock
+        self._data: OrderedDict[str, tuple[float, bytes, int]] = OrderedDict()  # id -> (过期时间, 压缩数据, 原始大小)
+        self.total_bytes = 0
+        self.evictions = 0
+
+    def put(self, payload: dict) -> dict:
+        """压缩并保存，返回下发给前端的摘要 {debug_id, sizes}"""
+        # 每个字段只序列化一次，拼成完整 JSON，同时得到各字段大小
+        # 搜索原始响应可能以 CompressedJson 保存，序列化前还原
+        parts = {name: json_codec.dumps(expand_compressed(value)) for name, value in payload.items()}
+        sizes = {name: len(part) for name, part in parts.items() if payload[name] is not None}
+        raw = b"{" + b",".join(json_codec.dumps(name) + b":" + part for name, part in parts.items()) + b"}"
+        compressed = zlib.compress(raw, self.level)
+        summary = {
+            "debug_id": uuid.uuid4().hex,
+            "sizes": {**sizes, "raw": len(raw), "compressed": len(compressed)}
+        }
+        if len(compressed) > self.max_bytes:
+            # 单条超过总上限，不保存
+            return {**summary, "debug_id": None}
+
+        self._expire()
+        self._data[summary["debug_id"]] = (self._clock() + self.ttl, compressed, len(raw))
+        self.total_bytes += len(compressed)
+        while self.total_bytes > self.max_bytes or len(self._data) > self.max_entries:
+            self._evict_oldest()
+        return summary
+
+    def get_compressed(self, debug_id: str) -> Optional[bytes]:
+        """读取压缩数据（zlib 格式，可直接作为 Content-Encoding: deflate 下发）"""
+        entry = self._data.get(debug_id)
+        if entry is None:
+            return None
+        if entry[0] <= self._clock():
+            self._remove(debug_id)
+            return None
+        self._data.move_to_end(debug_id)
+        return entry[1]
+
+    def get(self, debug_id: str) -> Optional[dict]:
+        """读取并解压为 dict"""
+        compressed = self.get_compressed(debug_id)
+        return json_codec.loads(zlib.decompress(compressed)) if compressed is not None else None
+
+    @staticmethod
+    def iter_decompressed(compressed: bytes) -> Iterator[bytes]:
+        """分块解压，避免一次性在内存中还原完整的 JSON"""
+        decompressor = zlib.decompressobj()
+        for start in range(0, len(compressed), CHUNK_SIZE):
+            chunk = decompressor.decompress(compressed[start:start + CHUNK_SIZE])
+            if chunk:
+                yield chunk
+        tail = decompressor.flush()
+        if tail:
+            yield tail
+
+    def _remove(self, debug_id: str):
+        _, compressed, _ = self._data.pop(debug_id)
+        self.total_bytes -= len(compressed)
+
+    def _evict_oldest(self):
+        debug_id = next(iter(self._data))
+        self._remove(debug_id)
+        self.evictions += 1
+
+    def _expire(self):
+        now = self._clock()
+        for debug_id in [k for k, (expires_at, _, _) in self._data.items() if expires_at <= now]:
+            self._remove(debug_id)
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> dict:
+        raw_bytes = sum(raw for _, _, raw in self._data.values())
+        return {
+            "entries": len(self._data),
+            "max_entries": self.max_entries,
+            "bytes": self.total_bytes,
+            "max_bytes": self.max_bytes,
+            "raw_bytes": raw_bytes,
+            "compression_ratio": round(self.total_bytes / raw_bytes, 4) if raw_bytes else 0.0,
+            "evictions": self.evictions
+        }
+
+
+# 全局单例
+debug_store = DebugStore(
+    max_bytes=settings.DEBUG_STORE_MAX_BYTES,
+    max_entries=settings.DEBUG_STORE_MAX_ENTRIES,
+    ttl=settings.DEBUG_STORE_TTL
+)
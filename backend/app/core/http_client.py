@@ -0,0 +1,63 @@
+"""二方接口 HTTP 连接池
+
+每个上游服务持有一个长连接池，由 FastAPI lifespan 统一创建和关闭，
+避免每次请求都重新建立 TCP/TLS 连接。
+"""
+from typing import Optional
+
+import httpx
+
+from app.core.config import settings
+
+
+def _http2_available() -> bool:
+    """HTTP/2 依赖 h2 包，未安装时回退 HTTP/1.1"""
+    try:
+        import h2  # noqa: F401
+    except ImportError:
+        return False
+    return True
+
+
+def create_http_client(timeout: float) -> httpx.AsyncClient:
+    """按配置创建带连接池的 AsyncClient"""
+    limits = httpx.Limits(
+        max_connections=settings.HTTP_MAX_CONNECTIONS,
+        max_keepalive_connections=settings.HTTP_MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry=settings.HTTP_KEEPALIVE_EXPIRY,
+    )
+    http2 = settings.HTTP2_ENABLED and _http2_available()
+    if settings.HTTP2_ENABLED and not http2:
+        print("[HTTP] HTTP2_ENABLED=true 但未安装 h2，回退 HTTP/1.1")
+    return httpx.AsyncClient(timeout=timeout, limits=limits, http2=http2)
+
+
+class UpstreamClient:
+    """单个上游服务的共享连接池"""
+
+    def __init__(self, name: str, timeout: float):
+        self.name = name
+        self.timeout = timeout
+        self._client: Optional[httpx.AsyncClient] = None
+
+    async def start(self):
+        """创建连接池（lifespan 启动时调用）"""
+        if self._client is None:
+            self._client = create_http_client(self.timeout)
+            if settings.DEBUG:
+                print(f"[HTTP] {self.name} 连接池已创建")
+
+    async def aclose(self):
+        """关闭连接池（lifespan 结束时调用）"""
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+            if settings.DEBUG:
+                print(f"[HTTP] {self.name} 连接池已关闭")
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        """获取共享 client；脚本或测试中未经 lifespan 启动时懒加载创建"""
+        if self._client is None or self._client.is_closed:
+            self._client = create_http_client(self.timeout)
+        return self._client
@@ -0,0 +1,72 @@
+"""JSON 编解码层
+
+SSE 帧、二方接口请求/响应、Mock 请求体、LLM 输出解析统一走这里：
+- 输出紧凑格式，直接编码为 bytes
+- 默认使用 orjson（已列入依赖），输出 UTF-8，中文不转义为 \\uXXXX
+- 未安装 orjson 时回退标准库：保留 \\uXXXX 转义，输出纯 ASCII，编码为 bytes 时只是一次拷贝，
+  比 ensure_ascii=False 再做 UTF-8 编码更快，不慢于原来的 json.dumps
+- 唯一的切换点是 settings.JSON_BACKEND（auto / orjson / stdlib）
+"""
+import json
+from typing import Any, Union
+
+from app.core.config import settings
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - 取决于运行环境
+    orjson = None
+
+
+def _select_backend(name: str) -> str:
+    if name == "stdlib":
+        return "stdlib"
+    if orjson is None:
+        if name == "orjson":
+            print("[JSON] 未安装 orjson，回退到标准库 json")
+        return "stdlib"
+    return "orjson"
+
+
+BACKEND = _select_backend(settings.JSON_BACKEND)
+
+if BACKEND == "orjson":
+    # 不开启 OPT_NON_STR_KEYS（编码慢约三成），要求 dict 键均为 str
+    def dumps(obj: Any) -> bytes:
+        """编码为 UTF-8 紧凑 JSON bytes"""
+        return orjson.dumps(obj)
+
+    def loads(data: Union[bytes, bytearray, memoryview, str]) -> Any:
+        """解码 JSON（bytes 或 str）"""
+        return orjson.loads(data)
+
+    DecodeError = orjson.JSONDecodeError
+else:
+    _encoder = json.JSONEncoder(separators=(",", ":"))
+
+    def dumps(obj: Any) -> bytes:
+        """编码为紧凑 JSON bytes（纯 ASCII，也是合法的 UTF-8）"""
+        return _encoder.encode(obj).encode("ascii")
+
+    def loads(data: Union[bytes, bytearray, memoryview, str]) -> Any:
+        """解码 JSON（bytes 或 str）"""
+        if isinstance(data, memoryview):
+            data = data.tobytes()
+        return json.loads(data)
+
+    DecodeError = json.JSONDecodeError
+
+
+def dumps_str(obj: Any) -> str:
+    """编码为 str（需要把 JSON 作为字符串字段嵌入其他结构时使用）"""
+    return dumps(obj).decode("utf-8")
+
+
+if BACKEND == "orjson":
+    def sse_event(event: Any) -> bytes:
+        """编码为一个 SSE 帧: data: {...}\\n\\n"""
+        return b"data: " + orjson.dumps(event) + b"\n\n"
+else:
+    def sse_event(event: Any) -> bytes:
+        """编码为一个 SSE 帧: data: {...}\\n\\n（先拼 str 再整体编码，与原实现同样只拷贝两次）"""
+        return f"data: {_encoder.encode(event)}\n\n".encode("ascii")
@@ -0,0 +1,407 @@
+"""大 JSON 响应的增量解析
+
+二方搜索响应的 route.segments / route.tripProducts 可能有数 MB。
+JsonSplitter 按块喂入响应体，只在“骨架”层（通向目标容器的对象）逐个 token 解析，
+目标容器里的每个元素用标准库 C 实现的 raw_decode 单独解码后立即回调交出，
+不需要先把整个响应体拼成一个 bytes 再构建完整的对象树。
+原始响应体以 zlib 压缩后的 CompressedJson 保存，需要查看时再解压。
+PartialJsonParser 用于 LLM 流式输出：字段一完成就交出，生成中的字符串可以取到已生成的前缀。
+"""
+import codecs
+import json
+import re
+import zlib
+from typing import Any, Callable, Iterable, Optional
+
+from app.core import json_codec
+
+_WHITESPACE = re.compile(r"[ \t\n\r]*")
+_decoder = json.JSONDecoder()
+
+
+class CompressedJson:
+    """压缩保存的 JSON 原文"""
+
+    __slots__ = ("data", "size")
+
+    def __init__(self, data: bytes, size: int):
+        self.data = data  # zlib 压缩后的原文
+        self.size = size  # 原文字节数
+
+    @classmethod
+    def from_bytes(cls, body: bytes, level: int = 6) -> "CompressedJson":
+        return cls(zlib.compress(body, level), len(body))
+
+    def load(self) -> Any:
+        """解压并解析为 Python 对象"""
+        return json_codec.loads(zlib.decompress(self.data))
+
+    def __repr__(self) -> str:
+        return f"CompressedJson(size={self.size}, compressed={len(self.data)})"
+
+
+def expand_compressed(value: Any) -> Any:
+    """把嵌套结构中的 CompressedJson 还原为对象（序列化调试数据时使用）"""
+    if isinstance(value, CompressedJson):
+        return value.load()
+    if isinstance(value, dict):
+        return {k: expand_compressed(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [expand_compressed(v) for v in value]
+    return value
+
+
+class _Frame:
+    """解析栈中的一层容器"""
+
+    __slots__ = ("path", "is_object", "container", "target", "state", "key", "index")
+
+    def __init__(self, path: tuple, is_object: bool, container: Any, target: bool):
+        self.path = path
+        self.is_object = is_object
+        self.container = container  # 骨架层为 dict，目标容器为 None（元素直接回调，不保留）
+        self.target = target
+        self.state = "first"
+        self.key = None
+        self.index = 0
+
+
+class _NeedMoreDataError(Exception):
+    pass
+
+
+class JsonSplitter:
+    """按路径拆分的增量 JSON 解析器
+
+    Args:
+        targets: 需要逐元素交出的容器路径，如 {("data", "route", "segments"), ("route", "tripProducts")}
+        on_item: 回调 (容器路径, 键或下标, 元素值)
+    """
+
+    def __init__(self, targets: Iterable[tuple], on_item: Callable[[tuple, Any, Any], None]):
+        self.targets = set(targets)
+        self.prefixes = {target[:i] for target in self.targets for i in range(len(target))}
+        self.on_item = on_item
+        self._text_decoder = codecs.getincrementaldecoder("utf-8")()
+        self._buf = ""
+        self._pos = 0
+        self._stack: list[_Frame] = []
+        self._closed = False
+        self._done = False
+        self.result: Any = None  # 骨架（目标容器已被移除）
+
+    def feed(self, chunk: bytes):
+        """喂入一块响应体"""
+        self._buf = self._buf[self._pos:] + self._text_decoder.decode(chunk)
+        self._pos = 0
+        self._parse()
+
+    def close(self) -> Any:
+        """响应体结束，返回骨架对象；JSON 不完整时抛出 ValueError"""
+        self._buf = self._buf[self._pos:] + self._text_decoder.decode(b"", final=True)
+        self._pos = 0
+        self._closed = True
+        self._parse()
+        if not self._done:
+            raise ValueError("JSON 响应不完整")
+        if self._buf[self._pos:].strip():
+            raise ValueError("JSON 响应末尾有多余内容")
+        return self.result
+
+    # ---------- 内部 ----------
+
+    def _skip_ws(self) -> Optional[str]:
+        self._pos = _WHITESPACE.match(self._buf, self._pos).end()
+        if self._pos >= len(self._buf):
+            if self._closed:
+                raise ValueError("JSON 响应不完整")
+            raise _NeedMoreDataError
+        return self._buf[self._pos]
+
+    def _decode_value(self) -> Any:
+        """解码一个完整的值；数据不足时等待下一块（末尾的数字可能被截断，也需要等待）"""
+        try:
+            value, end = _decoder.raw_decode(self._buf, self._pos)
+        except json.JSONDecodeError:
+            if self._closed:
+                raise
+            raise _NeedMoreDataError from None
+        if end >= len(self._buf) and not self._closed:
+            raise _NeedMoreDataError
+        self._pos = end
+        return value
+
+    def _expect(self, char: str):
+        if self._skip_ws() != char:
+            raise ValueError(f"JSON 格式错误: 位置 {self._pos} 期望 {char!r}")
+        self._pos += 1
+
+    def _parse(self):
+        try:
+            while not self._done:
+                self._step()
+        except _NeedMoreDataError:
+            pass
+
+    def _open(self, path: tuple, char: str, parent: Optional[_Frame]) -> bool:
+        """在目标或骨架路径上遇到容器时入栈，返回是否入栈"""
+        target = path in self.targets
+        if target and char in "{[":
+            self._stack.append(_Frame(path, char == "{", None, True))
+        elif path in self.prefixes and char == "{":
+            container = {}
+            if parent is None:
+                self.result = container
+            else:
+                parent.container[parent.key] = container
+            self._stack.append(_Frame(path, True, container, False))
+        else:
+            return False
+        self._pos += 1
+        return True
+
+    def _assign(self, frame: _Frame, value: Any):
+        if frame.target:
+            self.on_item(frame.path, frame.key if frame.is_object else frame.index, value)
+        else:
+            frame.container[frame.key] = value
+
+    def _close_frame(self):
+        self._pos += 1
+        self._stack.pop()
+        if not self._stack:
+            self._done = True
+
+    def _step(self):
+        char = self._skip_ws()
+        if not self._stack:
+            if not self._open((), char, None):
+                self.result = self._decode_value()
+                self._done = True
+            return
+
+        frame = self._stack[-1]
+        closing = "}" if frame.is_object else "]"
+        if frame.state in ("first", "comma"):
+            if frame.state == "first" and char == closing:
+                self._close_frame()
+                return
+            if frame.is_object:
+                if char != '"':
+                    raise ValueError(f"JSON 格式错误: 位置 {self._pos} 期望键")
+                frame.key = self._decode_value()
+                frame.state = "colon"
+            else:
+                frame.state = "value"
+        elif frame.state == "colon":
+            self._expect(":")
+            frame.state = "value"
+        elif frame.state == "value":
+            # 先切换状态再入栈，子容器结束后父容器直接等待逗号
+            frame.state = "after"
+            if frame.target or not self._open(frame.path + (frame.key,), char, frame):
+                try:
+                    self._assign(frame, self._decode_value())
+                except _NeedMoreDataError:
+                    frame.state = "value"
+                    raise
+        elif frame.state == "after":
+            if char == ",":
+                self._pos += 1
+                frame.state = "comma"
+                if not frame.is_object:
+                    frame.index += 1
+            elif char == closing:
+                self._close_frame()
+            else:
+                raise ValueError(f"JSON 格式错误: 位置 {self._pos} 期望 ',' 或 {closing!r}")
+
+
+_ESCAPES = {'"': '"', "\\": "\\", "/": "/", "b": "\b", "f": "\f", "n": "\n", "r": "\r", "t": "\t"}
+_SCALAR_CHARS = frozenset("0123456789+-.eEtruefalsn")
+_WS_CHARS = frozenset(" \t\r\n")
+
+
+class PartialJsonParser:
+    """LLM 输出的逐字符增量解析器
+
+    逐段 feed 模型输出的文本，跳过根对象之前的内容（如 ```json 代码块标记），
+    每当一个值（标量、对象、数组）完整结束时返回 (路径, 值)，路径为从根开始的键/下标元组。
+    正在生成中的字符串值可以通过 partial_string() 取到已解码的前缀，用于流式展示文本。
+    遇到非法字符时停止解析（failed=True），最终结果仍由调用方对完整文本做一次容错解析。
+    """
+
+    def __init__(self):
+        self.root: Optional[dict] = None
+        self.done = False
+        self.failed = False
+        # 栈元素: [容器, 路径, 期待的下一个记号, 当前键]
+        # 对象期待 key / colon / value / comma，数组期待 value / comma
+        self._stack: list = []
+        self._string: Optional[list] = None  # 正在读取的字符串（已解码字符）
+        self._string_is_key = False
+        self._escape: Optional[str] = None  # None / "" (刚读到反斜杠) / 已读到的 \u 十六进制位
+        self._high_surrogate: Optional[int] = None  # \uD800-\uDBFF，等待后面的低位代理组成一个字符
+        self._scalar: Optional[list] = None  # 正在读取的数字/true/false/null
+        self._completed: list = []
+
+    def feed(self, text: str) -> list:
+        """输入一段文本，返回这段文本中完整结束的 [(路径, 值), ...]"""
+        self._completed = []
+        for char in text:
+            if self.done or self.failed:
+                break
+            self._consume(char)
+        return self._completed
+
+    def partial_string(self) -> Optional[tuple]:
+        """正在读取的字符串值：(路径, 已解码前缀)；当前不在字符串值中时返回 None"""
+        if self._string is None or self._string_is_key:
+            return None
+        return self._value_path(), "".join(self._string)
+
+    def _consume(self, char: str):
+        if self._string is not None:
+            self._consume_string(char)
+            return
+        if self._scalar is not None:
+            if char in _SCALAR_CHARS:
+                self._scalar.append(char)
+                return
+            text = "".join(self._scalar)
+            self._scalar = None
+            try:
+                value = json_codec.loads(text)
+            except json_codec.DecodeError:
+                self.failed = True
+                return
+            self._complete(value)
+            # 结束符（逗号、括号、空白）继续按结构字符处理
+
+        if not self._stack:
+            if char == "{":
+                self.root = {}
+                self._stack.append([self.root, (), "key", None])
+            return  # 根对象之前的内容直接跳过
+        if char in _WS_CHARS:
+            return
+
+        frame = self._stack[-1]
+        container, _, expect, _ = frame
+        is_object = isinstance(container, dict)
+
+        if expect == "key":
+            if char == '"':
+                self._start_string(is_key=True)
+            elif char == "}":
+                self._close()
+            else:
+                self.failed = True
+        elif expect == "colon":
+            if char == ":":
+                frame[2] = "value"
+            else:
+                self.failed = True
+        elif expect == "comma":
+            if char == ",":
+                frame[2] = "key" if is_object else "value"
+            elif char == ("}" if is_object else "]"):
+                self._close()
+            else:
+                self.failed = True
+        elif char == "]" and not is_object:
+            self._close()
+        elif char == '"':
+            self._start_string(is_key=False)
+        elif char in "{[":
+            value = {} if char == "{" else []
+            path = self._value_path()
+            self._attach(value)
+            self._stack.append([value, path, "key" if char == "{" else "value", None])
+        elif char in _SCALAR_CHARS:
+            self._scalar = [char]
+        else:
+            self.failed = True
+
+    def _consume_string(self, char: str):
+        if self._escape is not None:
+            if self._escape == "" and char != "u":
+                self._flush_surrogate()
+                self._string.append(_ESCAPES.get(char, char))
+                self._escape = None
+            elif self._escape == "":
+                self._escape = "u"
+            else:
+                self._escape += char
+                if len(self._escape) == 5:
+                    try:
+                        self._append_code_point(int(self._escape[1:], 16))
+                    except ValueError:
+                        self.failed = True
+                    self._escape = None
+            return
+        if char == "\\":
+            self._escape = ""
+            return
+        self._flush_surrogate()
+        if char == '"':
+            text = "".join(self._string)
+            self._string = None
+            if self._string_is_key:
+                frame = self._stack[-1]
+                frame[3] = text
+                frame[2] = "colon"
+            else:
+                self._complete(text)
+        else:
+            self._string.append(char)
+
+    def _append_code_point(self, code: int):
+        """写入 \\uXXXX 解码出的字符；转义的代理对（如 \\ud83d\\ude00）合并为一个字符"""
+        if 0xDC00 <= code <= 0xDFFF and self._high_surrogate is not None:
+            code = 0x10000 + ((self._high_surrogate - 0xD800) << 10) + (code - 0xDC00)
+            self._high_surrogate = None
+        else:
+            self._flush_surrogate()
+            if 0xD800 <= code <= 0xDBFF:
+                self._high_surrogate = code
+                return
+        self._string.append(chr(code))
+
+    def _flush_surrogate(self):
+        """高位代理后面不是低位代理：与 json.loads 一致，原样保留单独的代理"""
+        if self._high_surrogate is not None:
+            self._string.append(chr(self._high_surrogate))
+            self._high_surrogate = None
+
+    def _start_string(self, is_key: bool):
+        self._string = []
+        self._string_is_key = is_key
+
+    def _value_path(self) -> tuple:
+        """当前待写入值的路径"""
+        container, path, _, key = self._stack[-1]
+        return path + ((key,) if isinstance(container, dict) else (len(container),))
+
+    def _attach(self, value: Any):
+        container, _, _, key = self._stack[-1]
+        if isinstance(container, dict):
+            container[key] = value
+        else:
+            container.append(value)
+
+    def _complete(self, value: Any):
+        """标量值结束：写入父容器并记录"""
+        path = self._value_path()
+        self._attach(value)
+        self._stack[-1][2] = "comma"
+        self._completed.append((path, value))
+
+    def _close(self):
+        """容器结束：出栈，父容器转为期待逗号"""
+        container, path, _, _ = self._stack.pop()
+        self._completed.append((path, container))
+        if self._stack:
+            self._stack[-1][2] = "comma"
+        else:
+            self.done = True
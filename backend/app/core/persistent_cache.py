@@ -0,0 +1,56 @@
+"""SQLite 持久化缓存 - 进程重启后仍可命中
+
+作为内存 TTLCache 的第二层：值以 JSON 存储，过期时间使用墙上时间（重启后依然有效）。
+sqlite3 是同步接口，调用方在线程中执行（asyncio.to_thread），内部用锁串行化访问。
+"""
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Callable, Optional
+
+from app.core import json_codec
+
+
+class SQLiteCache:
+    """键值 + 过期时间的 SQLite 缓存"""
+
+    def __init__(self, path: str, ttl: float = 3600.0, clock: Callable[[], float] = time.time):
+        self.path = path
+        self.ttl = ttl
+        self._clock = clock
+        self._lock = threading.Lock()
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value BLOB NOT NULL, expires_at REAL NOT NULL)"
+            )
+            self._conn.execute("DELETE FROM cache WHERE expires_at <= ?", (self._clock(),))
+            self._conn.commit()
+
+    def get(self, key: str) -> Optional[Any]:
+        """读取未过期的值，不存在或已过期返回 None"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value FROM cache WHERE key = ? AND expires_at > ?", (key, self._clock())
+            ).fetchone()
+        return json_codec.loads(row[0]) if row else None
+
+    def set(self, key: str, value: Any, ttl: float = None):
+        expires_at = self._clock() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO cache (key, value, expires_at) VALUES (?, ?, ?)",
+                (key, json_codec.dumps(value), expires_at)
+            )
+            self._conn.commit()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM cache WHERE expires_at > ?", (self._clock(),)).fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
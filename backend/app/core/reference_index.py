@@ -0,0 +1,91 @@
+"""城市/机场/航司/渠道参考数据索引
+
+启动时加载一次 city_mapping.json 与 flatType.json，构建只读的 O(1) 查找表，
+供搜索、Mock、LLM 等服务共享。
+"""
+import json
+import os
+from types import MappingProxyType
+from typing import Mapping, Optional
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "data")
+
+
+def _load_json(filename: str, default):
+    path = os.path.join(DATA_DIR, filename)
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except Exception as e:
+        print(f"Error loading {filename}: {e}")
+        return default
+
+
+class ReferenceIndex:
+    """不可变的参考数据索引"""
+
+    def __init__(self, city_mapping: dict, flat_types: list):
+        self.cities: tuple = tuple(city_mapping.get("cities", []))
+        self.airlines: tuple = tuple(city_mapping.get("airlines", []))
+        self.flat_types: tuple = tuple(flat_types)
+
+        airport_to_city: dict[str, str] = {}
+        city_airports: dict[str, tuple] = {}
+        city_names: dict[str, str] = {}
+        airport_names: dict[str, str] = {}
+        city_by_name: dict[str, str] = {}
+
+        for city in self.cities:
+            city_code = city.get("city_code")
+            airports = city.get("airports", [])
+            # 与原先的顺序扫描保持一致：先出现的城市优先，城市主代码优先于同名机场码
+            airport_to_city.setdefault(city_code, city_code)
+            for airport in airports:
+                airport_to_city.setdefault(airport.get("code"), city_code)
+                airport_names.setdefault(airport.get("code"), airport.get("name", ""))
+            city_airports.setdefault(city_code, tuple(a.get("code") for a in airports))
+            city_names.setdefault(city_code, city.get("city_name", ""))
+            city_by_name.setdefault(city.get("city_name", ""), city_code)
+
+        self.airport_to_city: Mapping[str, str] = MappingProxyType(airport_to_city)
+        self.city_airports: Mapping[str, tuple] = MappingProxyType(city_airports)
+        self.city_names: Mapping[str, str] = MappingProxyType(city_names)
+        self.airport_names: Mapping[str, str] = MappingProxyType(airport_names)
+        self.city_by_name: Mapping[str, str] = MappingProxyType(city_by_name)
+        self.airline_names: Mapping[str, str] = MappingProxyType(
+            {a.get("code"): a.get("name", "") for a in self.airlines}
+        )
+        self.flat_type_names: Mapping[str, str] = MappingProxyType(
+            {item.get("value"): item.get("text", "") for category in self.flat_types for item in category.get("values", [])}
+        )
+
+    @classmethod
+    def load(cls) -> "ReferenceIndex":
+        """从 data 目录加载"""
+        return cls(_load_json("city_mapping.json", {"cities": [], "airlines": []}), _load_json("flatType.json", []))
+
+    def city_code_of(self, code: str) -> str:
+        """机场码 -> 城市码；本身是城市码或未知代码时原样返回"""
+        if not code:
+            return code
+        return self.airport_to_city.get(code, code)
+
+    def airports_of(self, city_code: str) -> tuple:
+        """城市码 -> 该城市的机场码列表；未知城市返回空元组"""
+        return self.city_airports.get(city_code, ())
+
+    def is_specific_airport(self, code: str) -> bool:
+        """是否为具体机场（与所属城市码不同），用于决定是否按机场过滤结果"""
+        return bool(code) and self.city_code_of(code) != code
+
+    def name_of(self, code: str) -> Optional[str]:
+        """代码 -> 名称：城市码返回城市名，机场码返回机场名"""
+        return self.city_names.get(code) or self.airport_names.get(code)
+
+    def airline_name(self, code: str) -> Optional[str]:
+        """航司二字码 -> 航司名称"""
+        return self.airline_names.get(code)
+
+
+# 全局单例
+reference_index = ReferenceIndex.load()
@@ -17,6 +17,15 @@ class AirportInfo(BaseModel):
     name: Optional[str] = Field(default=None, description="机场名称")
 
 
+class TripLeg(BaseModel):
+    """缺口程中的一程"""
+    departure_code: str = Field(description="出发机场/城市三字码")
+    arrival_code: str = Field(description="到达机场/城市三字码")
+    dep_date: str = Field(description="出发日期 yyyy-MM-dd")
+    departure_city: Optional[str] = Field(default=None, description="出发城市名称")
+    arrival_city: Optional[str] = Field(default=None, description="到达城市名称")
+
+
 class TripInfo(BaseModel):
     """行程信息"""
     travel_type: Literal["OW", "RT", "OJ"] = Field(description="行程类型: OW单程/RT往返/OJ缺口程")
@@ -31,6 +40,7 @@ class TripInfo(BaseModel):
     flight_no: Optional[str] = Field(default=None, description="航班号，支持用/分割表示中转航班")
     transfer_cities: Optional[list[str]] = Field(default=None, description="中转城市三字码列表")
     channel: Optional[str] = Field(default=None, description="指定查询渠道(flatType)")
+    legs: Optional[list[TripLeg]] = Field(default=None, description="缺口程(OJ)各程，按顺序")
 
 
 class ClarifyOption(BaseModel):
@@ -79,8 +89,21 @@ class ChatRequest(BaseModel):
     selected_option: Optional[str] = Field(default=None, description="用户选择的澄清选项值")
 
 
+class CalendarRequest(BaseModel):
+    """低价日历请求"""
+    session_id: Optional[str] = Field(default=None, description="会话ID，未传 trip_info 时使用会话当前行程")
+    trip_info: Optional[dict] = Field(default=None, description="行程信息（与对话中的 trip_info 结构相同）")
+    days: int = Field(default=3, ge=0, description="以出发日期为中心的前后天数")
+
+
 class DebugInfo(BaseModel):
-    """调试信息"""
+    """调试信息摘要（原始数据通过 /api/debug/{debug_id} 获取）"""
+    debug_id: Optional[str] = Field(default=None, description="调试数据ID，超出存储上限未保存时为空")
+    sizes: dict = Field(default_factory=dict, description="各字段原始字节数及压缩后大小 {mock_request, search_response, raw, compressed}")
+
+
+class DebugPayload(BaseModel):
+    """调试数据（/api/debug/{debug_id} 返回）"""
     mock_request: Optional[dict] = Field(default=None, description="Mock 请求数据")
     search_response: Optional[dict] = Field(default=None, description="搜索接口原始返回")
 
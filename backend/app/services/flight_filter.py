@@ -0,0 +1,194 @@
+"""航班过滤/排序引擎
+
+dict 航班列表上把请求的过滤条件编译成一个组合谓词，一次遍历完成全部过滤；
+FlightTable 上每个条件对整列做一次遍历生成 0/1 行掩码，掩码按位与求交后再取行号。
+排序支持价格、时长、出发时间、中转次数，只取前 K 条时用堆代替整体排序。
+"""
+import heapq
+from bisect import bisect_right
+from itertools import compress
+from typing import Callable, Iterable, NamedTuple, Optional
+
+from app.services.flight_table import FlightTable, time_key, to_int
+
+SORT_KEYS = ("price", "duration", "departure", "stops")
+
+
+class FlightKeys(NamedTuple):
+    """每个航班预先计算一次的规范化字段"""
+    is_transfer: bool
+    dep_airport: str
+    arr_airport: str
+    airlines: frozenset
+    flight_nos: tuple  # 各航段大写航班号
+    price: int
+    duration: int
+    departure: int
+    stops: int
+
+
+def flight_keys(flight: dict) -> FlightKeys:
+    """从前端航班 dict 提取过滤/排序字段"""
+    segments = flight.get("segments") or []
+    return FlightKeys(
+        is_transfer=bool(flight.get("is_transfer")),
+        dep_airport=segments[0].get("departure", {}).get("code", "") if segments else "",
+        arr_airport=segments[-1].get("arrival", {}).get("code", "") if segments else "",
+        airlines=frozenset(seg.get("airline", {}).get("code", "") for seg in segments),
+        flight_nos=tuple(seg.get("flight_no", "").upper() for seg in segments),
+        price=to_int(flight.get("price", {}).get("total")),
+        duration=sum(to_int(seg.get("duration")) for seg in segments),
+        departure=time_key(segments[0].get("departure", {}).get("time", "")) if segments else 0,
+        stops=len(segments) - 1 if segments else 0,
+    )
+
+
+_INVERT = bytes.maketrans(b"\x00\x01", b"\x01\x00")
+
+
+def _airline_mask(table: FlightTable, airline_id: int) -> bytearray:
+    """扫描一遍航司 id 列，命中位置按行区间映射回行号"""
+    mask = bytearray(len(table))
+    offsets = table.airline_offsets
+    for position in compress(range(len(table.airline_ids)), map(airline_id.__eq__, table.airline_ids)):
+        mask[bisect_right(offsets, position) - 1] = 1
+    return mask
+
+
+def _intersect(masks: list, size: int) -> bytes:
+    """0/1 字节掩码求交：转成大整数后按位与，每行一个字节互不进位"""
+    if len(masks) == 1:
+        return masks[0]
+    combined = int.from_bytes(masks[0], "little")
+    for mask in masks[1:]:
+        combined &= int.from_bytes(mask, "little")
+    return combined.to_bytes(size, "little")
+
+
+def _all_of(checks: list[Callable]) -> Callable:
+    """把多个谓词合并为一个"""
+    if not checks:
+        return lambda _: True
+    if len(checks) == 1:
+        return checks[0]
+    return lambda item: all(check(item) for check in checks)
+
+
+class FilterPlan:
+    """编译后的过滤/排序计划"""
+
+    def __init__(
+        self,
+        airline_code: str = None,
+        flight_no: str = None,
+        direct_only: bool = False,
+        dep_airport_code: str = None,
+        arr_airport_code: str = None,
+        sort: str = None,
+        descending: bool = False,
+        limit: int = None,
+        offset: int = 0
+    ):
+        if sort and sort not in SORT_KEYS:
+            raise ValueError(f"不支持的排序字段: {sort}，可选 {', '.join(SORT_KEYS)}")
+        self.airline_code = airline_code
+        self.flight_no = flight_no.upper() if flight_no else None
+        self.direct_only = direct_only
+        self.dep_airport_code = dep_airport_code
+        self.arr_airport_code = arr_airport_code
+        self.sort = sort
+        self.descending = descending
+        self.limit = limit
+        self.offset = max(0, offset or 0)
+
+    def _order(self, items: list, key: Optional[Callable]) -> list:
+        """排序并分页；只需要前 offset+limit 条时用堆"""
+        if key is not None:
+            if self.limit is not None and self.offset + self.limit < len(items):
+                pick = heapq.nlargest if self.descending else heapq.nsmallest
+                items = pick(self.offset + self.limit, items, key=key)
+            else:
+                items = sorted(items, key=key, reverse=self.descending)
+        end = None if self.limit is None else self.offset + self.limit
+        return items[self.offset:end]
+
+    def apply(self, flights: Iterable[dict]) -> list[dict]:
+        """作用于航班 dict 列表：每个航班只提取一次规范化字段，一次遍历过滤"""
+        checks = []
+        if self.direct_only:
+            checks.append(lambda k: not k.is_transfer)
+        if self.dep_airport_code:
+            checks.append(lambda k: k.dep_airport == self.dep_airport_code)
+        if self.arr_airport_code:
+            checks.append(lambda k: k.arr_airport == self.arr_airport_code)
+        if self.airline_code:
+            checks.append(lambda k: self.airline_code in k.airlines)
+        if self.flight_no:
+            checks.append(lambda k: any(self.flight_no in no for no in k.flight_nos))
+        matches = _all_of(checks)
+
+        if not checks and not self.sort:
+            return self._order(list(flights), None)
+        keyed = [(keys, flight) for flight in flights if matches(keys := flight_keys(flight))]
+        sort_key = (lambda pair: getattr(pair[0], self.sort)) if self.sort else None
+        return [flight for _, flight in self._order(keyed, sort_key)]
+
+    def apply_table(self, table: FlightTable, rows: Iterable[int] = None) -> list[int]:
+        """作用于 FlightTable：每个条件对整列做一次遍历生成行掩码，掩码按位与求交，返回行号
+
+        Args:
+            table: 航班表
+            rows: 候选行号（保持给定顺序），默认全表
+        """
+        masks = []
+        if self.direct_only:
+            masks.append(table.transfer.tobytes().translate(_INVERT))
+        for code, column in ((self.dep_airport_code, table.dep_airport), (self.arr_airport_code, table.arr_airport)):
+            if code:
+                symbol_id = table.symbol_id(code)
+                if symbol_id is None:
+                    return []
+                masks.append(bytes(map(symbol_id.__eq__, column)))
+        if self.airline_code:
+            airline_id = table.symbol_id(self.airline_code)
+            if airline_id is None:
+                return []
+            masks.append(_airline_mask(table, airline_id))
+        if self.flight_no:
+            flight_no = self.flight_no
+            masks.append(bytes(any(flight_no in no for no in nos) for nos in table.flight_nos))
+
+        if not masks:
+            rows = list(range(len(table)) if rows is None else rows)
+        else:
+            mask = _intersect(masks, len(table))
+            if rows is None:
+                rows = list(compress(range(len(table)), mask))
+            else:
+                rows = [row for row in rows if mask[row]]
+        sort_key = getattr(table, self.sort).__getitem__ if self.sort else None
+        return self._order(rows, sort_key)
+
+
+class FlightResultSet:
+    """过滤后的结果集：保存在会话中，分页和重新排序时不需要重新搜索"""
+
+    def __init__(self, table: FlightTable, rows: list[int] = None):
+        self.table = table
+        self.rows = list(range(len(table))) if rows is None else rows
+
+    @classmethod
+    def build(cls, flights, **criteria) -> "FlightResultSet":
+        """由搜索结果（FlightTable 或 dict 列表）按过滤条件构建，只记录命中的行号"""
+        plan = FilterPlan(**criteria)
+        if isinstance(flights, FlightTable):
+            return cls(flights, plan.apply_table(flights))
+        return cls(FlightTable.from_flights(plan.apply(flights)))
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    def page(self, offset: int = 0, limit: int = 20, sort: str = None, descending: bool = False) -> list[dict]:
+        """取一页航班，只物化这一页的行"""
+        plan = FilterPlan(sort=sort, descending=descending, limit=limit, offset=offset)
+        return self.table.materialize(plan.apply_table(self.table, self.rows))
@@ -1,9 +1,11 @@
 """航班 Mock 服务 - 调用二方 Mock 接口"""
-import httpx
 import random
 from datetime import datetime, timedelta
 from typing import Optional
+from app.core import json_codec
+from app.core.admission import AdmissionRejectedError, admission
 from app.core.config import settings
+from app.core.http_client import UpstreamClient
 
 
 class FlightMockService:
@@ -11,6 +13,7 @@ class FlightMockService:
     
     def __init__(self):
         self.api_url = settings.MOCK_API_URL
+        self.http = UpstreamClient("mock", timeout=settings.MOCK_TIMEOUT)
 
     def _build_price_detail(self, price: int, tax: int, passengers: list) -> dict:
             """构建多乘客价格明细"""
@@ -94,7 +97,8 @@ class FlightMockService:
         passengers: list = None,
         cabin_class: str = "Y",
         cabin_name: str = "经济舱",
-        flat_type: str = "TC"
+        flat_type: str = "TC",
+        legs: list = None
     ) -> dict:
         """构建 Mock 接口请求
         
@@ -102,7 +106,7 @@ class FlightMockService:
             dep_city: 出发城市三字码
             arr_city: 到达城市三字码
             dep_date: 出发日期 yyyy-MM-dd
-            travel_type: 行程类型 OW/RT
+            travel_type: 行程类型 OW/RT/OJ
             return_date: 返程日期（往返时）
             flight_no: 指定航班号
             airline_code: 指定航司
@@ -111,6 +115,7 @@ class FlightMockService:
             passengers: 乘客列表
             cabin_class: 舱位等级 (Y, S, C, F)
             cabin_name: 舱位名称
+            legs: 缺口程各程 [{departure_code, arrival_code, dep_date}]（OJ 时必填）
             
         Returns:
             Mock 请求体
@@ -144,6 +149,11 @@ class FlightMockService:
         
         trace_id = f"MOCK{datetime.now().strftime('%Y%m%d%H%M%S%f')[:17]}"
         
+        if travel_type == "OJ":
+            return self._build_oj_mock_request(
+                legs, flight_no, airline, dep_time, adjusted_price, trace_id,
+                passengers, cabin_class, cabin_name, cabin_num, flat_type
+            )
         if travel_type == "OW":
             if transfer_cities:
                 return self._build_transfer_ow_mock_request(
@@ -552,6 +562,138 @@ class FlightMockService:
             "checkFlightNoGroup": ""
         }
     
+    def _build_oj_mock_request(
+        self,
+        legs: list,
+        flight_no: str,
+        airline: str,
+        dep_time: str,
+        price: int,
+        trace_id: str,
+        passengers: list = None,
+        cabin_class: str = "Y",
+        cabin_name: str = "经济舱",
+        cabin_num: str = "Y",
+        flat_type: str = "TC"
+    ) -> dict:
+        """构建缺口程 Mock 请求：每一程一个航段，合成一个多程产品"""
+        passengers = passengers or [{"type": "ADT", "count": 1}]
+        total_p_count = sum(p.get("count", 0) for p in passengers)
+
+        # 各程航班号：指定了与程数相同的 "/" 分隔航班号时逐程使用，否则在首程航班号基础上递增
+        given = [fn.strip() for fn in flight_no.split("/")] if "/" in flight_no else []
+        if len(given) == len(legs):
+            flight_nos = given
+        else:
+            try:
+                first_num = int(flight_no[2:])
+                flight_nos = [f"{airline}{first_num + i:04d}" for i in range(len(legs))]
+            except ValueError:
+                flight_nos = [f"{airline}{random.randint(1000, 9999)}" for _ in legs]
+
+        segments = {}
+        flight_keys = []
+        req_user_lines = []
+        for index, (leg, leg_flight_no) in enumerate(zip(legs, flight_nos, strict=True), start=1):
+            dep_code, arr_code, leg_date = leg["departure_code"], leg["arrival_code"], leg["dep_date"]
+            segment_key = str(hash(f"{leg_flight_no}_{leg_date}_{dep_time}") % (10**10))
+            try:
+                dep_dt = datetime.strptime(f"{leg_date} {dep_time}", "%Y-%m-%d %H:%M")
+            except ValueError:
+                dep_dt = datetime.now() + timedelta(days=index - 1)
+            arr_dt = dep_dt + timedelta(minutes=210)
+            segments[segment_key] = {
+                "aircraft": "A320",
+                "arrAirportCode": arr_code,
+                "arrAirportTerm": "T2",
+                "arrCityCode": arr_code,
+                "arrDateTime": arr_dt.strftime("%Y%m%d%H%M"),
+                "arrTime": int(arr_dt.timestamp() * 1000),
+                "depAirportCode": dep_code,
+                "depAirportTerm": "T2",
+                "depCityCode": dep_code,
+                "depDateTime": dep_dt.strftime("%Y%m%d%H%M"),
+                "depTime": int(dep_dt.timestamp() * 1000),
+                "duration": 210,
+                "flightShare": False,
+                "key": segment_key,
+                "marketingAirCode": airline,
+                "marketingAirline": airline,
+                "marketingFlightNo": leg_flight_no,
+                "mileage": 0,
+                "operatingAirline": airline,
+                "operatingFlightNo": leg_flight_no,
+                "stopTime": 0,
+                "stops": []
+            }
+            flight_keys.append({"flightKey": segment_key, "index": index, "mainSegment": True,
+                                "airLineIndex": index, "mainAirline": airline})
+            req_user_lines.append({"index": index, "depCityCode": dep_code, "arrCityCode": arr_code,
+                                   "depDate": f"{leg_date} 00:00:00.000"})
+
+        # 价格详情：is_rt 按两程把基础票价翻倍，这里折算为按实际程数计价
+        price_detail_key = str(hash(f"{'_'.join(flight_nos)}_{price}") % (10**10))
+        total_price, price_detail = self._build_price_detail(
+            base_price=price * len(legs) // 2,
+            cabin_class=cabin_class,
+            cabin_name=cabin_name,
+            cabin_num=cabin_num,
+            passengers=passengers,
+            segment_keys=list(segments),
+            airline=airline,
+            is_rt=True
+        )
+        price_detail["id"] = price_detail_key
+
+        filter2 = "-".join(
+            f"{leg['departure_code']}-{leg['arrival_code']}-{leg['dep_date'].replace('-', '')}" for leg in legs
+        )
+        flight_no_group = "|".join(
+            f"{no}_{leg['dep_date'].replace('-', '')}" for no, leg in zip(flight_nos, legs, strict=True)
+        )
+
+        return {
+            "filter2": filter2,
+            "flatType": flat_type,
+            "resourceId": "EBOOKING-PRICING",
+            "resourceType": "TCPL",
+            "traceId": trace_id,
+            "searchScene": "NORMAL",
+            "searchParamRequest": {
+                "limitReq": {"maxAge": 0, "minAge": 0, "nations": []},
+                "userCommonReq": {
+                    "travelType": "OJ",
+                    "bookingClass": ["Y", "S", "C", "F"],
+                    "passengerCount": total_p_count,
+                    "reqPassengers": [
+                        {"passengerType": p["type"], "passengerCount": p["count"]} for p in passengers
+                    ],
+                    "reqUserLines": req_user_lines
+                }
+            },
+            "segments": segments,
+            "tripProduct": {
+                "traceId": trace_id,
+                "createTime": int(datetime.now().timestamp() * 1000),
+                "tripProducts": [{
+                    "flightKeys": flight_keys,
+                    "flightNoGroup": flight_no_group,
+                    "minPrice": total_price,
+                    "nearTakeoff": False,
+                    "priceDetails": {price_detail_key: price_detail},
+                    "ext": {"PGS_FLOW_SWITCH": "1"}
+                }]
+            },
+            "ext": {
+                "searchType": "NORMAL",
+                "FILTER2": filter2,
+                "flatType": flat_type
+            },
+            "boardFlightNoGroup": "",
+            "boardProductCode": "",
+            "checkFlightNoGroup": ""
+        }
+
     def _build_transfer_ow_mock_request(
         self,
         dep_city: str,
@@ -959,9 +1101,8 @@ class FlightMockService:
             "serviceName": "callBack"
         }
         """
-        import json
         return {
-            "requestBody": json.dumps(mock_data, ensure_ascii=False),
+            "requestBody": json_codec.dumps_str(mock_data),
             "wikiUrl": "/callBack/entity",
             "version": "1.0.0",
             "serviceName": "callBack"
@@ -980,7 +1121,9 @@ class FlightMockService:
         passengers: list = None,
         cabin_class: str = "Y",
         cabin_name: str = "经济舱",
-        flat_type: str = "TC"
+        flat_type: str = "TC",
+        upload: bool = True,
+        legs: list = None
     ) -> dict:
         """调用 Mock 接口创建航班数据
         
@@ -988,17 +1131,42 @@ class FlightMockService:
             dep_city: 出发城市三字码
             arr_city: 到达城市三字码
             dep_date: 出发日期 yyyy-MM-dd
-            travel_type: 行程类型 OW/RT
+            travel_type: 行程类型 OW/RT/OJ
             return_date: 返程日期（往返时）
-            flight_no: 航班号，支持用 "/" 分割表示中转航班（如 "MU5001/MU5002"）
+            flight_no: 航班号，支持用 "/" 分割表示中转航班（如 "MU5001/MU5002"）；缺口程时为各程航班号
             airline_code: 航司代码
             transfer_cities: 中转城市三字码列表
+            upload: 是否上传到 Mock 接口；False 时只构建数据（预判 Mock 时使用，之后可用 upload_mock 上传）
+            legs: 缺口程各程 [{departure_code, arrival_code, dep_date}]，每一程生成一个航段
         
         Returns:
-            {success: bool, error: str}
+            {success: bool, error: str, mock_request: dict, uploaded: 是否已调用 Mock 接口}
         """
         trace_id = f"MOCK{datetime.now().strftime('%Y%m%d%H%M%S%f')[:17]}"
         
+        if travel_type == "OJ":
+            # 缺口程按 legs 逐程生成航段，不走往返/中转的构建逻辑
+            if not legs or len(legs) < 2 or not all(
+                leg.get("departure_code") and leg.get("arrival_code") and leg.get("dep_date") for leg in legs
+            ):
+                return {"success": False, "error": "缺口程缺少完整的各程信息，无法 Mock", "mock_request": {}, "uploaded": False}
+            mock_data = self.build_mock_request(
+                dep_city=legs[0]["departure_code"],
+                arr_city=legs[-1]["arrival_code"],
+                dep_date=legs[0]["dep_date"],
+                travel_type="OJ",
+                flight_no=flight_no,
+                airline_code=airline_code,
+                passengers=passengers,
+                cabin_class=cabin_class,
+                cabin_name=cabin_name,
+                flat_type=flat_type,
+                legs=legs
+            )
+            if not upload:
+                return {"success": True, "error": None, "mock_request": mock_data, "uploaded": False}
+            return await self.upload_mock(mock_data)
+
         # 检查是否为中转航班（航班号包含 / 或是指定了中转城市）
         is_transfer = (flight_no and "/" in flight_no) or (transfer_cities and len(transfer_cities) > 0)
         
@@ -1071,32 +1239,43 @@ class FlightMockService:
                 flat_type=flat_type
             )
         
+        if not upload:
+            return {"success": True, "error": None, "mock_request": mock_data, "uploaded": False}
+        return await self.upload_mock(mock_data)
+
+    async def upload_mock(self, mock_data: dict) -> dict:
+        """上传已构建的 Mock 数据（返回值同 mock_flight）
+
+        准入队列已满时不上传，返回 uploaded=False、code=OVERLOADED，由调用方提示繁忙。
+        """
         # 包装成接口需要的格式
         request_body = self._wrap_request(mock_data)
         
         try:
-            async with httpx.AsyncClient(timeout=30.0) as client:
-                response = await client.post(
+            async with admission.slot("mock"):
+                response = await self.http.client.post(
                     self.api_url, 
-                    json=request_body,
+                    content=json_codec.dumps(request_body),
                     headers={"Content-Type": "application/json"}
                 )
-                
-                if response.status_code == 200:
-                    resp_data = response.json()
-                    # 检查响应：result=true 且 obj.success=true 表示成功
-                    if resp_data.get("result") and resp_data.get("obj", {}).get("success"):
-                        return {"success": True, "error": None, "mock_request": mock_data}
-                    elif resp_data.get("result"):
-                        # 接口调用成功但 Mock 失败
-                        return {"success": True, "error": None, "mock_request": mock_data}  # 仍视为成功，因为数据已发送
-                    else:
-                        return {"success": False, "error": resp_data.get("message", "Mock 失败"), "mock_request": mock_data}
+            
+            if response.status_code == 200:
+                resp_data = json_codec.loads(response.content)
+                # 检查响应：result=true 且 obj.success=true 表示成功
+                if resp_data.get("result") and resp_data.get("obj", {}).get("success"):
+                    return {"success": True, "error": None, "mock_request": mock_data, "uploaded": True}
+                elif resp_data.get("result"):
+                    # 接口调用成功但 Mock 失败
+                    return {"success": True, "error": None, "mock_request": mock_data, "uploaded": True}  # 仍视为成功，因为数据已发送
                 else:
-                    return {"success": False, "error": f"HTTP {response.status_code}", "mock_request": mock_data}
-                    
+                    return {"success": False, "error": resp_data.get("message", "Mock 失败"), "mock_request": mock_data, "uploaded": True}
+            else:
+                return {"success": False, "error": f"HTTP {response.status_code}", "mock_request": mock_data, "uploaded": True}
+                
+        except AdmissionRejectedError as e:
+            return {"success": False, "error": str(e), "code": "OVERLOADED", "mock_request": mock_data, "uploaded": False}
         except Exception as e:
-            return {"success": False, "error": str(e), "mock_request": mock_data}
+            return {"success": False, "error": str(e), "mock_request": mock_data, "uploaded": True}
 
 
 # 全局单例
@@ -1,10 +1,130 @@
 import json
-import os
+import time
+import zlib
 import asyncio
 import httpx
+from contextlib import aclosing
 from datetime import datetime
-from typing import Optional, List
+from typing import Callable, Optional
+from app.core import json_codec
+from app.core.admission import AdmissionRejectedError, admission
+from app.core.cache import SingleFlight, TTLCache
+from app.core.circuit_breaker import CircuitBreaker, Permit
 from app.core.config import settings
+from app.core.http_client import UpstreamClient
+from app.core.json_stream import CompressedJson, JsonSplitter
+from app.core.reference_index import reference_index
+from app.services.flight_filter import FilterPlan
+from app.services.itinerary import join_legs
+from app.services.flight_table import FlightTable, flight_signature, time_key, to_int
+from app.services.search_polling import HedgePolicy, PollingStats, SearchPoller
+
+
+# 流式解析时逐元素交出的容器（响应可能包在 data 里，也可能不包）
+ROUTE_TARGETS = (
+    ("data", "route", "segments"),
+    ("data", "route", "tripProducts"),
+    ("route", "segments"),
+    ("route", "tripProducts"),
+)
+
+_STATION_FIELDS = ("stationCode", "cityName", "stationName", "terminal")
+_PRICE_FIELDS = ("totalPrice", "price", "tax", "foreignTotalPrice")
+
+
+def slim_segment(segment: dict) -> dict:
+    """只保留转换航班需要的航段字段"""
+    slim = {k: segment[k] for k in ("lineNo", "mktCode", "mktName", "depDate", "arrDate", "travelTime") if k in segment}
+    for station in ("depStation", "arrStation"):
+        if isinstance(segment.get(station), dict):
+            slim[station] = {k: segment[station][k] for k in _STATION_FIELDS if k in segment[station]}
+    if segment.get("equip"):
+        slim["equip"] = {"craftName": segment["equip"].get("craftName", "")}
+    return slim
+
+
+def slim_trip_product(trip_product: dict) -> dict:
+    """只保留转换航班需要的 tripProduct 字段"""
+    trip = trip_product.get("trip") or {}
+    price_quote = trip_product.get("priceQuote") or {}
+    total_price = price_quote.get("totalPrice") or {}
+    slim_trip = {k: trip[k] for k in ("id", "type", "hasTransferItem") if k in trip}
+    slim_trip["items"] = [
+        {"flightKeys": [
+            {k: fk[k] for k in ("flightKey", "sequence", "index") if k in fk}
+            for fk in item.get("flightKeys", [])
+        ]}
+        for item in trip.get("items", [])
+    ]
+    slim_quote = {k: price_quote[k] for k in ("cabinClassCode", "cabinNum") if k in price_quote}
+    slim_quote["totalPrice"] = {
+        ptype: {k: detail[k] for k in _PRICE_FIELDS if k in detail}
+        for ptype, detail in total_price.items() if isinstance(detail, dict)
+    }
+    slim = {"trip": slim_trip, "priceQuote": slim_quote}
+    if trip_product.get("labels"):
+        slim["labels"] = trip_product["labels"]
+    return slim
+
+
+class RouteAccumulator:
+    """流式解析时收集航段与 tripProduct
+
+    航段在一次搜索内跨轮询累积；每次轮询只保留本次响应中的 tripProduct 顺序，
+    之前轮询已精简过的产品按 key 直接复用，不重复构建。
+    """
+
+    def __init__(self, product_key: Callable[[dict], str]):
+        self.product_key = product_key
+        self.segments: dict = {}
+        self.products: list = []
+        self._known: dict = {}
+
+    def fork(self) -> "RouteAccumulator":
+        """对冲轮询用：共享已累积的航段/产品，本次轮询的产品顺序单独收集"""
+        other = RouteAccumulator(self.product_key)
+        other.segments = self.segments
+        other._known = self._known
+        return other
+
+    def begin(self):
+        """开始解析新的一次轮询响应"""
+        self.products = []
+
+    def add(self, path: tuple, key, value):
+        if path[-1] == "segments":
+            if key not in self.segments:
+                self.segments[key] = slim_segment(value)
+        else:
+            product_key = self.product_key(value)
+            product = self._known.get(product_key)
+            if product is None:
+                product = self._known[product_key] = slim_trip_product(value)
+            self.products.append(product)
+
+    def assemble(self, skeleton: dict) -> dict:
+        """把收集到的航段/产品放回响应骨架，得到与整体解析等价的 data"""
+        resp_data = skeleton.get("data", skeleton)
+        route = resp_data.get("route")
+        if isinstance(route, dict):
+            route["segments"] = self.segments
+            route["tripProducts"] = self.products
+        return resp_data
+
+
+class TransformCache:
+    """转换缓存：航段主体 {flightKey: dict}、价格汇总 {价格字段: 汇总结果}
+
+    缓存的对象被多个航班共享，不可修改。
+    """
+
+    __slots__ = ("segments", "prices", "segment_hits", "price_hits")
+
+    def __init__(self):
+        self.segments: dict = {}
+        self.prices: dict = {}
+        self.segment_hits = 0
+        self.price_hits = 0
 
 
 class FlightSearchService:
@@ -13,33 +133,24 @@ class FlightSearchService:
     def __init__(self):
         self.api_url = settings.SEARCH_API_URL
         self.api_token = settings.SEARCH_API_TOKEN
-        self.city_mapping = self._load_city_mapping()
+        self.http = UpstreamClient("search", timeout=settings.SEARCH_TIMEOUT)
+        self.cache = TTLCache(maxsize=settings.SEARCH_CACHE_MAX_SIZE, ttl=settings.SEARCH_CACHE_TTL)
+        self._inflight = SingleFlight()
+        self.polling_stats = PollingStats()
+        self.breaker = CircuitBreaker(
+            window=settings.SEARCH_BREAKER_WINDOW,
+            min_calls=settings.SEARCH_BREAKER_MIN_CALLS,
+            failure_rate=settings.SEARCH_BREAKER_FAILURE_RATE,
+            slow_call=settings.SEARCH_BREAKER_SLOW_CALL,
+            slow_rate=settings.SEARCH_BREAKER_SLOW_RATE,
+            cooldown=settings.SEARCH_BREAKER_COOLDOWN,
+            enabled=settings.SEARCH_BREAKER_ENABLED
+        )
+        self.hedging = HedgePolicy()
     
-    def _load_city_mapping(self) -> dict:
-        """加载城市映射数据"""
-        data_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), "data", "city_mapping.json")
-        try:
-            with open(data_path, "r", encoding="utf-8") as f:
-                return json.load(f)
-        except Exception as e:
-            print(f"Error loading city mapping: {e}")
-            return {"cities": []}
-
     def get_city_code_by_airport(self, airport_code: str) -> str:
         """根据机场码获取对应的城市码"""
-        if not airport_code:
-            return airport_code
-            
-        for city in self.city_mapping.get("cities", []):
-            # 如果本身就是城市主代码，直接返回
-            if city.get("city_code") == airport_code:
-                return airport_code
-            # 检查是否在该城市的机场列表中
-            for airport in city.get("airports", []):
-                if airport.get("code") == airport_code:
-                    return city.get("city_code")
-        
-        return airport_code
+        return reference_index.city_code_of(airport_code)
     
     def _get_headers(self) -> dict:
         """获取请求头"""
@@ -71,10 +182,16 @@ class FlightSearchService:
         travel_type = trip_info.get("travel_type", "OW")
         
         if travel_type == "OW":  # 单程
+            if trip_info.get("exact_airports"):
+                # 机场扇出：按具体机场查询，不归一到城市码
+                dep_code, arr_code = trip_info.get("departure_code"), trip_info.get("arrival_code")
+            else:
+                dep_code = self.get_city_code_by_airport(trip_info.get("departure_code"))
+                arr_code = self.get_city_code_by_airport(trip_info.get("arrival_code"))
             req_user_lines = [{
                 "index": 1,
-                "depCityCode": self.get_city_code_by_airport(trip_info.get("departure_code")),
-                "arrCityCode": self.get_city_code_by_airport(trip_info.get("arrival_code")),
+                "depCityCode": dep_code,
+                "arrCityCode": arr_code,
                 "depDate": trip_info.get("dep_date")
             }]
         elif travel_type == "RT":  # 往返
@@ -92,6 +209,16 @@ class FlightSearchService:
                     "depDate": trip_info.get("return_date")
                 }
             ]
+        elif travel_type == "OJ":  # 缺口程：按 legs 逐程组装
+            req_user_lines = [
+                {
+                    "index": index,
+                    "depCityCode": self.get_city_code_by_airport(leg.get("departure_code")),
+                    "arrCityCode": self.get_city_code_by_airport(leg.get("arrival_code")),
+                    "depDate": leg.get("dep_date")
+                }
+                for index, leg in enumerate(trip_info.get("legs") or [], start=1)
+            ]
         
         # 构建乘客信息
         passengers = trip_info.get("passengers", [{"type": "ADT", "count": 1}])
@@ -173,11 +300,80 @@ class FlightSearchService:
         Returns:
             航班列表
         """
-        flights = []
-        
         if not resp.get("success") or not resp.get("route"):
-            return flights
+            return []
+        
+        req_travel_type, passenger_counts = self._transform_context(resp, travel_type_override, passengers)
+        segments_map = resp["route"].get("segments", {})
+        cache = TransformCache()
         
+        return [
+            self._transform_trip_product(trip_product, segments_map, req_travel_type, passenger_counts, cache)
+            for trip_product in resp["route"].get("tripProducts", [])
+        ]
+    
+    def build_flight_table(
+        self,
+        resp: dict,
+        travel_type_override: str = None,
+        passengers: list = None,
+        known: dict = None,
+        cache: "TransformCache" = None
+    ) -> FlightTable:
+        """将二方接口响应构建为列式航班表
+        
+        只提取过滤/排序需要的字段存入列，tripProduct 原样保留，
+        真正下发的行才通过 _transform_trip_product 物化为 dict。
+        
+        Args:
+            resp: 搜索接口响应
+            travel_type_override: 强制指定的行程类型
+            passengers: 原始请求的乘客信息列表
+            known: 已转换过的航班 {tripProduct key: flight}，直接复用
+            cache: 航段/价格转换缓存，默认每张表新建一个
+        """
+        if not resp or not resp.get("success") or not resp.get("route"):
+            return FlightTable()
+        
+        req_travel_type, passenger_counts = self._transform_context(resp, travel_type_override, passengers)
+        segments_map = resp["route"].get("segments", {})
+        cache = cache if cache is not None else TransformCache()
+        table = FlightTable(
+            materializer=lambda trip_product: self._transform_trip_product(
+                trip_product, segments_map, req_travel_type, passenger_counts, cache
+            )
+        )
+        
+        for trip_product in resp["route"].get("tripProducts", []):
+            trip = trip_product.get("trip", {})
+            keyed_segments = []
+            for item in trip.get("items", []):
+                for fk in item.get("flightKeys", []):
+                    segment = segments_map.get(str(fk.get("flightKey")))
+                    if segment:
+                        keyed_segments.append((fk.get("sequence", 1), segment))
+            keyed_segments.sort(key=lambda x: x[0])
+            segments = [segment for _, segment in keyed_segments]
+            
+            total_price = self._price_totals(trip_product.get("priceQuote", {}), passenger_counts, cache)[0]
+            table.append(
+                source=trip_product,
+                price=to_int(total_price),
+                duration=sum(to_int(seg.get("travelTime", 0)) for seg in segments),
+                departure=time_key(segments[0].get("depDate", "")) if segments else 0,
+                stops=len(segments) - 1 if segments else 0,
+                is_transfer=trip.get("hasTransferItem", False) or len(segments) > 1,
+                dep_airport=segments[0].get("depStation", {}).get("stationCode", "") if segments else "",
+                arr_airport=segments[-1].get("arrStation", {}).get("stationCode", "") if segments else "",
+                airlines=[seg.get("mktCode", "") for seg in segments],
+                flight_nos=[seg.get("lineNo", "") for seg in segments],
+                materialized=known.get(self._trip_product_key(trip_product)) if known else None
+            )
+        
+        return table
+    
+    def _transform_context(self, resp: dict, travel_type_override: str = None, passengers: list = None) -> tuple:
+        """提取一次响应内所有 tripProduct 共用的转换参数: (行程类型, 乘客人数)"""
         # 提取行程类型，优先使用覆盖值，其次从响应中找
         req_data = resp.get("data", resp).get("req", {})
         req_travel_type = travel_type_override or req_data.get("userCommonReq", {}).get("travelType")
@@ -186,271 +382,928 @@ class FlightSearchService:
             # 兜底：从原始请求体中尝试获取
             req_travel_type = req_data.get("travelType", "OW")
         
-        route = resp["route"]
-        segments_map = route.get("segments", {})
+        # 获取请求的乘客信息
+        if passengers:
+            passenger_counts = {p.get("type", "ADT"): p.get("count", 1) for p in passengers}
+        else:
+            req_passengers = req_data.get("userCommonReq", {}).get("reqPassengers", [{"passengerType": "ADT", "passengerCount": "1"}])
+            passenger_counts = {p["passengerType"]: int(p.get("passengerCount", 0)) for p in req_passengers}
         
-        for trip_product in route.get("tripProducts", []):
-            trip = trip_product.get("trip", {})
-            price_quote = trip_product.get("priceQuote", {})
-            
-            # 收集所有航段信息
-            flight_segments = []
-            for item in trip.get("items", []):
-                for fk in item.get("flightKeys", []):
-                    flight_key = str(fk.get("flightKey"))
+        return req_travel_type, passenger_counts
+    
+    @staticmethod
+    def _trip_product_key(trip_product: dict) -> str:
+        """tripProduct 的唯一标识，用于轮询间去重；缺少 id 时退化为航段 key 组合"""
+        trip = trip_product.get("trip", {})
+        if trip.get("id"):
+            return str(trip["id"])
+        flight_keys = [
+            str(fk.get("flightKey"))
+            for item in trip.get("items", [])
+            for fk in item.get("flightKeys", [])
+        ]
+        return "/".join(flight_keys) + "|" + str(trip_product.get("priceQuote", {}).get("cabinClassCode", ""))
+    
+    def _transform_trip_product(
+        self,
+        trip_product: dict,
+        segments_map: dict,
+        req_travel_type: str,
+        passenger_counts: dict,
+        cache: "TransformCache" = None
+    ) -> dict:
+        """转换单个 tripProduct 为前端航班结构
+
+        同一航段被多个 tripProduct 引用时，航段主体只转换一次（cache），
+        航班之间共享航司/起降信息等嵌套 dict，调用方不可修改。
+        """
+        trip = trip_product.get("trip", {})
+        price_quote = trip_product.get("priceQuote", {})
+        segment_cache = cache.segments if cache is not None else {}
+        
+        # 收集所有航段信息
+        flight_segments = []
+        for item in trip.get("items", []):
+            for fk in item.get("flightKeys", []):
+                flight_key = str(fk.get("flightKey"))
+                base = segment_cache.get(flight_key)
+                if base is None:
                     segment = segments_map.get(flight_key)
-                    if segment:
-                        dep_station = segment.get("depStation", {})
-                        arr_station = segment.get("arrStation", {})
-                        
-                        flight_segments.append({
-                            "sequence": fk.get("sequence", 1),
-                            "flight_no": segment.get("lineNo", ""),
-                            "airline": {
-                                "code": segment.get("mktCode", ""),
-                                "name": segment.get("mktName", "")
-                            },
-                            "departure": {
-                                "code": dep_station.get("stationCode", ""),
-                                "city": dep_station.get("cityName", ""),
-                                "name": dep_station.get("stationName", ""),
-                                "terminal": dep_station.get("terminal", ""),
-                                "time": segment.get("depDate", "")
-                            },
-                            "arrival": {
-                                "code": arr_station.get("stationCode", ""),
-                                "city": arr_station.get("cityName", ""),
-                                "name": arr_station.get("stationName", ""),
-                                "terminal": arr_station.get("terminal", ""),
-                                "time": segment.get("arrDate", "")
-                            },
-                            "duration": str(segment.get("travelTime", 0)),
-                            "equip": segment.get("equip", {}).get("craftName", "") if segment.get("equip") else "",
-                            "is_transfer": fk.get("index", 1) > 1
-                        })
-            
-            # 按 sequence 排序
-            flight_segments.sort(key=lambda x: x["sequence"])
-            
-            # 判断是否中转
-            is_transfer = trip.get("hasTransferItem", False) or len(flight_segments) > 1
-            
-            # 提取价格
-            total_price_quote = price_quote.get("totalPrice", {})
-            adult_price = total_price_quote.get("adultPrice", {})
-            child_price = total_price_quote.get("childPrice", {})
-            infant_price = total_price_quote.get("infantPrice", {})
-            
-            # 获取请求的乘客信息
-            if passengers:
-                passenger_counts = {p.get("type", "ADT"): p.get("count", 1) for p in passengers}
+                    if not segment:
+                        continue
+                    base = segment_cache[flight_key] = self._transform_segment(segment)
+                elif cache is not None:
+                    cache.segment_hits += 1
+                flight_segments.append({
+                    "sequence": fk.get("sequence", 1),
+                    **base,
+                    "is_transfer": fk.get("index", 1) > 1
+                })
+        
+        # 按 sequence 排序
+        flight_segments.sort(key=lambda x: x["sequence"])
+        
+        # 判断是否中转
+        is_transfer = trip.get("hasTransferItem", False) or len(flight_segments) > 1
+        
+        # 提取价格
+        total_price_grand, total_base_grand, total_tax_grand, price_breakdown = self._price_totals(
+            price_quote, passenger_counts, cache
+        )
+        
+        cabin_class_code = price_quote.get("cabinClassCode", "Y")
+        cabin_name_map = {
+            "Y": "经济舱",
+            "S": "超级经济舱",
+            "C": "商务舱",
+            "F": "头等舱"
+        }
+        
+        return {
+            "id": trip.get("id", ""),
+            "type": trip.get("type", "INTL_NORMAL"),
+            "travel_type": req_travel_type,
+            "segments": flight_segments,
+            "is_transfer": is_transfer,
+            "cabin_class": cabin_class_code,
+            "cabin_name": cabin_name_map.get(cabin_class_code, "经济舱"),
+            "cabin_num": price_quote.get("cabinNum", ""),
+            "price": {
+                "total": str(total_price_grand),
+                "base": str(total_base_grand),
+                "tax": str(total_tax_grand),
+                "foreign_total": price_quote.get("totalPrice", {}).get("adultPrice", {}).get("foreignTotalPrice", "0"),
+                "currency": "CNY",
+                "passenger_prices": price_breakdown
+            },
+            "services": [],
+            "labels": trip_product.get("labels", [])
+        }
+    
+    @staticmethod
+    def _transform_segment(segment: dict) -> dict:
+        """转换航段主体（不含引用相关的 sequence / is_transfer）"""
+        dep_station = segment.get("depStation", {})
+        arr_station = segment.get("arrStation", {})
+        return {
+            "flight_no": segment.get("lineNo", ""),
+            "airline": {
+                "code": segment.get("mktCode", ""),
+                "name": segment.get("mktName", "")
+            },
+            "departure": {
+                "code": dep_station.get("stationCode", ""),
+                "city": dep_station.get("cityName", ""),
+                "name": dep_station.get("stationName", ""),
+                "terminal": dep_station.get("terminal", ""),
+                "time": segment.get("depDate", "")
+            },
+            "arrival": {
+                "code": arr_station.get("stationCode", ""),
+                "city": arr_station.get("cityName", ""),
+                "name": arr_station.get("stationName", ""),
+                "terminal": arr_station.get("terminal", ""),
+                "time": segment.get("arrDate", "")
+            },
+            "duration": str(segment.get("travelTime", 0)),
+            "equip": segment.get("equip", {}).get("craftName", "") if segment.get("equip") else ""
+        }
+    
+    def _price_totals(self, price_quote: dict, passenger_counts: dict, cache: "TransformCache" = None) -> tuple:
+        """按乘客人数汇总价格，返回 (总价, 票面, 税费, 分乘客明细)
+
+        同一响应内乘客人数不变，价格相同的报价只解析一次（cache，按各乘客类型的价格字段作键）。
+        """
+        total_price_quote = price_quote.get("totalPrice", {})
+        adult_price = total_price_quote.get("adultPrice", {})
+        child_price = total_price_quote.get("childPrice", {})
+        infant_price = total_price_quote.get("infantPrice", {})
+        
+        if cache is not None:
+            key = tuple(
+                (d.get("totalPrice"), d.get("price"), d.get("tax")) if d else None
+                for d in (adult_price, child_price, infant_price)
+            )
+            totals = cache.prices.get(key)
+            if totals is None:
+                totals = cache.prices[key] = self._sum_prices(adult_price, child_price, infant_price, passenger_counts)
             else:
-                req_passengers = req_data.get("userCommonReq", {}).get("reqPassengers", [{"passengerType": "ADT", "passengerCount": "1"}])
-                passenger_counts = {p["passengerType"]: int(p.get("passengerCount", 0)) for p in req_passengers}
+                cache.price_hits += 1
+            return totals
+        return self._sum_prices(adult_price, child_price, infant_price, passenger_counts)
+    
+    @staticmethod
+    def _sum_prices(adult_price: dict, child_price: dict, infant_price: dict, passenger_counts: dict) -> tuple:
+        """按乘客人数汇总各类型价格"""
+        
+        total_price_grand = 0
+        total_base_grand = 0
+        total_tax_grand = 0
+        price_breakdown = []
+        
+        for p_type, count in passenger_counts.items():
+            if count <= 0: continue
             
-            total_price_grand = 0
-            total_base_grand = 0
-            total_tax_grand = 0
-            price_breakdown = []
+            if p_type == "ADT":
+                p_detail = adult_price
+            elif p_type == "CHD":
+                p_detail = child_price
+            elif p_type == "INF":
+                p_detail = infant_price
+            else:
+                p_detail = adult_price # Fallback
             
-            for p_type, count in passenger_counts.items():
-                if count <= 0: continue
+            if p_detail:
+                try:
+                    p_total = int(float(p_detail.get("totalPrice", 0)))
+                    p_base = int(float(p_detail.get("price", 0)))
+                    p_tax = int(float(p_detail.get("tax", 0)))
+                except (ValueError, TypeError):
+                    p_total, p_base, p_tax = 0, 0, 0
                 
-                if p_type == "ADT":
-                    p_detail = adult_price
-                elif p_type == "CHD":
-                    p_detail = child_price
-                elif p_type == "INF":
-                    p_detail = infant_price
-                else:
-                    p_detail = adult_price # Fallback
+                total_price_grand += p_total * count
+                total_base_grand += p_base * count
+                total_tax_grand += p_tax * count
                 
-                if p_detail:
-                    try:
-                        p_total = int(float(p_detail.get("totalPrice", 0)))
-                        p_base = int(float(p_detail.get("price", 0)))
-                        p_tax = int(float(p_detail.get("tax", 0)))
-                    except (ValueError, TypeError):
-                        p_total, p_base, p_tax = 0, 0, 0
-                    
-                    total_price_grand += p_total * count
-                    total_base_grand += p_base * count
-                    total_tax_grand += p_tax * count
-                    
-                    price_breakdown.append({
-                        "type": p_type,
-                        "count": count,
-                        "base": str(p_base),
-                        "tax": str(p_tax),
-                        "total": str(p_total)
-                    })
-
-            # 如果没有提取到任何明细，兜底使用单人成人价
-            if not price_breakdown:
-                total_price_grand = adult_price.get("totalPrice", 0)
-                total_base_grand = adult_price.get("price", 0)
-                total_tax_grand = adult_price.get("tax", 0)
-            
-            cabin_class_code = price_quote.get("cabinClassCode", "Y")
-            cabin_name_map = {
-                "Y": "经济舱",
-                "S": "超级经济舱",
-                "C": "商务舱",
-                "F": "头等舱"
-            }
-            
-            flights.append({
-                "id": trip.get("id", ""),
-                "type": trip.get("type", "INTL_NORMAL"),
-                "travel_type": req_travel_type,
-                "segments": flight_segments,
-                "is_transfer": is_transfer,
-                "cabin_class": cabin_class_code,
-                "cabin_name": cabin_name_map.get(cabin_class_code, "经济舱"),
-                "cabin_num": price_quote.get("cabinNum", ""),
-                "price": {
-                    "total": str(total_price_grand),
-                    "base": str(total_base_grand),
-                    "tax": str(total_tax_grand),
-                    "foreign_total": total_price_quote.get("adultPrice", {}).get("foreignTotalPrice", "0"),
-                    "currency": "CNY",
-                    "passenger_prices": price_breakdown
-                },
-                "services": [],
-                "labels": trip_product.get("labels", [])
-            })
+                price_breakdown.append({
+                    "type": p_type,
+                    "count": count,
+                    "base": str(p_base),
+                    "tax": str(p_tax),
+                    "total": str(p_total)
+                })
+
+        # 如果没有提取到任何明细，兜底使用单人成人价
+        if not price_breakdown:
+            total_price_grand = adult_price.get("totalPrice", 0)
+            total_base_grand = adult_price.get("price", 0)
+            total_tax_grand = adult_price.get("tax", 0)
         
-        return flights
+        return total_price_grand, total_base_grand, total_tax_grand, price_breakdown
     
+    def search_cache_key(
+        self,
+        trip_info: dict,
+        user_line_index: int = 1,
+        selected_lines: list = None
+    ) -> str:
+        """生成搜索缓存键
+
+        只取 build_search_request 实际使用的字段，并按请求的方式规范化：
+        机场码归一到城市码、乘客按类型合并且去掉 0 人、单程以外忽略 userLineIndex，
+        保证语义相同的搜索得到同一个键。
+        """
+        travel_type = trip_info.get("travel_type", "OW")
+        if trip_info.get("exact_airports") and travel_type == "OW":
+            # 机场扇出的单个机场对，按机场缓存
+            dep_city, arr_city = trip_info.get("departure_code"), trip_info.get("arrival_code")
+        else:
+            dep_city = self.get_city_code_by_airport(trip_info.get("departure_code"))
+            arr_city = self.get_city_code_by_airport(trip_info.get("arrival_code"))
+
+        if travel_type == "OW":
+            lines = [[dep_city, arr_city, trip_info.get("dep_date")]]
+        elif travel_type == "RT":
+            lines = [
+                [dep_city, arr_city, trip_info.get("dep_date")],
+                [arr_city, dep_city, trip_info.get("return_date")]
+            ]
+        elif travel_type == "OJ":
+            lines = [
+                [
+                    self.get_city_code_by_airport(leg.get("departure_code")),
+                    self.get_city_code_by_airport(leg.get("arrival_code")),
+                    leg.get("dep_date")
+                ]
+                for leg in trip_info.get("legs") or []
+            ]
+        else:
+            lines = []
+
+        passenger_counts = {}
+        for p in trip_info.get("passengers") or [{"type": "ADT", "count": 1}]:
+            ptype = p.get("type", "ADT")
+            passenger_counts[ptype] = passenger_counts.get(ptype, 0) + int(p.get("count", 1))
+
+        key = {
+            "travel_type": travel_type,
+            "exact_airports": bool(trip_info.get("exact_airports")) and travel_type == "OW",
+            "lines": lines,
+            "passengers": sorted((t, c) for t, c in passenger_counts.items() if c > 0),
+            "cabin_class": trip_info.get("cabin_class", "Y"),
+            "user_line_index": user_line_index if travel_type == "OW" else None,
+            "selected_lines": selected_lines or []
+        }
+        return json.dumps(key, sort_keys=True, ensure_ascii=False, separators=(",", ":"))
+
+    def trip_legs(self, trip_info: dict) -> list[dict]:
+        """把往返/缺口程拆成逐程的单程 trip_info；单程原样返回"""
+        travel_type = trip_info.get("travel_type", "OW")
+        if travel_type == "RT":
+            lines = [
+                (trip_info.get("departure_code"), trip_info.get("arrival_code"), trip_info.get("dep_date")),
+                (trip_info.get("arrival_code"), trip_info.get("departure_code"), trip_info.get("return_date"))
+            ]
+        elif travel_type == "OJ":
+            lines = [
+                (leg.get("departure_code"), leg.get("arrival_code"), leg.get("dep_date"))
+                for leg in trip_info.get("legs") or []
+            ]
+        else:
+            return [trip_info]
+        
+        base = {k: v for k, v in trip_info.items() if k not in ("legs", "return_date")}
+        return [
+            {**base, "travel_type": "OW", "departure_code": dep, "arrival_code": arr, "dep_date": date}
+            for dep, arr, date in lines
+        ]
+    
+    def split_legs(self, trip_info: dict) -> bool:
+        """是否按程拆分搜索：缺口程总是拆分，往返由 SEARCH_SPLIT_RT 控制"""
+        travel_type = trip_info.get("travel_type", "OW")
+        return travel_type == "OJ" or (travel_type == "RT" and settings.SEARCH_SPLIT_RT)
+
+    def airport_pairs(self, trip_info: dict) -> list[tuple]:
+        """机场扇出模式下单程搜索要查询的 (出发机场, 到达机场) 列表；不扇出时返回空列表
+
+        城市码展开为 city_mapping.json 中该城市的全部机场，具体机场保持不变；
+        城市下没有机场数据时按原代码查询。
+        """
+        if not settings.SEARCH_AIRPORT_FANOUT or trip_info.get("exact_airports"):
+            return []
+        if trip_info.get("travel_type", "OW") != "OW":
+            return []
+        
+        def expand(code: str) -> tuple:
+            if not code or reference_index.is_specific_airport(code):
+                return (code,)
+            return reference_index.airports_of(code) or (code,)
+        
+        deps = expand(trip_info.get("departure_code"))
+        arrs = expand(trip_info.get("arrival_code"))
+        return [(dep, arr) for dep in deps for arr in arrs if dep != arr]
+
+    def cache_stats(self) -> dict:
+        """搜索缓存统计"""
+        return {
+            **self.cache.stats(),
+            "enabled": settings.SEARCH_CACHE_ENABLED,
+            "shared_inflight": self._inflight.shared,
+            "cancelled_inflight": self._inflight.cancelled
+        }
+
     async def search(
         self,
         trip_info: dict,
         user_line_index: int = 1,
         selected_lines: list = None,
-        max_retries: int = 20,
+        time_budget: float = None,
         trace_id: str = None
     ) -> dict:
-        """执行搜索（支持轮询）
+        """执行搜索，只返回最终结果（参数与返回值见 search_stream）"""
+        result = None
+        async for event in self.search_stream(trip_info, user_line_index, selected_lines, time_budget, trace_id):
+            if event["type"] == "done":
+                result = event["result"]
+        return result
+
+    async def search_stream(
+        self,
+        trip_info: dict,
+        user_line_index: int = 1,
+        selected_lines: list = None,
+        time_budget: float = None,
+        trace_id: str = None
+    ):
+        """执行搜索（带结果缓存，流式返回中间结果）
+
+        相同规范化参数的搜索在 TTL 内直接命中缓存；并发的相同搜索合并为一次上游轮询，
+        只有发起上游轮询的调用方能收到中间结果，其余调用方直接拿到最终结果。
+        只缓存成功且未超时的结果（预算耗尽返回的是不完整的中间结果）。指定 trace_id 时（Mock 后重试）绕过缓存，保证拿到最新数据。
+        往返/缺口程按 split_legs 拆成逐程并发搜索（见 _search_legs_stream），每一程单独缓存。
+
+        Yields:
+            {"type": "partial", "flights": list}  本次轮询新出现的航班
+            {"type": "done", "result": {success: bool, flights: FlightTable, raw_response: dict, error: str}}
+        """
+        if self.split_legs(trip_info) and not selected_lines:
+            async with aclosing(self._search_legs_stream(trip_info, time_budget, trace_id)) as events:
+                async for event in events:
+                    yield event
+            return
+
+        pairs = self.airport_pairs(trip_info) if not selected_lines else []
+        if pairs:
+            async with aclosing(self._search_airports_stream(trip_info, pairs, time_budget, trace_id)) as events:
+                async for event in events:
+                    yield event
+            return
+
+        if not settings.SEARCH_CACHE_ENABLED or trace_id:
+            async with aclosing(self._search_upstream_stream(
+                trip_info, user_line_index, selected_lines, time_budget, trace_id
+            )) as events:
+                async for event in events:
+                    yield event
+            return
+
+        key = self.search_cache_key(trip_info, user_line_index, selected_lines)
+        cached = self.cache.get(key)
+        if cached is not None:
+            if settings.DEBUG:
+                print(f"[Search] 命中缓存: {key}")
+            yield {"type": "done", "result": cached}
+            return
+
+        partials: asyncio.Queue = asyncio.Queue()
+
+        async def run() -> dict:
+            result = None
+            async for event in self._search_upstream_stream(trip_info, user_line_index, selected_lines, time_budget):
+                if event["type"] == "partial":
+                    partials.put_nowait(event)
+                else:
+                    result = event["result"]
+            if result.get("success") and not result.get("timed_out"):
+                self.cache.set(key, result)
+            return result
+
+        # 上游轮询在 single-flight 的独立任务中执行；调用方提前关闭事件流（如 Mock 胜出）时撤回等待，
+        # 最后一个等待方撤回时取消轮询，释放准入名额和熔断探测。
+        # 合并键带上时间预算：缩短预算的搜索（如低价日历）不与对话搜索合并，避免对话拿到被截断的结果
+        search_task = asyncio.ensure_future(self._inflight.do((key, time_budget), run))
+        next_partial = None
+        try:
+            while not search_task.done():
+                next_partial = asyncio.ensure_future(partials.get())
+                await asyncio.wait({next_partial, search_task}, return_when=asyncio.FIRST_COMPLETED)
+                if next_partial.done():
+                    yield next_partial.result()
+                else:
+                    next_partial.cancel()
+            while not partials.empty():
+                yield partials.get_nowait()
+            yield {"type": "done", "result": search_task.result()}
+        finally:
+            if next_partial is not None and not next_partial.done():
+                next_partial.cancel()
+            if not search_task.done():
+                search_task.cancel()
+
+    async def _fan_in(self, streams: list):
+        """用 asyncio.gather 并发消费多个搜索事件流，按到达顺序产出 (流序号, 事件)"""
+        events: asyncio.Queue = asyncio.Queue()
+        
+        async def drain(index: int, stream):
+            async for event in stream:
+                events.put_nowait((index, event))
+        
+        gather_task = asyncio.ensure_future(asyncio.gather(*(drain(i, stream) for i, stream in enumerate(streams))))
+        try:
+            while not (gather_task.done() and events.empty()):
+                if events.empty():
+                    next_event = asyncio.ensure_future(events.get())
+                    await asyncio.wait({next_event, gather_task}, return_when=asyncio.FIRST_COMPLETED)
+                    if not next_event.done():
+                        next_event.cancel()
+                        continue
+                    yield next_event.result()
+                else:
+                    yield events.get_nowait()
+            gather_task.result()
+        finally:
+            if not gather_task.done():
+                gather_task.cancel()
+
+    async def _search_airports_stream(
+        self,
+        trip_info: dict,
+        pairs: list[tuple],
+        time_budget: float = None,
+        trace_id: str = None
+    ):
+        """城市级搜索按机场对并发扇出，合并去重
+
+        每个机场对作为独立的单程搜索（exact_airports）走 search_stream，结果按机场对单独缓存，
+        之后只查 PVG 的搜索可以直接复用查 SHA 时扇出的 PVG 结果。
+        各机场对只保留起降机场匹配的行，合并时按航段签名（航班号 + 出发时间 + 机场）去重。
+        返回结构与 search_stream 相同，raw_response 为 {"pairs": {"PVG-HKG": 原始响应}}。
+        """
+        pair_trips = [
+            {**trip_info, "departure_code": dep, "arrival_code": arr, "exact_airports": True}
+            for dep, arr in pairs
+        ]
+        results: list[Optional[dict]] = [None] * len(pairs)
+        seen = set()
+        
+        if settings.DEBUG:
+            print(f"[Search] 扇出 {len(pairs)} 个机场对: {', '.join(f'{d}-{a}' for d, a in pairs)}")
+        
+        streams = [self.search_stream(pair_trip, 1, None, time_budget, trace_id) for pair_trip in pair_trips]
+        async for index, event in self._fan_in(streams):
+            if event["type"] == "done":
+                results[index] = event["result"]
+                continue
+            dep, arr = pairs[index]
+            new_flights = []
+            for flight in FilterPlan(dep_airport_code=dep, arr_airport_code=arr).apply(event["flights"]):
+                signature = flight_signature(flight)
+                if signature not in seen:
+                    seen.add(signature)
+                    new_flights.append(flight)
+            if new_flights:
+                yield {"type": "partial", "flights": new_flights}
+        
+        raw_response = {"pairs": {f"{d}-{a}": r.get("raw_response") for (d, a), r in zip(pairs, results, strict=True)}}
+        polling = {"pairs": {f"{d}-{a}": r.get("polling") for (d, a), r in zip(pairs, results, strict=True)}}
+        timed_out = any(r.get("timed_out") for r in results)
+        succeeded = [(pair, r) for pair, r in zip(pairs, results, strict=True) if r.get("success")]
+        if not succeeded:
+            yield {"type": "done", "result": {
+                "success": False,
+                "flights": [],
+                "raw_response": raw_response,
+                "error": "; ".join(f"{d}-{a}: {r.get('error')}" for (d, a), r in zip(pairs, results, strict=True)),
+                "timed_out": timed_out,
+                "circuit_open": any(r.get("circuit_open") for r in results),
+                "overloaded": any(r.get("overloaded") for r in results),
+                "polling": polling
+            }}
+            return
+        
+        parts = []
+        for (dep, arr), result in succeeded:
+            flights = result["flights"]
+            if not isinstance(flights, FlightTable):
+                flights = FlightTable.from_flights(flights)
+            parts.append((flights, FilterPlan(dep_airport_code=dep, arr_airport_code=arr).apply_table(flights)))
+        merged = FlightTable.merge(parts)
+        if settings.DEBUG:
+            print(f"[Search] 机场对合并: {sum(len(rows) for _, rows in parts)} -> {len(merged)} 个航班")
+        yield {"type": "done", "result": {
+            "success": True,
+            "flights": merged,
+            "raw_response": raw_response,
+            "error": None,
+            "timed_out": timed_out,
+            "polling": polling
+        }}
+
+    async def _search_legs_stream(self, trip_info: dict, time_budget: float = None, trace_id: str = None):
+        """逐程并发搜索并拼接为完整行程
+
+        每一程作为单程搜索独立轮询（共享同一时间预算），用 asyncio.gather 并发执行，
+        总耗时取决于最慢的一程而不是一次合并请求的长轮询。
+        各程都有中间结果后，下发拼接出的新行程；任一程失败则整体失败。
+        返回结构与 search_stream 相同，raw_response 为 {"legs": [各程原始响应]}。
+        """
+        travel_type = trip_info.get("travel_type", "OW")
+        legs = self.trip_legs(trip_info)
+        if len(legs) < 2:
+            yield {"type": "done", "result": {
+                "success": False,
+                "flights": [],
+                "raw_response": None,
+                "error": "缺口程至少需要两程"
+            }}
+            return
+        
+        top_k = settings.SEARCH_LEG_TOP_K
+        leg_partials: list[list] = [[] for _ in legs]
+        leg_results: list[Optional[dict]] = [None] * len(legs)
+        sent_ids = set()
+        
+        def join(leg_flights: list[list]) -> list:
+            return join_legs(
+                leg_flights,
+                travel_type,
+                max_results=settings.SEARCH_MAX_ITINERARIES,
+                min_connection_minutes=settings.SEARCH_MIN_CONNECTION_MINUTES
+            )
+        
+        def leg_candidates(index: int) -> list:
+            """某一程参与拼接的候选航班：最终结果在列上取最便宜的前 K 条，否则用中间结果"""
+            result = leg_results[index]
+            if result is not None:
+                flights = result.get("flights") or []
+                if isinstance(flights, FlightTable):
+                    return flights.materialize(flights.select(sort="price", limit=top_k))
+                return FilterPlan(sort="price", limit=top_k).apply(flights)
+            return FilterPlan(sort="price", limit=top_k).apply(leg_partials[index])
+        
+        if settings.DEBUG:
+            print(f"[Search] {travel_type} 拆分为 {len(legs)} 程并发搜索")
+        
+        streams = [self.search_stream(leg, 1, None, time_budget, trace_id) for leg in legs]
+        async for index, event in self._fan_in(streams):
+            if event["type"] == "partial":
+                leg_partials[index].extend(event["flights"])
+            else:
+                leg_results[index] = event["result"]
+            if event["type"] == "done" and all(r is not None for r in leg_results):
+                continue  # 最终结果统一在下面拼接
+            if all(leg_partials[i] or leg_results[i] for i in range(len(legs))):
+                new_itineraries = [
+                    itinerary for itinerary in join([leg_candidates(i) for i in range(len(legs))])
+                    if itinerary["id"] not in sent_ids
+                ]
+                if new_itineraries:
+                    sent_ids.update(itinerary["id"] for itinerary in new_itineraries)
+                    yield {"type": "partial", "flights": new_itineraries}
+        
+        polling = {"legs": [r.get("polling") for r in leg_results]}
+        timed_out = any(r.get("timed_out") for r in leg_results)
+        raw_response = {"legs": [r.get("raw_response") for r in leg_results]}
+        failed = [(i, r) for i, r in enumerate(leg_results, start=1) if not r.get("success")]
+        if failed:
+            yield {"type": "done", "result": {
+                "success": False,
+                "flights": [],
+                "raw_response": raw_response,
+                "error": "; ".join(f"第{i}程: {r.get('error')}" for i, r in failed),
+                "timed_out": timed_out,
+                "circuit_open": any(r.get("circuit_open") for _, r in failed),
+                "overloaded": any(r.get("overloaded") for _, r in failed),
+                "polling": polling
+            }}
+            return
+        
+        itineraries = join([leg_candidates(i) for i in range(len(legs))])
+        if settings.DEBUG:
+            print(f"[Search] {len(legs)} 程拼接出 {len(itineraries)} 个行程")
+        yield {"type": "done", "result": {
+            "success": True,
+            "flights": FlightTable.from_flights(itineraries),
+            "raw_response": raw_response,
+            "error": None,
+            "timed_out": timed_out,
+            "polling": polling
+        }}
+
+    async def _poll_once(
+        self,
+        client: httpx.AsyncClient,
+        request_body: bytes,
+        headers: dict,
+        timeout: float,
+        route: "RouteAccumulator"
+    ) -> tuple:
+        """发送一次轮询请求，返回 (状态码, 响应 data, 原始响应)
+
+        SEARCH_STREAM_PARSE 开启时按块读取响应体：segments/tripProducts 逐个元素解析并精简后交给 route，
+        原始响应体只以压缩后的 CompressedJson 保留；否则整体解析，原始响应即响应 data。
+        """
+        if not settings.SEARCH_STREAM_PARSE:
+            response = await client.post(self.api_url, content=request_body, headers=headers, timeout=timeout)
+            if response.status_code != 200:
+                return response.status_code, None, None
+            resp_json = json_codec.loads(response.content)
+            resp_data = resp_json.get("data", resp_json)
+            return response.status_code, resp_data, resp_data
+        
+        async with client.stream(
+            "POST", self.api_url, content=request_body, headers=headers, timeout=timeout
+        ) as response:
+            if response.status_code != 200:
+                return response.status_code, None, None
+            route.begin()
+            splitter = JsonSplitter(ROUTE_TARGETS, route.add)
+            compressor = zlib.compressobj()
+            compressed = []
+            size = 0
+            async for chunk in response.aiter_bytes(settings.SEARCH_STREAM_CHUNK_SIZE):
+                size += len(chunk)
+                compressed.append(compressor.compress(chunk))
+                splitter.feed(chunk)
+            compressed.append(compressor.flush())
+            skeleton = splitter.close()
+        
+        return response.status_code, route.assemble(skeleton), CompressedJson(b"".join(compressed), size)
+
+    async def _hedged_poll(
+        self,
+        client: httpx.AsyncClient,
+        request_body: bytes,
+        headers: dict,
+        timeout: float,
+        route: "RouteAccumulator"
+    ) -> tuple:
+        """带对冲的单次轮询（返回值同 _poll_once）
+
+        轮询超过最近轮询耗时的分位数（HedgePolicy）仍未返回时，用同一 traceId、同一请求体再发一次，
+        取先成功返回的一次，另一次取消。两次都失败时按第一次的结果返回或抛出。
+        """
+        start = time.monotonic()
+        primary = asyncio.ensure_future(self._poll_once(client, request_body, headers, timeout, route))
+        tasks = {primary}
+        try:
+            delay = self.hedging.delay()
+            if delay is not None and delay < timeout:
+                done, _ = await asyncio.wait(tasks, timeout=delay)
+                if not done:
+                    self.hedging.hedged += 1
+                    if settings.DEBUG:
+                        print(f"[Search] 轮询超过 {delay * 1000:.0f}ms 未返回，发出对冲请求")
+                    hedge = asyncio.ensure_future(
+                        self._poll_once(client, request_body, headers, timeout - delay, route.fork())
+                    )
+                    tasks.add(hedge)
+                    pending = set(tasks)
+                    while pending:
+                        done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                        for task in done:
+                            if not task.cancelled() and task.exception() is None and task.result()[0] == 200:
+                                if task is hedge:
+                                    self.hedging.hedge_wins += 1
+                                self.hedging.record(time.monotonic() - start)
+                                return task.result()
+            result = await primary
+            if result[0] == 200:
+                self.hedging.record(time.monotonic() - start)
+            return result
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+
+    async def _search_upstream_stream(
+        self,
+        trip_info: dict,
+        user_line_index: int = 1,
+        selected_lines: list = None,
+        time_budget: float = None,
+        trace_id: str = None
+    ):
+        """执行上游搜索，经过熔断器（参数与返回值见 _poll_upstream_stream）
+
+        熔断中不请求上游，直接返回失败结果（circuit_open=True），由调用方降级 Mock；
+        准入队列已满时返回失败结果（overloaded=True），由调用方提示繁忙。
+        """
+        permit = self.breaker.allow()
+        if permit is None:
+            if settings.DEBUG:
+                print("[Search] 搜索熔断中，跳过上游搜索")
+            yield {"type": "done", "result": {
+                "success": False,
+                "flights": [],
+                "raw_response": None,
+                "error": "搜索服务暂时不可用（熔断中）",
+                "timed_out": False,
+                "circuit_open": True,
+                "polling": None
+            }}
+            return
+        try:
+            async with admission.slot("search"), aclosing(self._poll_upstream_stream(
+                trip_info, user_line_index, selected_lines, time_budget, trace_id, permit
+            )) as events:
+                async for event in events:
+                    yield event
+        except AdmissionRejectedError as e:
+            yield {"type": "done", "result": {
+                "success": False,
+                "flights": [],
+                "raw_response": None,
+                "error": str(e),
+                "timed_out": False,
+                "overloaded": True,
+                "polling": None
+            }}
+        finally:
+            self.breaker.release(permit)
+
+    async def _poll_upstream_stream(
+        self,
+        trip_info: dict,
+        user_line_index: int = 1,
+        selected_lines: list = None,
+        time_budget: float = None,
+        trace_id: str = None,
+        permit: Permit = None
+    ):
+        """执行上游搜索（支持轮询）
         
         搜索接口需要多次交互：
-        - 利用 sleepTime 进行内部等待
-        - 使用相同的 traceId 再次请求
-        - 直到 finished 为 true 才停止
+        - 利用 sleepTime 进行内部等待（由 SearchPoller 夹紧并自适应退避）
+        - 使用相同的 traceId 和同一份序列化好的请求体再次请求
+        - 直到 finished 为 true，或总时间预算耗尽时返回目前最好的结果
+        
+        每次轮询只转换之前未出现过的 tripProduct 并作为中间结果产出，
+        最终结果为按最后一次响应构建的 FlightTable，复用已转换的航班，其余行按需物化。
         
         Args:
             trip_info: 行程信息
             user_line_index: 当前查询行程索引
             selected_lines: 已选航班
-            max_retries: 最大轮询次数，防止无限循环
+            time_budget: 轮询总时间预算（秒），默认 settings.SEARCH_TIME_BUDGET
             trace_id: 可选的 traceId（Mock 后重试搜索时使用 Mock 的 traceId）
-            
-        Returns:
-            {success: bool, flights: list, raw_response: dict, error: str}
+            permit: 熔断器放行许可，结果按该许可记录
         """
         # 使用传入的 traceId 或生成新的
         if not trace_id:
             trace_id = f"AI{datetime.now().strftime('%Y%m%d%H%M%S%f')[:17]}"
         
-        retry_count = 0
-        last_resp_data = None
+        poller = SearchPoller(budget=time_budget)
+        last_raw = None
+        best_resp_data = None  # 最近一次成功且带航线数据的响应，预算耗尽时返回
+        best_raw = None
+        route = RouteAccumulator(self._trip_product_key)  # 流式解析时跨轮询复用精简后的航段/产品
+        transformed = {}  # tripProduct key -> 已转换的航班
+        transform_cache = TransformCache()  # 一次搜索内航段/价格只转换一次（flightKey 在同一次搜索内含义不变）
         
-        try:
-            start_time = datetime.now()
-            async with httpx.AsyncClient(timeout=90.0) as client:
-                while retry_count < max_retries:
-                    retry_count += 1
-                    
-                    # 构建请求，使用相同的 traceId
-                    request = self.build_search_request(
-                        trip_info, 
-                        user_line_index, 
-                        selected_lines,
-                        trace_id=trace_id
+        def collect(resp_data: dict) -> list:
+            """转换本次响应中新出现的 tripProduct，返回新航班列表"""
+            if not resp_data.get("success") or not resp_data.get("route"):
+                return []
+            req_travel_type, passenger_counts = self._transform_context(
+                resp_data, trip_info.get("travel_type"), trip_info.get("passengers")
+            )
+            segments_map = resp_data["route"].get("segments", {})
+            new_flights = []
+            for trip_product in resp_data["route"].get("tripProducts", []):
+                product_key = self._trip_product_key(trip_product)
+                if product_key not in transformed:
+                    flight = self._transform_trip_product(
+                        trip_product, segments_map, req_travel_type, passenger_counts, transform_cache
                     )
-                    
-                    if settings.DEBUG:
-                        print(f"[Search] 第 {retry_count} 次请求, traceId={trace_id}")
-                    
-                    response = await client.post(
-                        self.api_url, 
-                        json=request,
-                        headers=self._get_headers()
+                    transformed[product_key] = flight
+                    new_flights.append(flight)
+            return new_flights
+        
+        def final_flights(resp_data: dict) -> FlightTable:
+            """按最后一次响应构建完整结果表，复用中间结果已转换的航班"""
+            return self.build_flight_table(
+                resp_data, trip_info.get("travel_type"), trip_info.get("passengers"),
+                known=transformed, cache=transform_cache
+            )
+        
+        def finish(result: dict, timed_out: bool = False, upstream_failed: bool = False) -> dict:
+            """附上轮询耗时并记录统计
+
+            upstream_failed: 上游异常（HTTP 错误、请求异常、预算耗尽仍无结果），计入熔断失败率；
+            上游正常返回的业务失败（如无航线）不计入
+            """
+            summary = poller.summary()
+            self.polling_stats.add(summary, timed_out)
+            self.breaker.record(not upstream_failed, poller.elapsed(), permit)
+            if settings.DEBUG:
+                print(f"[Search] 轮询 {summary['polls']} 次, 耗时 {summary['elapsed_ms']:.0f}ms, "
+                      f"timed_out={timed_out}, 共 {len(result['flights'])} 个航班")
+            return {**result, "timed_out": timed_out, "polling": summary}
+        
+        def best_so_far(error: str) -> dict:
+            """预算耗尽：有中间结果则按成功返回，否则返回失败"""
+            if best_resp_data:
+                return finish({
+                    "success": True,
+                    "flights": final_flights(best_resp_data),
+                    "raw_response": best_raw,
+                    "error": None
+                }, timed_out=True)
+            return finish({
+                "success": False,
+                "flights": [],
+                "raw_response": last_raw,
+                "error": error
+            }, timed_out=True, upstream_failed=True)
+        
+        # 请求体在一次搜索内保持不变，只序列化一次
+        request_body = json_codec.dumps(
+            self.build_search_request(trip_info, user_line_index, selected_lines, trace_id=trace_id)
+        )
+        headers = self._get_headers()
+        
+        try:
+            client = self.http.client
+            while not poller.expired():
+                if settings.DEBUG:
+                    print(f"[Search] 第 {len(poller.polls) + 1} 次请求, traceId={trace_id}, "
+                          f"剩余预算 {poller.remaining():.1f}s")
+                
+                poll_start = time.monotonic()
+                try:
+                    status_code, resp_data, raw = await self._hedged_poll(
+                        client, request_body, headers, poller.request_timeout(), route
                     )
+                except httpx.TimeoutException:
+                    poller.record(time.monotonic() - poll_start)
+                    if poller.expired():
+                        break
+                    raise
+                
+                if status_code != 200:
+                    poller.record(time.monotonic() - poll_start, status_code=status_code)
+                    yield {"type": "done", "result": finish({
+                        "success": False,
+                        "flights": [],
+                        "raw_response": None,
+                        "error": f"HTTP {status_code}"
+                    }, upstream_failed=True)}
+                    return
+                
+                last_raw = raw
+                poller.record(time.monotonic() - poll_start, resp_data, status_code)
+                
+                if settings.DEBUG:
+                    print(f"[Search] 响应: success={resp_data.get('success')}, "
+                          f"finished={resp_data.get('finished')}, "
+                          f"sleepTime={resp_data.get('sleepTime')}, "
+                          f"resultCount={resp_data.get('resultCount')}")
+                
+                # 检查是否成功
+                if not resp_data.get("success"):
+                    # 如果失败但有 sleepTime，可能需要继续等待
+                    if resp_data.get("sleepTime", 0) > 0 and not resp_data.get("finished"):
+                        sleep = poller.next_sleep(resp_data)
+                        if sleep is None:
+                            break
+                        await asyncio.sleep(sleep)
+                        continue
                     
-                    if response.status_code != 200:
-                        return {
-                            "success": False,
-                            "flights": [],
-                            "raw_response": None,
-                            "error": f"HTTP {response.status_code}"
-                        }
-                    
-                    resp_json = response.json()
-                    resp_data = resp_json.get("data", resp_json)
-                    last_resp_data = resp_data
-                    
-                    if settings.DEBUG:
-                        print(f"[Search] 响应: success={resp_data.get('success')}, "
-                              f"finished={resp_data.get('finished')}, "
-                              f"sleepTime={resp_data.get('sleepTime')}, "
-                              f"resultCount={resp_data.get('resultCount')}")
-                    
-                    # 检查是否成功
-                    if not resp_data.get("success"):
-                        # 如果失败但有 sleepTime，可能需要继续等待
-                        sleep_time = resp_data.get("sleepTime", 0)
-                        if sleep_time > 0 and not resp_data.get("finished"):
-                            await asyncio.sleep(sleep_time / 1000.0)
-                            continue
-                        
-                        return {
-                            "success": False,
-                            "flights": [],
-                            "raw_response": resp_data,
-                            "error": resp_data.get("message", "搜索失败")
-                        }
-                    
-                    # 检查是否完成
-                    finished = resp_data.get("finished", False)
-                    if finished:
-                        # 使用最后一次的航班结果，传入 travel_type 确保识别一致
-                        flights = self.transform_response(resp_data, travel_type_override=trip_info.get("travel_type"), passengers=trip_info.get("passengers"))
-                        duration = (datetime.now() - start_time).total_seconds()
-                        if settings.DEBUG:
-                            print(f"[Search] 搜索完成, 共 {len(flights)} 个航班, 耗时 {duration:.2f}s")
-                        return {
-                            "success": True,
-                            "flights": flights,
-                            "raw_response": resp_data,
-                            "error": None
-                        }
-                    
-                    # 获取等待时间
-                    sleep_time = resp_data.get("sleepTime", 0)
-                    if sleep_time > 0:
-                        if settings.DEBUG:
-                            print(f"[Search] 等待 {sleep_time}ms 后继续...")
-                        await asyncio.sleep(sleep_time / 1000.0)
-                    else:
-                        # 没有 sleepTime 且未完成，等待一个默认时间
-                        await asyncio.sleep(0.5)
+                    yield {"type": "done", "result": finish({
+                        "success": False,
+                        "flights": [],
+                        "raw_response": raw,
+                        "error": resp_data.get("message", "搜索失败")
+                    })}
+                    return
                 
-                # 达到最大重试次数，返回最后一次的结果
-                flights = self.transform_response(last_resp_data, travel_type_override=trip_info.get("travel_type"), passengers=trip_info.get("passengers")) if last_resp_data else []
-                return {
-                    "success": True,
-                    "flights": flights,
-                    "raw_response": last_resp_data,
-                    "error": None
-                }
+                if resp_data.get("route"):
+                    best_resp_data, best_raw = resp_data, raw
+                
+                # 检查是否完成
+                if resp_data.get("finished", False):
+                    # 使用最后一次的航班结果，传入 travel_type 确保识别一致
+                    yield {"type": "done", "result": finish({
+                        "success": True,
+                        "flights": final_flights(resp_data),
+                        "raw_response": raw,
+                        "error": None
+                    })}
+                    return
+                
+                # 未完成：先下发本次轮询新出现的航班
+                new_flights = collect(resp_data)
+                if new_flights:
+                    yield {"type": "partial", "flights": new_flights}
+                
+                sleep = poller.next_sleep(resp_data)
+                if sleep is None:
+                    break
+                if settings.DEBUG:
+                    print(f"[Search] 等待 {sleep * 1000:.0f}ms 后继续...")
+                await asyncio.sleep(sleep)
+            
+            # 时间预算耗尽，返回目前最好的结果
+            yield {"type": "done", "result": best_so_far("搜索超时")}
                 
         except Exception as e:
-            return {
+            yield {"type": "done", "result": finish({
                 "success": False,
                 "flights": [],
-                "raw_response": last_resp_data,
+                "raw_response": last_raw,
                 "error": str(e)
-            }
+            }, upstream_failed=True)}
     
     def filter_flights(
         self,
@@ -459,49 +1312,40 @@ class FlightSearchService:
         flight_no: str = None,
         direct_only: bool = False,
         dep_airport_code: str = None,
-        arr_airport_code: str = None
+        arr_airport_code: str = None,
+        sort_by: str = None,
+        descending: bool = False,
+        limit: int = None,
+        offset: int = 0
     ) -> list:
-        """过滤航班
+        """过滤航班（编译为一次遍历的过滤计划）
         
         Args:
-            flights: 航班列表
+            flights: 航班列表，或搜索返回的 FlightTable（在列上过滤，只物化命中的行）
             airline_code: 航司代码过滤
-            flight_no: 航班号过滤
+            flight_no: 航班号过滤（子串匹配，忽略大小写）
             direct_only: 仅直飞
             dep_airport_code: 出发机场码过滤
             arr_airport_code: 到达机场码过滤
+            sort_by: 排序字段 price/duration/departure/stops，默认保持原顺序
+            descending: 是否倒序
+            limit: 最多返回条数（配合排序时用堆取前 K 条）
+            offset: 跳过的条数
         """
-        result = flights
-        
-        if direct_only:
-            result = [f for f in result if not f.get("is_transfer")]
-        
-        if dep_airport_code:
-            result = [
-                f for f in result 
-                if f.get("segments") and f["segments"][0].get("departure", {}).get("code") == dep_airport_code
-            ]
-            
-        if arr_airport_code:
-            result = [
-                f for f in result 
-                if f.get("segments") and f["segments"][-1].get("arrival", {}).get("code") == arr_airport_code
-            ]
-        
-        if airline_code:
-            result = [
-                f for f in result 
-                if any(seg.get("airline", {}).get("code") == airline_code for seg in f.get("segments", []))
-            ]
-        
-        if flight_no:
-            flight_no_upper = flight_no.upper()
-            result = [
-                f for f in result
-                if any(flight_no_upper in seg.get("flight_no", "").upper() for seg in f.get("segments", []))
-            ]
-        
-        return result
+        plan = FilterPlan(
+            airline_code=airline_code,
+            flight_no=flight_no,
+            direct_only=direct_only,
+            dep_airport_code=dep_airport_code,
+            arr_airport_code=arr_airport_code,
+            sort=sort_by,
+            descending=descending,
+            limit=limit,
+            offset=offset
+        )
+        if isinstance(flights, FlightTable):
+            return flights.materialize(plan.apply_table(flights))
+        return plan.apply(flights)
 
 
 # 全局单例
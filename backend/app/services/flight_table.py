@@ -0,0 +1,222 @@
+"""列式航班结果表
+
+大结果集（数百个 tripProduct × 航段）不再为每个结果构建嵌套 dict，
+而是把过滤、排序需要的字段存成紧凑的类型化列（array），航司/机场代码驻留为整数 id。
+过滤、排序、取前 K 条（见 flight_filter.FilterPlan）都在列上完成，只有真正下发给前端的行才会物化成 dict。
+"""
+from array import array
+from typing import Any, Callable, Iterable, Optional
+
+
+def time_key(value: str) -> int:
+    """'2026-10-01 08:00:00' / '202610010800' -> 202610010800，可直接比较先后"""
+    if not value:
+        return 0
+    digits = "".join(ch for ch in value[:19] if ch.isdigit())[:12]
+    return int(digits.ljust(12, "0")) if digits else 0
+
+
+def to_int(value: Any) -> int:
+    """价格/时长等字段可能是字符串或浮点数，统一转为整数"""
+    try:
+        return int(float(value))
+    except (TypeError, ValueError):
+        return 0
+
+
+def flight_signature(flight: dict) -> tuple:
+    """航班 dict 的去重签名：各段航班号 + 首段出发时间 + 起降机场，与 FlightTable.row_signature 一致"""
+    segments = flight.get("segments") or []
+    return (
+        tuple(seg.get("flight_no", "").upper() for seg in segments),
+        time_key(segments[0].get("departure", {}).get("time", "")) if segments else 0,
+        segments[0].get("departure", {}).get("code", "") if segments else "",
+        segments[-1].get("arrival", {}).get("code", "") if segments else "",
+    )
+
+
+class FlightTable:
+    """列式航班表
+
+    每一行对应一个航班，行的原始数据（上游 tripProduct 或已构建的 dict）保存在 sources 中，
+    通过 materializer 按需转换为前端展示结构，转换结果按行缓存。
+    """
+
+    def __init__(self, materializer: Callable[[Any], dict] = None):
+        self.price = array("q")       # 总价（所有乘客）
+        self.duration = array("l")    # 飞行时长合计（分钟）
+        self.departure = array("q")   # 首段出发时间 yyyyMMddHHmm
+        self.stops = array("b")       # 经停/中转次数
+        self.transfer = array("b")    # 是否中转
+        self.dep_airport = array("H")  # 首段出发机场 id
+        self.arr_airport = array("H")  # 末段到达机场 id
+        self.airline_offsets = array("L", [0])  # 每行航司 id 在 airline_ids 中的区间
+        self.airline_ids = array("H")
+        self.flight_nos: list[tuple] = []  # 各航段大写航班号，供子串匹配
+
+        self.symbols: list[str] = []
+        self._symbol_ids: dict[str, int] = {}
+        self._sources: list = []
+        self._materializer = materializer or (lambda source: source)
+        self._materialized: dict[int, dict] = {}
+
+    # ---------- 构建 ----------
+
+    def intern(self, code: str) -> int:
+        """代码驻留为整数 id"""
+        code = code or ""
+        symbol_id = self._symbol_ids.get(code)
+        if symbol_id is None:
+            symbol_id = len(self.symbols)
+            self._symbol_ids[code] = symbol_id
+            self.symbols.append(code)
+        return symbol_id
+
+    def append(
+        self,
+        source: Any,
+        price: int,
+        duration: int,
+        departure: int,
+        stops: int,
+        is_transfer: bool,
+        dep_airport: str,
+        arr_airport: str,
+        airlines: Iterable[str],
+        flight_nos: Iterable[str],
+        materialized: dict = None
+    ) -> int:
+        """追加一行，返回行号"""
+        row = len(self._sources)
+        self._sources.append(source)
+        self.price.append(price)
+        self.duration.append(duration)
+        self.departure.append(departure)
+        self.stops.append(max(0, min(stops, 127)))
+        self.transfer.append(1 if is_transfer else 0)
+        self.dep_airport.append(self.intern(dep_airport))
+        self.arr_airport.append(self.intern(arr_airport))
+        self.airline_ids.extend(self.intern(code) for code in dict.fromkeys(airlines))
+        self.airline_offsets.append(len(self.airline_ids))
+        self.flight_nos.append(tuple(no.upper() for no in flight_nos))
+        if materialized is not None:
+            self._materialized[row] = materialized
+        return row
+
+    def append_flight(self, flight: dict) -> int:
+        """追加一个已构建的前端航班 dict"""
+        segments = flight.get("segments") or []
+        return self.append(
+            source=flight,
+            price=to_int(flight.get("price", {}).get("total")),
+            duration=sum(to_int(seg.get("duration")) for seg in segments),
+            departure=time_key(segments[0].get("departure", {}).get("time", "")) if segments else 0,
+            stops=len(segments) - 1 if segments else 0,
+            is_transfer=bool(flight.get("is_transfer")),
+            dep_airport=segments[0].get("departure", {}).get("code", "") if segments else "",
+            arr_airport=segments[-1].get("arrival", {}).get("code", "") if segments else "",
+            airlines=[seg.get("airline", {}).get("code", "") for seg in segments],
+            flight_nos=[seg.get("flight_no", "") for seg in segments],
+            materialized=flight
+        )
+
+    @classmethod
+    def from_flights(cls, flights: Iterable[dict]) -> "FlightTable":
+        """由已构建的航班列表生成表（Mock 结果等）"""
+        table = cls()
+        for flight in flights:
+            table.append_flight(flight)
+        return table
+
+    @classmethod
+    def merge(cls, parts: Iterable[tuple["FlightTable", Iterable[int]]]) -> "FlightTable":
+        """合并多张表的指定行，按 row_signature 去重（保留价格更低的一行）
+
+        只复制列，不物化：新表的行引用原表的行，物化时委托给原表（并复用其缓存）。
+        """
+        table = cls(materializer=lambda source: source[0].materialize_row(source[1]))
+        positions: dict[tuple, int] = {}
+        picked: list[tuple["FlightTable", int]] = []
+        for source, rows in parts:
+            for row in rows:
+                signature = source.row_signature(row)
+                index = positions.get(signature)
+                if index is None:
+                    positions[signature] = len(picked)
+                    picked.append((source, row))
+                elif source.price[row] < picked[index][0].price[picked[index][1]]:
+                    picked[index] = (source, row)
+        for source, row in picked:
+            table.append(
+                source=(source, row),
+                price=source.price[row],
+                duration=source.duration[row],
+                departure=source.departure[row],
+                stops=source.stops[row],
+                is_transfer=bool(source.transfer[row]),
+                dep_airport=source.symbols[source.dep_airport[row]],
+                arr_airport=source.symbols[source.arr_airport[row]],
+                airlines=[source.symbols[i] for i in source.airline_ids[source.airline_offsets[row]:source.airline_offsets[row + 1]]],
+                flight_nos=source.flight_nos[row],
+                materialized=source._materialized.get(row)
+            )
+        return table
+
+    # ---------- 查询 ----------
+
+    def __len__(self) -> int:
+        return len(self._sources)
+
+    def __getitem__(self, row: int) -> dict:
+        if row < 0:
+            row += len(self)
+        if not 0 <= row < len(self):
+            raise IndexError(row)
+        return self.materialize_row(row)
+
+    def __iter__(self):
+        return (self.materialize_row(row) for row in range(len(self)))
+
+    def symbol_id(self, code: str) -> Optional[int]:
+        """代码 -> 驻留 id，表中未出现的代码返回 None"""
+        return self._symbol_ids.get(code)
+
+    def row_signature(self, row: int) -> tuple:
+        """行的去重签名，见 flight_signature"""
+        return (
+            self.flight_nos[row],
+            self.departure[row],
+            self.symbols[self.dep_airport[row]],
+            self.symbols[self.arr_airport[row]],
+        )
+
+    def has_airline(self, row: int, airline_id: int) -> bool:
+        return airline_id in self.airline_ids[self.airline_offsets[row]:self.airline_offsets[row + 1]]
+
+    def select(self, **criteria) -> list[int]:
+        """按条件过滤并排序，返回行号列表（不物化 dict），参数见 FilterPlan"""
+        from app.services.flight_filter import FilterPlan
+        return FilterPlan(**criteria).apply_table(self)
+
+    def materialize_row(self, row: int) -> dict:
+        flight = self._materialized.get(row)
+        if flight is None:
+            flight = self._materializer(self._sources[row])
+            self._materialized[row] = flight
+        return flight
+
+    def materialize(self, rows: Iterable[int]) -> list[dict]:
+        """把选中的行转换为前端展示结构"""
+        return [self.materialize_row(row) for row in rows]
+
+    def stats(self) -> dict:
+        return {
+            "rows": len(self),
+            "materialized": len(self._materialized),
+            "symbols": len(self.symbols),
+            "column_bytes": sum(
+                col.itemsize * len(col)
+                for col in (self.price, self.duration, self.departure, self.stops, self.transfer,
+                            self.dep_airport, self.arr_airport, self.airline_offsets, self.airline_ids)
+            )
+        }
@@ -0,0 +1,332 @@
+"""规则快速通道 - 本地解析格式化的查询，跳过 LLM
+
+"明天上海到香港"、"PVG 到 ICN 2大1小 商务舱" 这类句式固定的输入，
+基于 city_mapping.json 的城市/机场名称与代码、航司、flatType 渠道、相对日期、乘客人数和舱等词
+在本地解析，输出与 LLMService.parse_intent 相同的 {status, trip_info, clarify, message} 结构。
+只有整句都能被识别（除连接词外没有剩余文字）且航线、日期完整无歧义时才直接返回，
+其余情况（中转、航班号、缺口程、单独的"15号"等）返回 None，交给 LLM 解析。
+"""
+import re
+from datetime import date, datetime, timedelta
+from typing import Optional
+
+from app.core.reference_index import ReferenceIndex, reference_index
+
+# 舱等词 -> (舱位代码, 舱位名称)
+CABIN_WORDS = {
+    "超值经济舱": ("S", "超值经济舱"),
+    "超级经济舱": ("S", "超值经济舱"),
+    "经济舱": ("Y", "经济舱"),
+    "公务舱": ("C", "公务舱"),
+    "商务舱": ("C", "公务舱"),
+    "头等舱": ("F", "头等舱"),
+}
+
+# 航司常用简称（全称与二字码来自 city_mapping.json）
+AIRLINE_ABBREVIATIONS = {
+    "东航": "MU", "国航": "CA", "南航": "CZ", "海航": "HU", "川航": "3U",
+    "深航": "ZH", "上航": "FM", "厦航": "MF", "春秋": "9C", "吉祥": "HO",
+}
+
+PASSENGER_WORDS = {
+    "成人": "ADT", "大人": "ADT", "成年人": "ADT",
+    "儿童": "CHD", "小孩": "CHD", "孩子": "CHD",
+    "婴儿": "INF",
+}
+
+_NUMBERS = {"一": 1, "二": 2, "两": 2, "三": 3, "四": 4, "五": 5, "六": 6, "七": 7, "八": 8, "九": 9}
+_WEEKDAYS = {"一": 0, "二": 1, "三": 2, "四": 3, "五": 4, "六": 5, "日": 6, "天": 6}
+_RELATIVE_DAYS = {"今天": 0, "明天": 1, "后天": 2, "大后天": 3}
+
+_NUM = r"[0-9一二两三四五六七八九]"
+_DATE_PATTERN = (
+    r"(?P<ymd>(?P<y>\d{4})[-/年](?P<ym>\d{1,2})[-/月](?P<yd>\d{1,2})[日号]?)"
+    r"|(?P<md>(?P<m>\d{1,2})月(?P<d>\d{1,2})[日号]?)"
+    r"|(?P<rel>大后天|今天|明天|后天)"
+    r"|(?P<week>(?P<week_prefix>下下|下|这|本)?(?:周|星期|礼拜)(?P<weekday>[一二三四五六日天]))"
+)
+_PASSENGER_PATTERN = (
+    rf"(?P<adt_chd>(?P<adt>{_NUM})大(?P<chd>{_NUM})小)"
+    rf"|(?P<pax>(?P<pax_n>{_NUM})[个名位]?(?P<pax_word>{'|'.join(sorted(PASSENGER_WORDS, key=len, reverse=True))}))"
+    rf"|(?P<people>(?P<people_n>{_NUM})(?:个人|人|位))"
+)
+# 去掉识别出的词之后允许剩下的连接词/口语词
+_FILLER = re.compile(
+    r"从|飞往|前往|到|至|去|飞|出发|的|飞机票|机票|航班|飞机|票|帮我|帮忙|麻烦|请|"
+    r"查询|查一下|查查|查|搜索|搜一下|搜|看看|看一下|一下|我想|我要|想|要|订|买|直飞|"
+    r"[\s,，。.!！?？、\-~～>→]"
+)
+_ROUND_TRIP_FILLER = re.compile(r"返回|返程|回来|回程|回")
+_CONNECTOR = re.compile(r"到|至|去|飞|[\-~～>→]")
+
+
+def _to_int(text: str) -> int:
+    return int(text) if text.isdigit() else _NUMBERS[text]
+
+
+class RuleIntentParser:
+    """基于参考数据的规则意图解析器"""
+
+    def __init__(self, index: ReferenceIndex):
+        self.index = index
+        names: dict[str, tuple] = {}  # 词 -> (类别, 值)
+        for airline in index.airlines:
+            names.setdefault(airline.get("name", ""), ("airline", airline.get("code")))
+        for word, code in AIRLINE_ABBREVIATIONS.items():
+            names.setdefault(word, ("airline", code))
+        for category in index.flat_types:
+            for item in category.get("values", []):
+                if item.get("value") != "ALL" and len(item.get("text", "")) >= 2:
+                    names.setdefault(item["text"].upper(), ("channel", item["value"]))
+        for word, cabin in CABIN_WORDS.items():
+            names.setdefault(word, ("cabin", cabin))
+        for word in ("单程", "往返"):
+            names.setdefault(word, ("travel_type", "OW" if word == "单程" else "RT"))
+        # 城市名优先于机场简称；机场名同时收录全称和去掉"机场"后缀的简称（浦东、虹桥、成田...）
+        for city_name, city_code in index.city_by_name.items():
+            names.setdefault(city_name, ("location", city_code))
+        for code, airport_name in index.airport_names.items():
+            names.setdefault(airport_name, ("location", code))
+            short = re.sub(r"(国际)?机场$", "", airport_name)
+            if len(short) >= 2:
+                names.setdefault(short, ("location", code))
+        names.pop("", None)
+        self.names = names
+
+        alternation = "|".join(re.escape(name) for name in sorted(names, key=len, reverse=True))
+        self.pattern = re.compile(
+            rf"{_DATE_PATTERN}|{_PASSENGER_PATTERN}|(?P<name>{alternation})"
+            r"|(?P<code>(?<![A-Z0-9])(?=[0-9]*[A-Z])[A-Z0-9]{2,3}(?![A-Z0-9]))"
+        )
+        self.hits = 0
+        self.misses = 0
+
+    def parse(self, message: str, current_trip_info: dict = None, today: date = None) -> Optional[dict]:
+        """解析成功返回与 parse_intent 相同的结构，无法确定时返回 None"""
+        result = self._parse(message, current_trip_info, today or datetime.now().date())
+        if result is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return result
+
+    def _parse(self, message: str, current_trip_info: Optional[dict], today: date) -> Optional[dict]:
+        text = (message or "").strip().upper()
+        if not text:
+            return None
+
+        locations = []  # (代码, 起始位置, 结束位置)
+        dates = []
+        passengers: dict[str, int] = {}
+        fields: dict = {}
+        leftover = []
+        pos = 0
+        for match in self.pattern.finditer(text):
+            leftover.append(text[pos:match.start()])
+            pos = match.end()
+            if match.group("code"):
+                kind, value = self._classify_code(match.group("code"))
+            elif match.group("name"):
+                kind, value = self.names[match.group("name")]
+            elif match.lastgroup in ("ymd", "md", "rel", "week"):
+                kind, value = "date", self._resolve_date(match, today)
+            else:
+                kind, value = "passengers", self._passengers(match)
+            if value is None:
+                return None
+
+            if kind == "location":
+                # "上海浦东"：城市名后紧跟该城市的机场，合并为机场
+                if locations and locations[-1][2] == match.start() \
+                        and self.index.city_code_of(value) == locations[-1][0] != value:
+                    locations[-1] = (value, locations[-1][1], match.end())
+                else:
+                    locations.append((value, match.start(), match.end()))
+            elif kind == "date":
+                dates.append(value)
+            elif kind == "passengers":
+                for p_type, count in value.items():
+                    if p_type in passengers:
+                        return None
+                    passengers[p_type] = count
+            else:
+                if kind in fields and fields[kind] != value:
+                    return None
+                fields[kind] = value
+        leftover.append(text[pos:])
+
+        travel_type = fields.get("travel_type", "OW")
+        rest = _FILLER.sub("", "".join(leftover))
+        if travel_type == "RT":
+            rest = _ROUND_TRIP_FILLER.sub("", rest)
+        if rest or len(locations) != 2:
+            return None
+
+        # 航线方向：两地之间必须有连接词，且不能是"去香港从上海出发"这类倒装
+        (dep_code, _, dep_end), (arr_code, arr_start, arr_end) = locations
+        if not _CONNECTOR.search(text[dep_end:arr_start]) or "出发" in text[arr_end:]:
+            return None
+        if self.index.city_code_of(dep_code) == self.index.city_code_of(arr_code):
+            return None
+
+        # 缺日期：按澄清规则询问出发日期（会话中已有日期时可能沿用，交给 LLM）
+        missing = None
+        if not dates:
+            if (current_trip_info or {}).get("dep_date"):
+                return None
+            missing = "dep_date"
+        elif travel_type == "RT" and len(dates) == 1:
+            missing = "return_date"
+
+        if travel_type == "RT":
+            if len(dates) > 2 or (len(dates) == 2 and dates[1] < dates[0]):
+                return None
+            dep_date, return_date = (dates + [None, None])[:2]
+        else:
+            if len(dates) > 1:
+                return None
+            dep_date, return_date = (dates or [None])[0], None
+
+        if current_trip_info and dep_date and (
+            current_trip_info.get("departure_code") == dep_code
+            and current_trip_info.get("arrival_code") == arr_code
+            and current_trip_info.get("dep_date") == dep_date.isoformat()
+        ):
+            # 同一航线的追问（可能只是在改人数/舱位），交给 LLM 结合上下文处理
+            return None
+
+        if passengers.get("PEOPLE"):
+            if len(passengers) > 1:
+                return None
+            passengers = {"ADT": passengers.pop("PEOPLE")}
+        if not passengers.get("ADT") and (passengers.get("CHD") or passengers.get("INF")):
+            return None  # 只有儿童/婴儿，交给 LLM 澄清
+        passenger_list = [
+            {"type": p_type, "count": passengers[p_type]} for p_type in ("ADT", "CHD", "INF") if passengers.get(p_type)
+        ] or [{"type": "ADT", "count": 1}]
+
+        cabin_class, cabin_name = fields.get("cabin", ("Y", "经济舱"))
+        trip_info = {
+            "travel_type": travel_type,
+            "departure_city": self._city_name(dep_code),
+            "departure_code": dep_code,
+            "arrival_city": self._city_name(arr_code),
+            "arrival_code": arr_code,
+            "dep_date": dep_date.isoformat() if dep_date else None,
+            "return_date": return_date.isoformat() if return_date else None,
+            "passengers": passenger_list,
+            "cabin_class": cabin_class,
+            "cabin_name": cabin_name,
+            "airline_code": fields.get("airline"),
+            "flight_no": None,
+            "transfer_cities": None,
+            "channel": fields.get("channel"),
+            "legs": None
+        }
+        if missing:
+            clarify = self._date_clarify(missing, dep_date or today)
+            return {
+                "status": "need_clarify",
+                "trip_info": trip_info,
+                "clarify": clarify,
+                "message": f"好的，{self._route_label(trip_info)}。{clarify['question']}"
+            }
+        return {
+            "status": "complete",
+            "trip_info": trip_info,
+            "clarify": None,
+            "message": self._message(trip_info)
+        }
+
+    def _classify_code(self, code: str) -> tuple:
+        """大写代码：三字码为城市/机场，二字码为航司；航班号等其他代码视为无法识别"""
+        if len(code) == 3 and code in self.index.airport_to_city:
+            return "location", code
+        if len(code) == 2 and code in self.index.airline_names:
+            return "airline", code
+        return "unknown", None
+
+    @staticmethod
+    def _resolve_date(match: re.Match, today: date) -> Optional[date]:
+        try:
+            if match.group("ymd"):
+                value = date(int(match.group("y")), int(match.group("ym")), int(match.group("yd")))
+            elif match.group("md"):
+                # 没说年份默认今年，日期已过则为明年
+                value = date(today.year, int(match.group("m")), int(match.group("d")))
+                if value < today:
+                    value = value.replace(year=today.year + 1)
+            elif match.group("rel"):
+                value = today + timedelta(days=_RELATIVE_DAYS[match.group("rel")])
+            else:
+                weeks = {"下下": 2, "下": 1}.get(match.group("week_prefix"), 0)
+                monday = today - timedelta(days=today.weekday())
+                value = monday + timedelta(weeks=weeks, days=_WEEKDAYS[match.group("weekday")])
+        except ValueError:
+            return None
+        return value if value >= today else None  # 已过去的日期交给 LLM 澄清
+
+    @staticmethod
+    def _passengers(match: re.Match) -> dict:
+        if match.group("adt_chd"):
+            return {"ADT": _to_int(match.group("adt")), "CHD": _to_int(match.group("chd"))}
+        if match.group("pax"):
+            return {PASSENGER_WORDS[match.group("pax_word")]: _to_int(match.group("pax_n"))}
+        return {"PEOPLE": _to_int(match.group("people_n"))}
+
+    def _city_name(self, code: str) -> str:
+        return self.index.city_names.get(self.index.city_code_of(code), "")
+
+    def _place_label(self, code: str) -> str:
+        """城市（不限机场）或 城市+机场简称"""
+        city_code = self.index.city_code_of(code)
+        city = self.index.city_names.get(city_code, code)
+        if self.index.is_specific_airport(code):
+            return f"{city}{re.sub(r'(国际)?机场$', '', self.index.airport_names.get(code, code))}"
+        if len(self.index.airports_of(city_code)) > 1:
+            return f"{city}（不限机场）"
+        return city
+
+    def _route_label(self, trip_info: dict) -> str:
+        return f"{self._place_label(trip_info['departure_code'])}至{self._place_label(trip_info['arrival_code'])}"
+
+    @staticmethod
+    def _date_clarify(field: str, start: date) -> dict:
+        """日期澄清：出发日期从明天起、返程日期从出发后一天起给出两个选项"""
+        first = start + timedelta(days=1)
+        options = [first, first + timedelta(days=1)]
+        if field == "dep_date":
+            question = "请问您想哪天出发？"
+            labels = ["明天", "后天"]
+        else:
+            question = "请问您想哪天返程？"
+            labels = ["出发后一天", "出发后两天"]
+        return {
+            "field": field,
+            "question": question,
+            "options": [
+                {"label": f"{label} ({day.strftime('%m月%d日')})", "value": day.isoformat()}
+                for label, day in zip(labels, options, strict=True)
+            ]
+        }
+
+    def _message(self, trip_info: dict) -> str:
+        parts = [f"{trip_info['dep_date']} {self._route_label(trip_info)}"]
+        if trip_info["return_date"]:
+            parts.append(f"{trip_info['return_date']} 返回")
+        names = {"ADT": "成人", "CHD": "儿童", "INF": "婴儿"}
+        parts.append("".join(f"{p['count']}{names[p['type']]}" for p in trip_info["passengers"]))
+        parts.append(trip_info["cabin_name"])
+        if trip_info["airline_code"]:
+            parts.append(self.index.airline_name(trip_info["airline_code"]) or trip_info["airline_code"])
+        if trip_info["channel"]:
+            parts.append(f"渠道 {self.index.flat_type_names.get(trip_info['channel'], trip_info['channel'])}")
+        return "提取出行信息：" + "，".join(parts)
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {"hits": self.hits, "misses": self.misses, "hit_rate": round(self.hits / total, 4) if total else 0.0}
+
+
+# 全局单例
+rule_intent_parser = RuleIntentParser(reference_index)
@@ -0,0 +1,84 @@
+"""意图解析的结构化输出 schema
+
+由 schemas/chat 的 TripInfo、ClarifyInfo 生成工具调用（Anthropic tools / OpenAI function calling）的参数 schema。
+LLM 输出与会话中的 trip_info 使用扁平的 departure_city/departure_code、arrival_city/arrival_code，
+而 TripInfo 是面向前端的嵌套 AirportInfo，这里把 departure/arrival 展开为扁平字段（描述取自 AirportInfo）。
+所有字段允许 null（信息缺失时由模型填 null），$ref 全部内联，兼容不支持 $defs 的网关。
+"""
+import copy
+
+from app.schemas.chat import AirportInfo, ClarifyInfo, TripInfo
+
+INTENT_TOOL_NAME = "submit_intent"
+INTENT_TOOL_DESCRIPTION = "提交从用户输入中提取的航班搜索参数与澄清问题"
+
+
+def _inline_refs(node, defs: dict):
+    if isinstance(node, dict):
+        if "$ref" in node:
+            return _inline_refs(copy.deepcopy(defs[node["$ref"].rsplit("/", 1)[-1]]), defs)
+        return {key: _inline_refs(value, defs) for key, value in node.items() if key not in ("$defs", "title")}
+    if isinstance(node, list):
+        return [_inline_refs(item, defs) for item in node]
+    return node
+
+
+def _nullable(prop: dict) -> dict:
+    """允许 null；pydantic 对 Optional 已生成 anyOf [..., null]"""
+    if any(option.get("type") == "null" for option in prop.get("anyOf", [])):
+        return prop
+    description = prop.pop("description", None)
+    nullable = {"anyOf": [prop, {"type": "null"}]}
+    if description:
+        nullable["description"] = description
+    return nullable
+
+
+def _model_schema(model) -> dict:
+    schema = model.model_json_schema()
+    return _inline_refs(schema, schema.get("$defs", {}))
+
+
+def build_intent_schema() -> dict:
+    """parse_intent 返回结构 {status, trip_info, clarify, message} 的 JSON schema"""
+    trip_info = _model_schema(TripInfo)
+    airport = _model_schema(AirportInfo)["properties"]
+    properties = {}
+    required = trip_info.get("required", [])
+    for name, prop in trip_info["properties"].items():
+        prop.pop("default", None)
+        if name in ("departure", "arrival"):
+            label = "出发" if name == "departure" else "到达"
+            for field in ("city", "code"):
+                properties[f"{name}_{field}"] = _nullable(
+                    {"type": "string", "description": f"{label}{airport[field]['description']}"}
+                )
+        else:
+            properties[name] = prop if name in required else _nullable(prop)
+
+    clarify = _model_schema(ClarifyInfo)
+    clarify.pop("description", None)
+    return {
+        "type": "object",
+        "properties": {
+            "status": {"type": "string", "enum": ["complete", "need_clarify"], "description": "信息完整为 complete，需要澄清为 need_clarify"},
+            "trip_info": {"type": "object", "properties": properties, "required": ["travel_type"]},
+            "clarify": {"anyOf": [clarify, {"type": "null"}], "description": "需要澄清时的问题，信息完整时为 null"},
+            "message": {"type": "string", "description": "给用户的回复消息"}
+        },
+        "required": ["status", "trip_info", "clarify", "message"]
+    }
+
+
+INTENT_SCHEMA = build_intent_schema()
+
+
+def anthropic_tool() -> dict:
+    return {"name": INTENT_TOOL_NAME, "description": INTENT_TOOL_DESCRIPTION, "input_schema": INTENT_SCHEMA}
+
+
+def openai_tool() -> dict:
+    return {
+        "type": "function",
+        "function": {"name": INTENT_TOOL_NAME, "description": INTENT_TOOL_DESCRIPTION, "parameters": INTENT_SCHEMA}
+    }
@@ -0,0 +1,112 @@
+"""分程搜索结果拼接
+
+往返/缺口程按程分别搜索后，把各程的单程航班拼成完整行程：
+后一程的出发时间必须晚于前一程到达时间加最短衔接时间，总价为各程之和。
+各程航班先按价格取前 K 条，再逐程做束搜索（每步只保留最便宜的 max_results 个组合），
+避免多程时组合数按 K^n 爆炸。
+"""
+from datetime import datetime, timedelta
+from typing import Optional
+
+from app.services.flight_table import time_key, to_int
+
+
+def _parse_time(value: str) -> Optional[datetime]:
+    """航段时间 -> datetime，无法解析时返回 None（不做衔接校验）"""
+    key = time_key(value)
+    if not key:
+        return None
+    try:
+        return datetime.strptime(str(key), "%Y%m%d%H%M")
+    except ValueError:
+        return None
+
+
+def _connects(prev: dict, nxt: dict, min_connection: timedelta) -> bool:
+    """前一程到达后能否赶上后一程"""
+    if not prev.get("segments") or not nxt.get("segments"):
+        return True
+    arrival = _parse_time(prev["segments"][-1].get("arrival", {}).get("time", ""))
+    departure = _parse_time(nxt["segments"][0].get("departure", {}).get("time", ""))
+    if arrival is None or departure is None:
+        return True
+    return departure >= arrival + min_connection
+
+
+def _merge_passenger_prices(legs: list[dict]) -> list[dict]:
+    """按乘客类型累加各程的分乘客价格"""
+    merged: dict[str, dict] = {}
+    for flight in legs:
+        for p in flight.get("price", {}).get("passenger_prices") or []:
+            item = merged.setdefault(p["type"], {"type": p["type"], "count": p["count"], "base": 0, "tax": 0, "total": 0})
+            for field in ("base", "tax", "total"):
+                item[field] += to_int(p.get(field))
+    return [{**p, "base": str(p["base"]), "tax": str(p["tax"]), "total": str(p["total"])} for p in merged.values()]
+
+
+def build_itinerary(legs: list[dict], travel_type: str) -> dict:
+    """把各程航班合并为一个行程（前端航班结构），航段带上所属程序号"""
+    segments = []
+    for leg_no, flight in enumerate(legs, start=1):
+        for seg in flight.get("segments", []):
+            segments.append({**seg, "sequence": len(segments) + 1, "leg": leg_no})
+
+    def total(field: str) -> str:
+        return str(sum(to_int(flight.get("price", {}).get(field)) for flight in legs))
+
+    first = legs[0]
+    return {
+        "id": "+".join(str(flight.get("id", "")) for flight in legs),
+        "type": first.get("type", "INTL_NORMAL"),
+        "travel_type": travel_type,
+        "segments": segments,
+        "is_transfer": any(flight.get("is_transfer") for flight in legs),
+        "cabin_class": first.get("cabin_class", "Y"),
+        "cabin_name": first.get("cabin_name", "经济舱"),
+        "cabin_num": min((flight.get("cabin_num") or "" for flight in legs), key=lambda n: to_int(n) if n else 1 << 30),
+        "price": {
+            "total": total("total"),
+            "base": total("base"),
+            "tax": total("tax"),
+            "currency": first.get("price", {}).get("currency", "CNY"),
+            "passenger_prices": _merge_passenger_prices(legs)
+        },
+        "legs": [{"index": leg_no, "flight_id": flight.get("id", "")} for leg_no, flight in enumerate(legs, start=1)],
+        "services": [],
+        "labels": first.get("labels", [])
+    }
+
+
+def join_legs(
+    leg_flights: list[list[dict]],
+    travel_type: str,
+    max_results: int = 200,
+    min_connection_minutes: int = 60
+) -> list[dict]:
+    """拼接各程航班为行程，按总价升序
+
+    Args:
+        leg_flights: 每一程的候选航班（建议已按价格取前 K 条）
+        travel_type: 行程类型 RT/OJ
+        max_results: 最多返回的行程数（也是束搜索每步保留的组合数）
+        min_connection_minutes: 相邻两程之间的最短衔接时间（分钟）
+    """
+    if not leg_flights or any(not flights for flights in leg_flights):
+        return []
+
+    min_connection = timedelta(minutes=min_connection_minutes)
+    # (总价, 各程航班)
+    beam = [(to_int(f.get("price", {}).get("total")), [f]) for f in leg_flights[0]]
+    beam = sorted(beam, key=lambda item: item[0])[:max_results]
+    for flights in leg_flights[1:]:
+        candidates = [
+            (price + to_int(f.get("price", {}).get("total")), combo + [f])
+            for price, combo in beam
+            for f in flights
+            if _connects(combo[-1], f, min_connection)
+        ]
+        beam = sorted(candidates, key=lambda item: item[0])[:max_results]
+        if not beam:
+            return []
+
+    return [build_itinerary(combo, travel_type) for _, combo in beam]
@@ -1,46 +1,26 @@
 """LLM 服务 - 使用 Anthropic 接口进行意图解析"""
+import asyncio
+import copy
+import hashlib
 import json
 import os
 import re
-from datetime import datetime, timedelta
+import time
+from contextlib import aclosing
+from datetime import date, datetime, timedelta
 import anthropic
+from app.core import json_codec
+from app.core.admission import AdmissionRejectedError, admission
+from app.core.cache import SingleFlight, TTLCache
 from app.core.config import settings
+from app.core.json_stream import PartialJsonParser
+from app.core.persistent_cache import SQLiteCache
+from app.services.intent_schema import INTENT_TOOL_NAME, anthropic_tool, openai_tool
+from app.services.prompt_assembler import prompt_assembler
 
-# 加载城市映射数据
-import os
-DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(__file__)), "data")
-
-def load_city_mapping():
-    """加载城市映射数据"""
-    with open(os.path.join(DATA_DIR, "city_mapping.json"), "r", encoding="utf-8") as f:
-        return json.load(f)
-
-CITY_DATA = load_city_mapping()
-
-def load_flat_type():
-    """加载flatType映射数据"""
-    with open(os.path.join(DATA_DIR, "flatType.json"), "r", encoding="utf-8") as f:
-        return json.load(f)
-
-FLAT_TYPE_DATA = load_flat_type()
-
-# 构建flatType参考
-FLAT_TYPE_REFERENCE = "\n".join([
-    f"- {category['name']}: " + "，".join([f"{item['text']}({item['value']})" for item in category['values']])
-    for category in FLAT_TYPE_DATA
-])
-
-# 构建城市代码参考
-CITY_CODE_REFERENCE = "\n".join([
-    f"- {city['city_name']}: " + "/".join([f"{a['code']}({a['name']})" for a in city['airports']])
-    for city in CITY_DATA["cities"]
-])
-
-AIRLINE_REFERENCE = "\n".join([
-    f"- {a['code']}: {a['name']}" for a in CITY_DATA["airlines"]
-])
-
-SYSTEM_PROMPT = f"""你是航班搜索助手，负责从用户输入中提取搜索参数，并判断信息是否完整。
+# 静态前缀：规则、输出格式与示例。示例日期固定按 2026-02-22 计算，整段逐字节不变，
+# 可被 Anthropic cache_control 及 OpenAI 兼容接口的前缀缓存命中
+STATIC_PROMPT = """你是航班搜索助手，负责从用户输入中提取搜索参数，并判断信息是否完整。
 
 ## 任务
 1. 从用户输入中提取航班搜索参数
@@ -50,7 +30,7 @@ SYSTEM_PROMPT = f"""你是航班搜索助手，负责从用户输入中提取搜
 ## 需要提取的参数
 
 ### 必填参数（缺失时必须询问）
-- travel_type: 行程类型 (OW=单程, RT=往返)，默认 OW
+- travel_type: 行程类型 (OW=单程, RT=往返, OJ=缺口程/多程)，默认 OW
 - departure_city: 出发城市名称
 - departure_code: 出发机场三字码
 - arrival_city: 到达城市名称
@@ -60,14 +40,18 @@ SYSTEM_PROMPT = f"""你是航班搜索助手，负责从用户输入中提取搜
 ### 往返必填
 - return_date: 返程日期 (yyyy-MM-dd 格式，往返时必填)
 
+### 缺口程必填
+- legs: 缺口程（如"先飞东京再从大阪飞回上海"）按顺序列出每一程 [{"departure_city", "departure_code", "arrival_city", "arrival_code", "dep_date"}]；
+  departure_*/arrival_*/dep_date 同时填写第一程的出发地、最后一程的目的地和第一程日期
+
 ### 可选参数（使用默认值，不询问）
-- passengers: 乘客信息，默认 [{{"type": "ADT", "count": 1}}]
+- passengers: 乘客信息，默认 [{"type": "ADT", "count": 1}]
   - type: ADT=成人, CHD=儿童, INF=婴儿
 - cabin_class: 舱位等级 (Y=经济舱, S=超值经济舱, C=公务舱, F=头等舱)，默认 Y
 - airline_code: 指定航司二字码
 - flight_no: 指定航班号，支持用 "/" 分割表示中转航班（如 "MU5001/MU5002"）
 - transfer_cities: 中转城市三字码列表（如用户说"经曼谷中转"则为 ["BKK"]）
-- channel: 查询渠道(flatType)，从下方的查询渠道参考中提取代码，默认 null
+- channel: 查询渠道(flatType)，从查询渠道参考中提取代码，默认 null
 
 ## 中转航班说明
 - 用户可以通过航班号中的 "/" 来表示中转航班
@@ -75,28 +59,12 @@ SYSTEM_PROMPT = f"""你是航班搜索助手，负责从用户输入中提取搜
 - 例如：CZ3001/CZ3002/CZ3003 表示三段中转（两次中转）
 - 用户说"经XX中转"、"在XX转机"时，提取中转城市到 transfer_cities
 - **重要**：如果用户明确要求 N 次中转，但未说明具体经停城市（例如"转两次机"），必须将 `status` 设为 `need_clarify` 并通过 `clarify` 询问用户想要在哪些城市中转。
-- **特例（自动选取）**：只有当用户明确表示对中转城市"随意"、"随便"或"都可以"时，才直接从下方的城市代码参考中随机选取 N 个**不同于出发地和目的地**的城市三字码填入 `transfer_cities` 列表中，不再询问。
+- **特例（自动选取）**：只有当用户明确表示对中转城市"随意"、"随便"或"都可以"时，才直接从城市/机场代码参考中随机选取 N 个**不同于出发地和目的地**的城市三字码填入 `transfer_cities` 列表中，不再询问。
 - 用户未提及中转默认直飞
 
 ## 上下文处理规则
 - **重要**：如果用户发起了全新的航线搜索（例如出发地、目的地或日期发生了根本性变化），此时应该将乘客数量、舱位等信息**重置为默认值**（如 1成人），除非用户在新的请求中再次明确指定。
 
-## 城市/机场代码参考
-{CITY_CODE_REFERENCE}
-
-## 航司代码参考
-{AIRLINE_REFERENCE}
-
-## 查询渠道参考
-{FLAT_TYPE_REFERENCE}
-
-## 日期处理规则
-- 今天是 {datetime.now().strftime('%Y-%m-%d')}（星期{['一','二','三','四','五','六','日'][datetime.now().weekday()]}）
-- 如果用户说"明天"，转换为 {(datetime.now() + timedelta(days=1)).strftime('%Y-%m-%d')}
-- 如果用户说"后天"，转换为 {(datetime.now() + timedelta(days=2)).strftime('%Y-%m-%d')}
-- 如果用户说"下周X"，计算具体日期
-- 如果用户说"X月X日"但没说年份，默认今年，如果日期已过则为明年
-
 ## 澄清规则（按优先级逐项确认）
 1. **意图不明确**：如果用户只说"查机票"、"帮我订票"等模糊表述，没有任何航线信息，询问具体航线
 2. **出发地缺失**：询问从哪里出发
@@ -115,45 +83,47 @@ SYSTEM_PROMPT = f"""你是航班搜索助手，负责从用户输入中提取搜
 必须严格输出以下 JSON 格式（不要有其他内容）：
 
 ```json
-{{
+{
   "status": "complete" | "need_clarify",
-  "trip_info": {{
-    "travel_type": "OW" | "RT",
+  "trip_info": {
+    "travel_type": "OW" | "RT" | "OJ",
     "departure_city": "城市名",
     "departure_code": "三字码",
     "arrival_city": "城市名", 
     "arrival_code": "三字码",
     "dep_date": "yyyy-MM-dd",
     "return_date": "yyyy-MM-dd 或 null",
-    "passengers": [{{"type": "ADT", "count": 1}}],
+    "passengers": [{"type": "ADT", "count": 1}],
     "cabin_class": "Y",
     "cabin_name": "经济舱",
     "airline_code": "MU 或 null",
     "flight_no": "MU5101 或 MU5001/MU5002（中转）或 null",
     "transfer_cities": ["BKK"] 或 null,
-    "channel": "WX 或 null"
-  }},
-  "clarify": {{
+    "channel": "WX 或 null",
+    "legs": [{"departure_city": "城市名", "departure_code": "三字码", "arrival_city": "城市名", "arrival_code": "三字码", "dep_date": "yyyy-MM-dd"}] 或 null
+  },
+  "clarify": {
     "field": "需要澄清的字段名",
     "question": "向用户提问的问题",
     "options": [
-      {{"label": "显示文本", "value": "选项值"}},
+      {"label": "显示文本", "value": "选项值"},
       ...
     ]
-  }} 或 null,
+  } 或 null,
   "message": "给用户的回复消息"
-}}
+}
 ```
 
 ## 示例
+以下示例中的日期均按今天是 2026-02-22（星期日）计算，仅用于说明格式；实际日期以最后的「日期处理规则」为准。
 
 ### 示例1：意图模糊
 用户: 帮我查机票
 输出:
 ```json
-{{
+{
   "status": "need_clarify",
-  "trip_info": {{
+  "trip_info": {
     "travel_type": "OW",
     "departure_city": null,
     "departure_code": null,
@@ -161,30 +131,30 @@ SYSTEM_PROMPT = f"""你是航班搜索助手，负责从用户输入中提取搜
     "arrival_code": null,
     "dep_date": null,
     "return_date": null,
-    "passengers": [{{"type": "ADT", "count": 1}}],
+    "passengers": [{"type": "ADT", "count": 1}],
     "cabin_class": "Y",
     "cabin_name": "经济舱",
     "airline_code": null,
     "flight_no": null,
     "transfer_cities": null,
     "channel": null
-  }},
-  "clarify": {{
+  },
+  "clarify": {
     "field": "route",
     "question": "请告诉我您想查询的航线，从哪里出发到哪里？",
     "options": []
-  }},
+  },
   "message": "好的，请告诉我您想从哪里出发，要去哪里呢？"
-}}
+}
 ```
 
 ### 示例2：缺少日期
 用户: 上海到香港
 输出:
 ```json
-{{
+{
   "status": "need_clarify",
-  "trip_info": {{
+  "trip_info": {
     "travel_type": "OW",
     "departure_city": "上海",
     "departure_code": null,
@@ -192,199 +162,277 @@ SYSTEM_PROMPT = f"""你是航班搜索助手，负责从用户输入中提取搜
     "arrival_code": "HKG",
     "dep_date": null,
     "return_date": null,
-    "passengers": [{{"type": "ADT", "count": 1}}],
+    "passengers": [{"type": "ADT", "count": 1}],
     "cabin_class": "Y",
     "cabin_name": "经济舱",
     "airline_code": null,
     "flight_no": null,
     "transfer_cities": null,
     "channel": null
-  }},
-  "clarify": {{
+  },
+  "clarify": {
     "field": "dep_date",
     "question": "请问您想哪天出发？",
     "options": [
-      {{"label": "明天 ({(datetime.now() + timedelta(days=1)).strftime('%m月%d日')})", "value": "{(datetime.now() + timedelta(days=1)).strftime('%Y-%m-%d')}"}},
-      {{"label": "后天 ({(datetime.now() + timedelta(days=2)).strftime('%m月%d日')})", "value": "{(datetime.now() + timedelta(days=2)).strftime('%Y-%m-%d')}"}}
+      {"label": "明天 (02月23日)", "value": "2026-02-23"},
+      {"label": "后天 (02月24日)", "value": "2026-02-24"}
     ]
-  }},
+  },
   "message": "好的，上海到香港。请问您想哪天出发？"
-}}
+}
 ```
 
 ### 示例3：多机场城市（不限机场）
 用户: 明天上海到香港
 输出:
 ```json
-{{
+{
   "status": "complete",
-  "trip_info": {{
+  "trip_info": {
     "travel_type": "OW",
     "departure_city": "上海",
     "departure_code": "SHA",
     "arrival_city": "香港",
     "arrival_code": "HKG",
-    "dep_date": "{(datetime.now() + timedelta(days=1)).strftime('%Y-%m-%d')}",
+    "dep_date": "2026-02-23",
     "return_date": null,
-    "passengers": [{{"type": "ADT", "count": 1}}],
+    "passengers": [{"type": "ADT", "count": 1}],
     "cabin_class": "Y",
     "cabin_name": "经济舱",
     "airline_code": null,
     "flight_no": null,
     "transfer_cities": null,
     "channel": null
-  }},
+  },
   "clarify": null,
   "message": "提取出行信息：明天上海至香港（不限机场）"
-}}
+}
 ```
 
 ### 示例4：信息完整及多乘客类型
-用户: 2月15号从上海浦东到香港，2个大人1个小孩1个婴儿
+用户: 3月15号从上海浦东到香港，2个大人1个小孩1个婴儿
 输出:
 ```json
-{{
+{
   "status": "complete",
-  "trip_info": {{
+  "trip_info": {
     "travel_type": "OW",
     "departure_city": "上海",
     "departure_code": "PVG",
     "arrival_city": "香港",
     "arrival_code": "HKG",
-    "dep_date": "2026-02-15",
+    "dep_date": "2026-03-15",
     "return_date": null,
-    "passengers": [{{"type": "ADT", "count": 2}}, {{"type": "CHD", "count": 1}}, {{"type": "INF", "count": 1}}],
+    "passengers": [{"type": "ADT", "count": 2}, {"type": "CHD", "count": 1}, {"type": "INF", "count": 1}],
     "cabin_class": "Y",
     "cabin_name": "经济舱",
     "airline_code": null,
     "flight_no": null,
     "transfer_cities": null,
     "channel": null
-  }},
+  },
   "clarify": null,
-  "message": "提取出行信息：2月15日上海浦东至香港，2成人1儿童1婴儿"
-}}
+  "message": "提取出行信息：3月15日上海浦东至香港，2成人1儿童1婴儿"
+}
 ```
 
 ### 示例5：中转航班
 用户: 查一下MU5001/MU5002，上海到新加坡，经曼谷中转，明天的
 输出:
 ```json
-{{
+{
   "status": "complete",
-  "trip_info": {{
+  "trip_info": {
     "travel_type": "OW",
     "departure_city": "上海",
     "departure_code": "SHA",
     "arrival_city": "新加坡",
     "arrival_code": "SIN",
-    "dep_date": "{(datetime.now() + timedelta(days=1)).strftime('%Y-%m-%d')}",
+    "dep_date": "2026-02-23",
     "return_date": null,
-    "passengers": [{{"type": "ADT", "count": 1}}],
+    "passengers": [{"type": "ADT", "count": 1}],
     "cabin_class": "Y",
     "cabin_name": "经济舱",
     "airline_code": "MU",
     "flight_no": "MU5001/MU5002",
     "transfer_cities": ["BKK"],
     "channel": null
-  }},
+  },
   "clarify": null,
   "message": "提取出行信息：明天 MU5001/MU5002 中转航班，上海至新加坡（经曼谷中转）"
-}}
+}
 ```
 ### 示例6：中转未明确城市，需要澄清
 用户: 我要下周三从上海去巴黎的往返，去程要求转两次机
 输出:
 ```json
-{{
+{
   "status": "need_clarify",
-  "trip_info": {{
+  "trip_info": {
     "travel_type": "RT",
     "departure_city": "上海",
     "departure_code": "SHA",
     "arrival_city": "巴黎",
     "arrival_code": "PAR",
-    "dep_date": "{(datetime.now() + timedelta(days=7 - datetime.now().weekday() + 2 if datetime.now().weekday() <= 2 else 14 - datetime.now().weekday() + 2)).strftime('%Y-%m-%d')}",
+    "dep_date": "2026-02-25",
     "return_date": null,
-    "passengers": [{{"type": "ADT", "count": 1}}],
+    "passengers": [{"type": "ADT", "count": 1}],
     "cabin_class": "Y",
     "cabin_name": "经济舱",
     "airline_code": null,
     "flight_no": null,
     "transfer_cities": null,
     "channel": null
-  }},
-  "clarify": {{
+  },
+  "clarify": {
     "field": "transfer_cities",
     "question": "请问您希望在哪些城市中转？（如果您没有特别要求，可以说“随意”由我为您随机安排）",
     "options": []
-  }},
+  },
   "message": "提取出行信息：下周三上海至巴黎的往返航班，去程要求两次中转。请问您希望在这两个航段分别在哪些城市中转？如果您没有特别要求，可以说“随意”。"
-}}
+}
 ```
 
 ### 示例7：中转未明确城市但表示随意（自动分配）
 用户: 只要中转两次，城市随便
 输出:
 ```json
-{{
+{
   "status": "complete",
-  "trip_info": {{
+  "trip_info": {
     "travel_type": "RT",
     "departure_city": "上海",
     "departure_code": "SHA",
     "arrival_city": "巴黎",
     "arrival_code": "PAR",
-    "dep_date": "{(datetime.now() + timedelta(days=7 - datetime.now().weekday() + 2 if datetime.now().weekday() <= 2 else 14 - datetime.now().weekday() + 2)).strftime('%Y-%m-%d')}",
+    "dep_date": "2026-02-25",
     "return_date": null,
-    "passengers": [{{"type": "ADT", "count": 1}}],
+    "passengers": [{"type": "ADT", "count": 1}],
     "cabin_class": "Y",
     "cabin_name": "经济舱",
     "airline_code": null,
     "flight_no": null,
     "transfer_cities": ["BKK", "SIN"],
     "channel": null
-  }},
-  "clarify": {{
+  },
+  "clarify": {
     "field": "return_date",
     "question": "请问您想哪天从巴黎返回？",
     "options": []
-  }},
+  },
   "message": "好的，已经为您随机分配了曼谷和新加坡作为中转点。另外，请问您想哪天返回呢？"
-}}
+}
 ```
 
 ### 示例8：往返航班
 用户: 查一下下周三从北京去上海然后再回到北京的往返航班
 输出:
 ```json
-{{
+{
   "status": "complete",
-  "trip_info": {{
+  "trip_info": {
     "travel_type": "RT",
     "departure_city": "北京",
     "departure_code": "BJS",
     "arrival_city": "上海",
     "arrival_code": "SHA",
-    "dep_date": "{(datetime.now() + timedelta(days=7 - datetime.now().weekday() + 2 if datetime.now().weekday() <= 2 else 14 - datetime.now().weekday() + 2)).strftime('%Y-%m-%d')}",
+    "dep_date": "2026-02-25",
     "return_date": null,
-    "passengers": [{{"type": "ADT", "count": 1}}],
+    "passengers": [{"type": "ADT", "count": 1}],
     "cabin_class": "Y",
     "cabin_name": "经济舱",
     "airline_code": null,
     "flight_no": null,
     "transfer_cities": null,
     "channel": null
-  }},
-  "clarify": {{
+  },
+  "clarify": {
     "field": "return_date",
     "question": "请问您想哪天返回北京？",
     "options": []
-  }},
+  },
   "message": "提取出行信息：下周三北京至上海的往返航班，请问您想哪天返回？"
-}}
-```
-"""
+}
+```"""
+
+WEEKDAY_NAMES = "一二三四五六日"
+
+
+def build_reference_prompt(city_reference: str, airline_reference: str, flat_type_reference: str) -> str:
+    """参考表段落：完整表或按对话裁剪后的表"""
+    return f"""## 城市/机场代码参考
+{city_reference}
+
+## 航司代码参考
+{airline_reference}
+
+## 查询渠道参考
+{flat_type_reference}"""
+
+
+def build_date_prompt(today: date = None) -> str:
+    """动态日期段落，每次调用按当天计算"""
+    today = today or date.today()
+    monday = today - timedelta(days=today.weekday())
+    next_week = "，".join(
+        f"周{WEEKDAY_NAMES[i]} {(monday + timedelta(weeks=1, days=i)).isoformat()}" for i in range(7)
+    )
+    return f"""## 日期处理规则
+- 今天是 {today.isoformat()}（星期{WEEKDAY_NAMES[today.weekday()]}）
+- 如果用户说"明天"，转换为 {(today + timedelta(days=1)).isoformat()}
+- 如果用户说"后天"，转换为 {(today + timedelta(days=2)).isoformat()}
+- 如果用户说"大后天"，转换为 {(today + timedelta(days=3)).isoformat()}
+- 如果用户说"下周X"，下周各天为：{next_week}
+- 如果用户说"X月X日"但没说年份，默认今年，如果日期已过则为明年"""
+
+
+def build_system_prompt(city_reference: str, airline_reference: str, flat_type_reference: str, today: date = None) -> str:
+    """完整系统提示词：静态前缀 + 参考表 + 当天日期（与 LLMService.system_blocks 拼接结果一致）"""
+    return "\n\n".join([
+        STATIC_PROMPT,
+        build_reference_prompt(city_reference, airline_reference, flat_type_reference),
+        build_date_prompt(today)
+    ])
+
+
+TOOL_OUTPUT_PROMPT = f"""## 输出方式
+调用 {INTENT_TOOL_NAME} 工具提交结果，参数结构与上面的 JSON 输出格式相同，不要输出其他文字。"""
+
+
+def output_mode() -> str:
+    """意图解析的输出模式：text（文本中提取 JSON）或 tool（工具调用/结构化输出）"""
+    return "tool" if settings.LLM_OUTPUT_MODE == "tool" else "text"
+
+
+def join_blocks(blocks: list) -> str:
+    return "\n\n".join(block["text"] for block in blocks)
+
+
+def _token_count(usage, name: str) -> int:
+    """读取用量字段；接口未返回或不是整数（兼容网关、测试替身）时按 0 计"""
+    value = getattr(usage, name, None)
+    return value if isinstance(value, int) and not isinstance(value, bool) else 0
+
+
+class _IntentBroadcast:
+    """一次流式解析的进度广播
+
+    订阅方按顺序读取 events。progress 事件是累计快照（已生成的全部字段和文本），
+    中途加入的订阅方从最新一条开始即可，不必重放之前的进度。
+    """
+
+    def __init__(self):
+        self.events = []
+        self.changed = asyncio.get_running_loop().create_future()
+
+    def start(self) -> int:
+        """订阅方开始读取的位置"""
+        return max(len(self.events) - 1, 0)
+
+    def publish(self, event: dict):
+        self.events.append(event)
+        self.changed.set_result(None)
+        self.changed = asyncio.get_running_loop().create_future()
 
 
 class LLMService:
@@ -430,78 +478,527 @@ class LLMService:
         self.model = model
         print(f"[LLMService] protocol={self.protocol}, model={self.model}, url={base_url}")
 
+        # 意图解析结果缓存：内存 LRU + 可选 SQLite 持久层，相同输入的并发解析合并为一次调用
+        self.cache = TTLCache(maxsize=settings.LLM_CACHE_MAX_SIZE, ttl=settings.LLM_CACHE_TTL)
+        self.disk_cache = SQLiteCache(settings.LLM_CACHE_DB_PATH, ttl=settings.LLM_CACHE_TTL) \
+            if settings.LLM_CACHE_ENABLED and settings.LLM_CACHE_DB_PATH else None
+        self._inflight = SingleFlight()
+        self._broadcasts: dict[str, _IntentBroadcast] = {}  # 进行中的流式解析，key 同 _inflight
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.cache_misses = 0
+        self.saved_seconds = 0.0  # 命中缓存省下的 LLM 调用耗时
+
+        # 每次调用的 token 用量（含服务端提示词缓存的读/写）
+        self.llm_calls = 0
+        self.usage_totals = {"input_tokens": 0, "cache_read_tokens": 0, "cache_write_tokens": 0, "output_tokens": 0}
+        self.last_usage = None
+        self.output_modes = {mode: {"turns": 0, "parse_failures": 0, "output_tokens": 0} for mode in ("text", "tool")}
+
+    def cache_key(self, user_message: str, history: list = None, current_trip_info: dict = None) -> str:
+        """意图缓存键：用户消息、已收集信息、最近历史、当天日期（相对日期依赖它）、协议和模型的规范化哈希"""
+        recent = [
+            {"role": msg["role"], "content": msg.get("content", "")}
+            for msg in (history or [])[-6:] if msg.get("role") in ("user", "assistant")
+        ]
+        payload = {
+            "message": user_message,
+            "trip_info": current_trip_info or None,
+            "history": recent,
+            "date": datetime.now().strftime('%Y-%m-%d'),
+            "protocol": self.protocol,
+            "model": self.model,
+            "prompt_trim": settings.LLM_PROMPT_TRIM,
+            "output_mode": output_mode()
+        }
+        canonical = json.dumps(payload, ensure_ascii=False, sort_keys=True, separators=(",", ":"), default=str)
+        return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
     async def parse_intent(
         self,
         user_message: str,
         history: list = None,
         current_trip_info: dict = None
+    ) -> dict:
+        """解析用户意图，优先读取缓存；返回副本，调用方可以随意修改"""
+        if not settings.LLM_CACHE_ENABLED:
+            return await self._parse_intent(user_message, history, current_trip_info)
+
+        key = self.cache_key(user_message, history, current_trip_info)
+        entry = await self._cache_lookup(key, user_message)
+        if entry is None:
+            self.cache_misses += 1
+            entry = await self._inflight.do(key, lambda: self._parse_and_store(key, user_message, history, current_trip_info))
+        return copy.deepcopy(entry["result"])
+
+    async def parse_intent_stream(
+        self,
+        user_message: str,
+        history: list = None,
+        current_trip_info: dict = None
+    ):
+        """流式解析用户意图
+
+        生成过程中产出 {"type": "progress", "status", "message": 已生成的回复文本, "trip_info": 已识别的字段,
+        "trip_info_complete": trip_info 是否已完整生成}，
+        最后产出 {"type": "result", "result": 与 parse_intent 相同的结构}。命中缓存时只产出 result。
+        相同输入的并发解析只调用一次 LLM：第一个调用方发起流式调用，其余调用方共享它的进度和结果。
+        """
+        if not settings.LLM_CACHE_ENABLED:
+            async with aclosing(self._stream_intent(user_message, history, current_trip_info)) as events:
+                async for event in events:
+                    yield event
+            return
+
+        key = self.cache_key(user_message, history, current_trip_info)
+        entry = await self._cache_lookup(key, user_message)
+        if entry is None:
+            self.cache_misses += 1
+            broadcast = self._broadcasts.setdefault(key, _IntentBroadcast())
+            call = asyncio.ensure_future(self._inflight.do(
+                key, lambda: self._stream_and_store(key, broadcast, user_message, history, current_trip_info)
+            ))
+            seen = broadcast.start()
+            try:
+                while True:
+                    if seen < len(broadcast.events):
+                        seen += 1
+                        yield copy.deepcopy(broadcast.events[seen - 1])
+                    elif call.done():
+                        break
+                    else:
+                        await asyncio.wait({call, broadcast.changed}, return_when=asyncio.FIRST_COMPLETED)
+                entry = call.result()
+            finally:
+                # 提前关闭时退出等待；最后一个等待方离开后 SingleFlight 取消 LLM 调用
+                call.cancel()
+                # 同 key 的非流式解析正在进行时，没有发布方清理广播
+                if not self._inflight.in_flight(key) and self._broadcasts.get(key) is broadcast:
+                    del self._broadcasts[key]
+        yield {"type": "result", "result": copy.deepcopy(entry["result"])}
+
+    async def _cache_lookup(self, key: str, user_message: str):
+        """依次查内存缓存和 SQLite 持久层，命中时累计省下的耗时"""
+        entry = self.cache.get(key)
+        if entry is not None:
+            self.memory_hits += 1
+        elif self.disk_cache is not None:
+            entry = await asyncio.to_thread(self.disk_cache.get, key)
+            if entry is not None:
+                self.disk_hits += 1
+                self.cache.set(key, entry)
+        if entry is not None:
+            self.saved_seconds += entry["latency"]
+            if settings.DEBUG:
+                print(f"[LLM] 意图缓存命中: {user_message}")
+        return entry
+
+    async def _cache_store(self, key: str, entry: dict):
+        """成功的解析结果写入缓存（错误结果不缓存）"""
+        if entry["result"].get("status") == "error":
+            return
+        self.cache.set(key, entry)
+        if self.disk_cache is not None:
+            try:
+                await asyncio.to_thread(self.disk_cache.set, key, entry)
+            except Exception as e:
+                print(f"[LLM] 意图缓存持久化失败: {e}")
+
+    async def _parse_and_store(self, key: str, user_message: str, history: list, current_trip_info: dict) -> dict:
+        """实际调用 LLM 并写入缓存"""
+        start = time.monotonic()
+        result = await self._parse_intent(user_message, history, current_trip_info)
+        entry = {"result": result, "latency": round(time.monotonic() - start, 3)}
+        await self._cache_store(key, entry)
+        return entry
+
+    async def _stream_and_store(
+        self, key: str, broadcast: _IntentBroadcast, user_message: str, history: list, current_trip_info: dict
+    ) -> dict:
+        """流式调用 LLM，把进度广播给所有等待方，结束后写入缓存"""
+        start = time.monotonic()
+        result = None
+        try:
+            async with aclosing(self._stream_intent(user_message, history, current_trip_info)) as events:
+                async for event in events:
+                    if event["type"] == "result":
+                        result = event["result"]
+                    else:
+                        broadcast.publish(event)
+        finally:
+            if self._broadcasts.get(key) is broadcast:
+                del self._broadcasts[key]
+        entry = {"result": result, "latency": round(time.monotonic() - start, 3)}
+        await self._cache_store(key, entry)
+        return entry
+
+    def cache_stats(self) -> dict:
+        hits = self.memory_hits + self.disk_hits
+        total = hits + self.cache_misses
+        return {
+            "enabled": settings.LLM_CACHE_ENABLED,
+            "size": len(self.cache),
+            "disk_size": len(self.disk_cache) if self.disk_cache is not None else None,
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.cache_misses,
+            "shared": self._inflight.shared,
+            "hit_rate": round(hits / total, 4) if total else 0.0,
+            "saved_seconds": round(self.saved_seconds, 3)
+        }
+
+    async def _parse_intent(
+        self,
+        user_message: str,
+        history: list = None,
+        current_trip_info: dict = None
     ) -> dict:
         """解析用户意图（根据协议分支调用不同 SDK）"""
-        current_context = ""
-        if current_trip_info:
-            current_context = f"\n\n当前已收集的信息：{json.dumps(current_trip_info, ensure_ascii=False)}\n请基于已有信息继续补充。"
-        user_content = f"{user_message}{current_context}"
+        mode = output_mode()
+        user_content = self._user_content(user_message, current_trip_info)
+        system_blocks = self.system_blocks(user_message, history, current_trip_info)
+        usage = {}
 
         try:
-            if self.protocol == "anthropic":
-                content = await self._call_anthropic(user_content, history)
-            else:
-                content = await self._call_openai(user_content, history)
+            async with admission.slot("llm"):
+                if self.protocol == "anthropic":
+                    content = await self._call_anthropic(system_blocks, user_content, history, mode, usage)
+                else:
+                    content = await self._call_openai(join_blocks(system_blocks), user_content, history, mode, usage)
 
-            return self._extract_json(content)
+            result = self._extract_json(content)
+            self._record_turn(mode, result, usage)
+            return result
 
+        except AdmissionRejectedError as e:
+            return self._overloaded_result(e, current_trip_info)
         except Exception as e:
-            import traceback
-            print(f"DEBUG: LLM Parse Intent failed for message: {user_message}")
-            print(f"DEBUG: Error details: {str(e)}")
-            traceback.print_exc()
-            return {
-                "status": "error",
-                "message": f"解析失败: {str(e)}",
-                "trip_info": current_trip_info,
-                "clarify": None
-            }
+            return self._failed_result(e, user_message, current_trip_info)
 
-    async def _call_anthropic(self, user_content: str, history: list) -> str:
-        """调用 Anthropic 原生协议（内网 oneai）"""
+    async def _stream_intent(self, user_message: str, history: list, current_trip_info: dict):
+        """流式调用 LLM，边接收边增量解析 JSON
+
+        trip_info 的字段（以及整个 trip_info 对象）完整生成后立即产出一次 progress；
+        message 文本按 LLM_STREAM_EVENT_INTERVAL 节流产出。
+        最终结果仍对完整文本调用 _extract_json，增量解析只用于展示进度。
+        工具调用模式下增量到达的是工具参数 JSON，解析方式相同。
+        """
+        mode = output_mode()
+        usage = {}
+        user_content = self._user_content(user_message, current_trip_info)
+        system_blocks = self.system_blocks(user_message, history, current_trip_info)
+        parser = PartialJsonParser()
+        chunks = []
+        trip_info = {}
+        trip_info_complete = False
+        status = None
+        message = ""
+        emitted_message = ""
+        last_emit = 0.0
+
+        try:
+            async with admission.slot("llm"):
+                if self.protocol == "anthropic":
+                    deltas = self._stream_anthropic(system_blocks, user_content, history, mode, usage)
+                else:
+                    deltas = self._stream_openai(join_blocks(system_blocks), user_content, history, mode, usage)
+                async for delta in deltas:
+                    chunks.append(delta)
+                    fields_changed = False
+                    for path, value in parser.feed(delta):
+                        if len(path) == 2 and path[0] == "trip_info" and value is not None:
+                            trip_info[path[1]] = value
+                            fields_changed = True
+                        elif path == ("trip_info",):
+                            trip_info_complete = fields_changed = True
+                        elif path == ("status",):
+                            status = value
+                        elif path == ("message",) and isinstance(value, str):
+                            message = value
+                    partial = parser.partial_string()
+                    if partial and partial[0] == ("message",):
+                        message = partial[1]
+                    now = time.monotonic()
+                    if fields_changed or (
+                        message != emitted_message and now - last_emit >= settings.LLM_STREAM_EVENT_INTERVAL
+                    ):
+                        yield {
+                            "type": "progress",
+                            "status": status,
+                            "message": message,
+                            "trip_info": dict(trip_info),
+                            "trip_info_complete": trip_info_complete
+                        }
+                        emitted_message = message
+                        last_emit = now
+            result = self._extract_json("".join(chunks))
+            self._record_turn(mode, result, usage)
+        except AdmissionRejectedError as e:
+            result = self._overloaded_result(e, current_trip_info)
+        except Exception as e:
+            result = self._failed_result(e, user_message, current_trip_info)
+        yield {"type": "result", "result": result}
+
+    @staticmethod
+    def _user_content(user_message: str, current_trip_info: dict) -> str:
+        current_context = ""
+        if current_trip_info:
+            current_context = f"\n\n当前已收集的信息：{json_codec.dumps_str(current_trip_info)}\n请基于已有信息继续补充。"
+        return f"{user_message}{current_context}"
+
+    @staticmethod
+    def _build_messages(user_content: str, history: list) -> list:
         messages = []
         if history:
             for msg in history[-6:]:
                 if msg.get("role") in ("user", "assistant"):
                     messages.append({"role": msg["role"], "content": msg.get("content", "")})
         messages.append({"role": "user", "content": user_content})
+        return messages
+
+    @staticmethod
+    def _overloaded_result(e: AdmissionRejectedError, current_trip_info: dict) -> dict:
+        print(f"[LLM] 准入拒绝: {e}")
+        return {
+            "status": "error",
+            "code": "OVERLOADED",
+            "message": str(e),
+            "trip_info": current_trip_info,
+            "clarify": None
+        }
+
+    @staticmethod
+    def _failed_result(e: Exception, user_message: str, current_trip_info: dict) -> dict:
+        import traceback
+        print(f"DEBUG: LLM Parse Intent failed for message: {user_message}")
+        print(f"DEBUG: Error details: {str(e)}")
+        traceback.print_exc()
+        return {
+            "status": "error",
+            "message": f"解析失败: {str(e)}",
+            "trip_info": current_trip_info,
+            "clarify": None
+        }
+
+    @staticmethod
+    def system_blocks(user_message: str, history: list = None, current_trip_info: dict = None) -> list:
+        """系统提示词分段（Anthropic system 块格式）：静态前缀 + 参考表 + 当天日期
 
+        静态前缀始终标记 cache_control；完整参考表同样不随对话变化，一并标记，
+        裁剪后的参考表和日期每次不同，放在缓存断点之后。
+        """
+        if settings.LLM_PROMPT_TRIM:
+            references = build_reference_prompt(**prompt_assembler.references(user_message, current_trip_info, history))
+        else:
+            references = build_reference_prompt(
+                prompt_assembler.full_city_reference,
+                prompt_assembler.full_airline_reference,
+                prompt_assembler.full_flat_type_reference
+            )
+        blocks = [
+            {"type": "text", "text": STATIC_PROMPT},
+            {"type": "text", "text": references},
+            {"type": "text", "text": build_date_prompt()}
+        ]
+        if output_mode() == "tool":
+            blocks.append({"type": "text", "text": TOOL_OUTPUT_PROMPT})
+        if settings.LLM_PROMPT_CACHE:
+            blocks[0]["cache_control"] = {"type": "ephemeral"}
+            if not settings.LLM_PROMPT_TRIM:
+                blocks[1]["cache_control"] = {"type": "ephemeral"}
+        return blocks
+
+    @classmethod
+    def system_prompt(cls, user_message: str, history: list = None, current_trip_info: dict = None) -> str:
+        """拼接后的系统提示词（OpenAI 兼容协议使用，静态前缀在最前保证前缀缓存可命中）"""
+        return join_blocks(cls.system_blocks(user_message, history, current_trip_info))
+
+    async def _call_anthropic(
+        self, system_blocks: list, user_content: str, history: list, mode: str = "text", usage: dict = None
+    ) -> str:
+        """调用 Anthropic 原生协议（内网 oneai）；工具调用模式返回工具参数的 JSON 文本"""
         response = await self.client.messages.create(
             model=self.model,
-            system=SYSTEM_PROMPT,
-            messages=messages,
-            max_tokens=2000,
-            temperature=0.7,
+            system=system_blocks,
+            messages=self._build_messages(user_content, history),
+            **self._generation_params(mode),
+            **self._anthropic_tool_params(mode),
         )
+        self._collect_usage(usage, self._record_anthropic_usage(getattr(response, "usage", None)))
+        if mode == "tool":
+            for block in response.content:
+                if getattr(block, "type", None) == "tool_use":
+                    return json_codec.dumps_str(block.input)
+            # 网关未按要求调用工具时按文本模式处理
+            return "".join(getattr(block, "text", "") for block in response.content if getattr(block, "type", None) == "text")
         return response.content[0].text
 
-    async def _call_openai(self, user_content: str, history: list) -> str:
-        """调用 OpenAI 兼容协议（DeepSeek 等公网）"""
-        messages = [{"role": "system", "content": SYSTEM_PROMPT}]
-        if history:
-            for msg in history[-6:]:
-                if msg.get("role") in ("user", "assistant"):
-                    messages.append({"role": msg["role"], "content": msg.get("content", "")})
-        messages.append({"role": "user", "content": user_content})
+    async def _stream_anthropic(
+        self, system_blocks: list, user_content: str, history: list, mode: str = "text", usage: dict = None
+    ):
+        """Anthropic 流式调用，逐段产出文本（工具调用模式产出工具参数 JSON 片段）"""
+        async with self.client.messages.stream(
+            model=self.model,
+            system=system_blocks,
+            messages=self._build_messages(user_content, history),
+            **self._generation_params(mode),
+            **self._anthropic_tool_params(mode),
+        ) as stream:
+            if mode == "tool":
+                async for event in stream:
+                    delta = getattr(event, "delta", None) if getattr(event, "type", None) == "content_block_delta" else None
+                    if getattr(delta, "type", None) == "input_json_delta" and delta.partial_json:
+                        yield delta.partial_json
+            else:
+                async for text in stream.text_stream:
+                    yield text
+            final = await stream.get_final_message()
+        self._collect_usage(usage, self._record_anthropic_usage(getattr(final, "usage", None)))
 
+    async def _call_openai(
+        self, system_prompt: str, user_content: str, history: list, mode: str = "text", usage: dict = None
+    ) -> str:
+        """调用 OpenAI 兼容协议（DeepSeek 等公网）；工具调用模式返回函数参数的 JSON 文本"""
         response = await self.client.chat.completions.create(
             model=self.model,
-            messages=messages,
-            max_tokens=2000,
-            temperature=0.7,
+            messages=[{"role": "system", "content": system_prompt}, *self._build_messages(user_content, history)],
+            **self._generation_params(mode),
+            **self._openai_tool_params(mode),
+        )
+        self._collect_usage(usage, self._record_openai_usage(getattr(response, "usage", None)))
+        message = response.choices[0].message
+        if mode == "tool":
+            tool_calls = getattr(message, "tool_calls", None) or []
+            if tool_calls:
+                return tool_calls[0].function.arguments
+        return message.content
+
+    async def _stream_openai(
+        self, system_prompt: str, user_content: str, history: list, mode: str = "text", usage: dict = None
+    ):
+        """OpenAI 兼容协议流式调用，逐段产出文本（工具调用模式产出函数参数 JSON 片段）；用量在最后一个 chunk 中返回"""
+        stream = await self.client.chat.completions.create(
+            model=self.model,
+            messages=[{"role": "system", "content": system_prompt}, *self._build_messages(user_content, history)],
+            **self._generation_params(mode),
+            **self._openai_tool_params(mode),
+            stream=True,
+            stream_options={"include_usage": True},
+        )
+        last_usage = None
+        async for chunk in stream:
+            if getattr(chunk, "usage", None) is not None:
+                last_usage = chunk.usage
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta
+            if mode == "tool":
+                for call in getattr(delta, "tool_calls", None) or []:
+                    fragment = getattr(getattr(call, "function", None), "arguments", None)
+                    if fragment:
+                        yield fragment
+            if getattr(delta, "content", None):
+                yield delta.content
+        self._collect_usage(usage, self._record_openai_usage(last_usage))
+
+    @staticmethod
+    def _generation_params(mode: str) -> dict:
+        """工具调用模式输出只有参数 JSON，使用更小的 max_tokens 和更低的 temperature"""
+        if mode == "tool":
+            return {"max_tokens": settings.LLM_TOOL_MAX_TOKENS, "temperature": settings.LLM_TOOL_TEMPERATURE}
+        return {"max_tokens": 2000, "temperature": 0.7}
+
+    @staticmethod
+    def _anthropic_tool_params(mode: str) -> dict:
+        if mode != "tool":
+            return {}
+        return {"tools": [anthropic_tool()], "tool_choice": {"type": "tool", "name": INTENT_TOOL_NAME}}
+
+    @staticmethod
+    def _openai_tool_params(mode: str) -> dict:
+        if mode != "tool":
+            return {}
+        return {"tools": [openai_tool()], "tool_choice": {"type": "function", "function": {"name": INTENT_TOOL_NAME}}}
+
+    @staticmethod
+    def _collect_usage(target: dict, usage: dict):
+        if target is not None:
+            target.update(usage)
+
+    def _record_anthropic_usage(self, usage) -> dict:
+        return self.record_usage(
+            input_tokens=_token_count(usage, "input_tokens"),
+            cache_read_tokens=_token_count(usage, "cache_read_input_tokens"),
+            cache_write_tokens=_token_count(usage, "cache_creation_input_tokens"),
+            output_tokens=_token_count(usage, "output_tokens")
         )
-        return response.choices[0].message.content
+
+    def _record_openai_usage(self, usage) -> dict:
+        # OpenAI 在 prompt_tokens_details.cached_tokens 中返回缓存命中数，DeepSeek 使用 prompt_cache_hit_tokens；
+        # prompt_tokens 已包含命中部分，前缀缓存的写入不单独计费也不返回
+        cache_read = _token_count(getattr(usage, "prompt_tokens_details", None), "cached_tokens") \
+            or _token_count(usage, "prompt_cache_hit_tokens")
+        return self.record_usage(
+            input_tokens=_token_count(usage, "prompt_tokens") - cache_read,
+            cache_read_tokens=cache_read,
+            cache_write_tokens=0,
+            output_tokens=_token_count(usage, "completion_tokens")
+        )
+
+    def record_usage(self, input_tokens: int, cache_read_tokens: int, cache_write_tokens: int, output_tokens: int) -> dict:
+        """记录单次调用的 token 用量；input_tokens 为未命中缓存的输入部分"""
+        usage = {
+            "input_tokens": max(input_tokens, 0),
+            "cache_read_tokens": cache_read_tokens,
+            "cache_write_tokens": cache_write_tokens,
+            "output_tokens": output_tokens
+        }
+        self.last_usage = usage
+        self.llm_calls += 1
+        for key, value in usage.items():
+            self.usage_totals[key] += value
+        if settings.DEBUG:
+            print(f"[LLM] tokens: 输入 {usage['input_tokens']}, 缓存读 {cache_read_tokens}, "
+                  f"缓存写 {cache_write_tokens}, 输出 {output_tokens}")
+        return usage
+
+    def _record_turn(self, mode: str, result: dict, usage: dict):
+        """按输出模式统计每轮解析的输出 token 和解析失败次数，用于比较文本模式与工具调用模式"""
+        stats = self.output_modes[mode]
+        stats["turns"] += 1
+        stats["output_tokens"] += usage.get("output_tokens", 0)
+        if result.get("code") == "PARSE_FAILED":
+            stats["parse_failures"] += 1
+
+    def output_stats(self) -> dict:
+        return {
+            "mode": output_mode(),
+            **{
+                mode: {
+                    **stats,
+                    "parse_failure_rate": round(stats["parse_failures"] / stats["turns"], 4) if stats["turns"] else 0.0,
+                    "avg_output_tokens": round(stats["output_tokens"] / stats["turns"], 1) if stats["turns"] else 0
+                }
+                for mode, stats in self.output_modes.items()
+            }
+        }
+
+    def usage_stats(self) -> dict:
+        totals = self.usage_totals
+        prompt_tokens = totals["input_tokens"] + totals["cache_read_tokens"] + totals["cache_write_tokens"]
+        return {
+            "prompt_cache": settings.LLM_PROMPT_CACHE,
+            "calls": self.llm_calls,
+            **totals,
+            "cache_read_rate": round(totals["cache_read_tokens"] / prompt_tokens, 4) if prompt_tokens else 0.0,
+            "last_call": self.last_usage
+        }
     
     def _extract_json(self, content: str) -> dict:
         """从响应中提取 JSON"""
         # 尝试直接解析
         try:
-            return json.loads(content)
+            return json_codec.loads(content)
         except:
             pass
         
@@ -509,7 +1006,7 @@ class LLMService:
         json_match = re.search(r'```(?:json)?\s*(\{.*?\})\s*```', content, re.DOTALL)
         if json_match:
             try:
-                return json.loads(json_match.group(1))
+                return json_codec.loads(json_match.group(1))
             except:
                 pass
         
@@ -518,13 +1015,14 @@ class LLMService:
         end = content.rfind('}')
         if start != -1 and end != -1:
             try:
-                return json.loads(content[start:end+1])
+                return json_codec.loads(content[start:end+1])
             except:
                 pass
         
         # 返回错误
         return {
             "status": "error",
+            "code": "PARSE_FAILED",
             "message": "无法解析响应",
             "trip_info": None,
             "clarify": None
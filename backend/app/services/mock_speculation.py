@@ -0,0 +1,104 @@
+"""Mock 预判
+
+原流程在搜索失败或过滤为空之后才构建并上传 Mock 数据，Mock 耗时完全排在搜索耗时之后。
+对大概率需要 Mock 的请求（指定了非默认渠道、指定航司 + 非经济舱、航线最近连续无结果），
+在搜索的同时准备 Mock 数据：搜索先产出可用航班则取消 Mock，Mock 先准备好则放弃搜索。
+指定航班号/中转城市的请求本来就直接 Mock，不经过这里。
+"""
+import asyncio
+from typing import Optional
+
+from app.core.cache import TTLCache
+from app.core.config import settings
+
+
+class MockSpeculation:
+    """判断是否预判 Mock，并记录各航线最近的搜索结果"""
+
+    def __init__(self):
+        self.route_history = TTLCache(maxsize=1024, ttl=settings.MOCK_ROUTE_HISTORY_TTL)  # 航线 -> 连续无结果次数
+        self.speculated = 0
+        self.mock_won = 0
+        self.search_won = 0
+        self.fallback_used = 0  # 搜索结束仍无结果，使用预判的 Mock
+
+    @staticmethod
+    def route_key(trip_info: dict) -> tuple:
+        return (
+            trip_info.get("departure_code") or trip_info.get("departure_city"),
+            trip_info.get("arrival_code") or trip_info.get("arrival_city"),
+            trip_info.get("travel_type", "OW")
+        )
+
+    def reason(self, trip_info: dict) -> Optional[str]:
+        """需要预判 Mock 时返回原因，否则返回 None"""
+        if not settings.MOCK_SPECULATIVE:
+            return None
+        channel = trip_info.get("channel")
+        if channel and channel != "TC":
+            return f"渠道 {channel}"
+        if trip_info.get("airline_code") and trip_info.get("cabin_class") not in (None, "Y"):
+            return f"航司 {trip_info['airline_code']} + 舱等 {trip_info['cabin_class']}"
+        empty_streak = self.route_history.get(self.route_key(trip_info), 0)
+        if empty_streak >= settings.MOCK_SPECULATIVE_EMPTY_STREAK:
+            return f"航线最近连续 {empty_streak} 次无结果"
+        return None
+
+    def record(self, trip_info: dict, has_results: bool):
+        """记录一次完整搜索是否有可用结果"""
+        key = self.route_key(trip_info)
+        if has_results:
+            self.route_history.pop(key)
+        else:
+            self.route_history.set(key, self.route_history.get(key, 0) + 1)
+
+    def stats(self) -> dict:
+        return {
+            "enabled": settings.MOCK_SPECULATIVE,
+            "speculated": self.speculated,
+            "mock_won": self.mock_won,
+            "search_won": self.search_won,
+            "fallback_used": self.fallback_used,
+            "routes_tracked": len(self.route_history)
+        }
+
+
+async def race_mock(stream, mock_task: Optional[asyncio.Task]):
+    """并发等待搜索事件流与预判的 Mock 任务
+
+    按到达顺序产出搜索事件；Mock 任务先完成时插入 {"type": "mock", "result": mock_res}，
+    由调用方决定是否采用（采用后停止迭代即可，搜索事件流随之关闭）。
+    调用方取消 Mock 任务或 Mock 抛出异常时不产出 mock 事件。
+    """
+    next_event = None
+    try:
+        while True:
+            if next_event is None:
+                next_event = asyncio.ensure_future(stream.__anext__())
+            waits = {next_event}
+            if mock_task is not None:
+                waits.add(mock_task)
+            await asyncio.wait(waits, return_when=asyncio.FIRST_COMPLETED)
+            if mock_task is not None and mock_task.done():
+                finished, mock_task = mock_task, None
+                if not finished.cancelled() and finished.exception() is None:
+                    yield {"type": "mock", "result": finished.result()}
+                continue
+            try:
+                event = next_event.result()
+            except StopAsyncIteration:
+                return
+            next_event = None
+            yield event
+    finally:
+        if next_event is not None and not next_event.done():
+            next_event.cancel()
+            try:
+                await next_event
+            except (asyncio.CancelledError, StopAsyncIteration):
+                pass
+        await stream.aclose()
+
+
+# 全局单例
+mock_speculation = MockSpeculation()
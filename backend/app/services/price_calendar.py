@@ -0,0 +1,148 @@
+"""低价日历服务
+
+以某个行程为中心，在 ±N 天窗口内并发搜索每一天（信号量限制并发数），
+在 FlightTable 的价格列上直接聚合出当天最低价/中位价，每天的格子搜完即流式产出。
+每天的格子按规范化搜索参数短时缓存，重复查询同一航线的日历时只搜索缺失的日期。
+"""
+import asyncio
+import statistics
+from array import array
+from datetime import datetime, timedelta
+from typing import Optional
+
+from app.core.admission import PRIORITY_BATCH, request_priority
+from app.core.cache import SingleFlight, TTLCache
+from app.core.config import settings
+from app.services.flight_filter import FilterPlan
+from app.services.flight_search import flight_search_service
+from app.services.flight_table import FlightTable
+
+
+def shift_date(value: Optional[str], days: int) -> Optional[str]:
+    """yyyy-MM-dd 日期平移 days 天，无法解析时原样返回"""
+    if not value:
+        return value
+    try:
+        return (datetime.strptime(value, "%Y-%m-%d") + timedelta(days=days)).strftime("%Y-%m-%d")
+    except ValueError:
+        return value
+
+
+def shift_trip(trip_info: dict, days: int) -> dict:
+    """整体平移行程日期：出发、返程以及缺口程各程同时平移，保持停留天数不变"""
+    shifted = {**trip_info, "dep_date": shift_date(trip_info.get("dep_date"), days)}
+    if trip_info.get("return_date"):
+        shifted["return_date"] = shift_date(trip_info["return_date"], days)
+    if trip_info.get("legs"):
+        shifted["legs"] = [{**leg, "dep_date": shift_date(leg.get("dep_date"), days)} for leg in trip_info["legs"]]
+    return shifted
+
+
+def price_summary(flights, filter_options: dict = None) -> dict:
+    """在价格列上聚合一天的最低价/中位价/航班数"""
+    if not isinstance(flights, FlightTable):
+        flights = FlightTable.from_flights(flights or [])
+    if filter_options:
+        rows = FilterPlan(**filter_options).apply_table(flights)
+        prices = array("q", (flights.price[row] for row in rows))
+    else:
+        prices = flights.price
+    prices = array("q", (p for p in prices if p > 0))  # 缺价的行不参与统计
+    if not prices:
+        return {"min_price": None, "median_price": None, "count": 0}
+    return {
+        "min_price": min(prices),
+        "median_price": int(statistics.median(prices)),
+        "count": len(prices)
+    }
+
+
+class PriceCalendarService:
+    """低价日历服务"""
+
+    def __init__(self):
+        self.cache = TTLCache(maxsize=settings.CALENDAR_CACHE_MAX_SIZE, ttl=settings.CALENDAR_CELL_TTL)
+        self._inflight = SingleFlight()
+
+    def cell_key(self, trip_info: dict, filter_options: dict = None) -> str:
+        """格子缓存键：规范化的搜索参数 + 过滤条件"""
+        options = sorted((k, v) for k, v in (filter_options or {}).items() if v)
+        return f"{flight_search_service.search_cache_key(trip_info)}|{options}"
+
+    async def _search_cell(self, trip_info: dict, offset: int, filter_options: dict = None) -> dict:
+        """搜索一天并聚合为格子
+
+        日历用缩短的时间预算搜索；预算耗尽的格子只有部分航班，不写入格子缓存，
+        搜索服务也不会把这样的结果写入搜索缓存。
+        """
+        result = await flight_search_service.search(trip_info, time_budget=settings.CALENDAR_TIME_BUDGET)
+        cell = {
+            "date": trip_info.get("dep_date"),
+            "offset": offset,
+            **price_summary(result.get("flights") if result.get("success") else [], filter_options),
+            "timed_out": bool(result.get("timed_out")),
+            "error": None if result.get("success") else result.get("error")
+        }
+        if result.get("success") and not result.get("timed_out"):
+            self.cache.set(self.cell_key(trip_info, filter_options), cell)
+        return cell
+
+    async def stream(self, trip_info: dict, days: int = 3, filter_options: dict = None):
+        """按 ±days 窗口生成低价日历
+
+        Yields:
+            {"type": "cell", "cell": {date, offset, min_price, median_price, count, cached, timed_out, error}}
+            {"type": "done", "cells": [按日期排序], "cheapest": 最低价日期}
+        """
+        today = datetime.now().strftime("%Y-%m-%d")
+        semaphore = asyncio.Semaphore(settings.CALENDAR_MAX_CONCURRENCY)
+        cells = []
+        pending = []
+
+        async def run(day_trip: dict, offset: int) -> dict:
+            request_priority.set(PRIORITY_BATCH)  # 日历格子属于批量任务，准入排队时让位于对话搜索
+            async with semaphore:
+                key = self.cell_key(day_trip, filter_options)
+                cell = await self._inflight.do(key, lambda: self._search_cell(day_trip, offset, filter_options))
+                return {**cell, "offset": offset, "cached": False}
+
+        for offset in range(-days, days + 1):
+            day_trip = shift_trip(trip_info, offset)
+            if not day_trip.get("dep_date") or day_trip["dep_date"] < today:
+                continue  # 过去的日期不搜索
+            cached = self.cache.get(self.cell_key(day_trip, filter_options))
+            if cached is not None:
+                cell = {**cached, "offset": offset, "cached": True}
+                cells.append(cell)
+                yield {"type": "cell", "cell": cell}
+            else:
+                pending.append(asyncio.ensure_future(run(day_trip, offset)))
+
+        if settings.DEBUG:
+            print(f"[Calendar] 窗口 ±{days} 天: 缓存命中 {len(cells)} 天, 需搜索 {len(pending)} 天")
+
+        try:
+            for next_done in asyncio.as_completed(pending):
+                cell = await next_done
+                cells.append(cell)
+                yield {"type": "cell", "cell": cell}
+        finally:
+            for task in pending:
+                if not task.done():
+                    task.cancel()
+
+        cells.sort(key=lambda c: c["date"])
+        priced = [c for c in cells if c["min_price"] is not None]
+        yield {
+            "type": "done",
+            "cells": cells,
+            "cheapest": min(priced, key=lambda c: c["min_price"])["date"] if priced else None
+        }
+
+    def stats(self) -> dict:
+        """日历格子缓存统计"""
+        return {**self.cache.stats(), "shared_inflight": self._inflight.shared}
+
+
+# 全局单例
+price_calendar_service = PriceCalendarService()
@@ -0,0 +1,152 @@
+"""系统提示词参考表裁剪
+
+完整的城市/机场、航司、渠道参考表每次调用都要占用数千输入 token，且随城市数量增长。
+这里按名称、代码、别名在本地查找当前消息、已收集的行程信息和最近几轮用户输入涉及的条目，
+只把这些行加上一小组固定的常用城市（示例和"中转城市随意"时可选的城市）放进提示词。
+"""
+import re
+
+from app.core.reference_index import ReferenceIndex, reference_index
+from app.services.intent_rules import AIRLINE_ABBREVIATIONS
+
+# 始终保留的城市：提示词示例涉及的城市 + 常用中转枢纽
+CORE_CITIES = ("SHA", "BJS", "HKG", "CAN", "SZX", "BKK", "SIN", "TYO", "SEL", "PAR", "LON", "DOH")
+
+# 消息提到航司/渠道但没有命中具体条目时，附上完整的航司/渠道表（两张表都很小）
+_AIRLINE_HINT = re.compile(r"航司|航空|航班号")
+_CHANNEL_HINT = re.compile(r"渠道|flatType", re.IGNORECASE)
+_TOKEN = re.compile(r"[A-Za-z0-9]+")
+
+
+def render_city(city: dict) -> str:
+    return f"- {city['city_name']}: " + "/".join([f"{a['code']}({a['name']})" for a in city['airports']])
+
+
+def render_airline(airline: dict) -> str:
+    return f"- {airline['code']}: {airline['name']}"
+
+
+def render_channels(category: dict, values: list) -> str:
+    return f"- {category['name']}: " + "，".join([f"{item['text']}({item['value']})" for item in values])
+
+
+class PromptAssembler:
+    """按对话内容挑选参考表中的相关行"""
+
+    def __init__(self, index: ReferenceIndex, core_cities: tuple = CORE_CITIES):
+        self.index = index
+        self.core_cities = tuple(code for code in core_cities if code in index.city_airports)
+
+        # 中文名称/别名 -> [(类别, 键)]，英文代码单独按 token 查找
+        names: dict[str, list] = {}
+        codes: dict[str, list] = {}
+        for city in index.cities:
+            city_code = city.get("city_code")
+            names.setdefault(city.get("city_name", ""), []).append(("city", city_code))
+            codes.setdefault(city_code, []).append(("city", city_code))
+            for airport in city.get("airports", []):
+                codes.setdefault(airport.get("code"), []).append(("city", city_code))
+                airport_name = airport.get("name", "")
+                names.setdefault(airport_name, []).append(("city", city_code))
+                short = re.sub(r"(国际)?机场$", "", airport_name)
+                if len(short) >= 2:
+                    names.setdefault(short, []).append(("city", city_code))
+        for airline in index.airlines:
+            names.setdefault(airline.get("name", ""), []).append(("airline", airline.get("code")))
+            codes.setdefault(airline.get("code"), []).append(("airline", airline.get("code")))
+        for word, code in AIRLINE_ABBREVIATIONS.items():
+            names.setdefault(word, []).append(("airline", code))
+        for category in index.flat_types:
+            for item in category.get("values", []):
+                value = item.get("value")
+                codes.setdefault(value.upper(), []).append(("channel", value))
+                if len(item.get("text", "")) >= 2:
+                    names.setdefault(item["text"].upper(), []).append(("channel", value))
+        names.pop("", None)
+        self.names = names
+        self.codes = codes
+        self.airline_codes = frozenset(a.get("code") for a in index.airlines)
+        self.name_pattern = re.compile("|".join(re.escape(name) for name in sorted(names, key=len, reverse=True)))
+
+        self.full_city_reference = "\n".join(render_city(city) for city in index.cities)
+        self.full_airline_reference = "\n".join(render_airline(a) for a in index.airlines)
+        self.full_flat_type_reference = "\n".join(
+            render_channels(category, category['values']) for category in index.flat_types
+        )
+        self.calls = 0
+        self.trimmed_chars = 0
+        self.full_chars = (
+            len(self.full_city_reference) + len(self.full_airline_reference) + len(self.full_flat_type_reference)
+        )
+
+    def select(self, text: str) -> dict:
+        """返回文本涉及的 {"city": set, "airline": set, "channel": set}"""
+        selected = {"city": set(), "airline": set(), "channel": set()}
+        for match in self.name_pattern.finditer(text.upper()):
+            for kind, key in self.names[match.group(0)]:
+                selected[kind].add(key)
+        for token in _TOKEN.findall(text):
+            token = token.upper()
+            for kind, key in self.codes.get(token, ()):
+                selected[kind].add(key)
+            # 航班号前缀：MU5001 -> MU
+            if len(token) > 2 and token[:2] in self.airline_codes and token[2:].isdigit():
+                selected["airline"].add(token[:2])
+        return selected
+
+    def references(self, user_message: str, current_trip_info: dict = None, history: list = None) -> dict:
+        """组装裁剪后的城市/航司/渠道参考表"""
+        parts = [user_message or ""]
+        if current_trip_info:
+            parts.extend(str(value) for value in current_trip_info.values() if value)
+        for msg in (history or [])[-6:]:
+            if msg.get("role") == "user":
+                parts.append(msg.get("content", ""))
+        text = "\n".join(parts)
+        selected = self.select(text)
+
+        cities = set(self.core_cities) | selected["city"]
+        city_reference = "\n".join(
+            render_city(city) for city in self.index.cities if city.get("city_code") in cities
+        )
+        city_reference += "\n- 其他城市：参考表未列出时按常用 IATA 城市三字码填写"
+
+        if selected["airline"]:
+            airline_reference = "\n".join(
+                render_airline(a) for a in self.index.airlines if a.get("code") in selected["airline"]
+            )
+        elif _AIRLINE_HINT.search(text):
+            airline_reference = self.full_airline_reference
+        else:
+            airline_reference = "- 用户未提及航司"
+
+        if selected["channel"]:
+            lines = []
+            for category in self.index.flat_types:
+                values = [item for item in category.get("values", []) if item.get("value") in selected["channel"]]
+                if values:
+                    lines.append(render_channels(category, values))
+            flat_type_reference = "\n".join(lines)
+        elif _CHANNEL_HINT.search(text):
+            flat_type_reference = self.full_flat_type_reference
+        else:
+            flat_type_reference = "- 用户未指定渠道"
+
+        self.calls += 1
+        self.trimmed_chars += len(city_reference) + len(airline_reference) + len(flat_type_reference)
+        return {
+            "city_reference": city_reference,
+            "airline_reference": airline_reference,
+            "flat_type_reference": flat_type_reference
+        }
+
+    def stats(self) -> dict:
+        return {
+            "calls": self.calls,
+            "full_reference_chars": self.full_chars,
+            "avg_reference_chars": round(self.trimmed_chars / self.calls, 1) if self.calls else 0
+        }
+
+
+# 全局单例
+prompt_assembler = PromptAssembler(reference_index)
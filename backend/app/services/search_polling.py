@@ -0,0 +1,173 @@
+"""搜索轮询引擎 - 按总时间预算控制轮询节奏"""
+import time
+from collections import deque
+from typing import Callable, Optional
+
+from app.core.config import settings
+
+
+class SearchPoller:
+    """单次搜索的轮询控制器
+
+    - 总时间预算：到期后停止轮询，由调用方返回目前为止最好的结果
+    - 等待间隔：优先使用上游 sleepTime，夹在 [min_sleep, max_sleep] 内；
+      没有 sleepTime 或结果数量不再增长时指数退避
+    - 每次轮询记录耗时，便于调整预算
+    """
+
+    BACKOFF_FACTOR = 1.5
+
+    def __init__(
+        self,
+        budget: float = None,
+        min_sleep: float = None,
+        max_sleep: float = None,
+        poll_timeout: float = None,
+        clock: Callable[[], float] = time.monotonic
+    ):
+        self.budget = budget if budget is not None else settings.SEARCH_TIME_BUDGET
+        self.min_sleep = min_sleep if min_sleep is not None else settings.SEARCH_POLL_MIN_SLEEP
+        self.max_sleep = max_sleep if max_sleep is not None else settings.SEARCH_POLL_MAX_SLEEP
+        self.poll_timeout = poll_timeout if poll_timeout is not None else settings.SEARCH_POLL_TIMEOUT
+        self._clock = clock
+        self.started_at = clock()
+        self.deadline = self.started_at + self.budget
+        self.polls: list[dict] = []
+        self._stalls = 0
+        self._last_count = -1
+        self._avg_latency = 0.0
+
+    def elapsed(self) -> float:
+        return self._clock() - self.started_at
+
+    def remaining(self) -> float:
+        return max(0.0, self.deadline - self._clock())
+
+    def expired(self) -> bool:
+        return self.remaining() <= 0
+
+    def request_timeout(self) -> float:
+        """本次轮询请求的超时：不超过单次上限，也不超过剩余预算"""
+        return max(0.001, min(self.poll_timeout, self.remaining()))
+
+    def record(self, latency: float, resp_data: dict = None, status_code: int = None):
+        """记录一次轮询的耗时与结果概况"""
+        resp_data = resp_data or {}
+        self._avg_latency = latency if not self.polls else 0.7 * self._avg_latency + 0.3 * latency
+        self.polls.append({
+            "attempt": len(self.polls) + 1,
+            "started_ms": round((self.elapsed() - latency) * 1000, 1),
+            "latency_ms": round(latency * 1000, 1),
+            "status_code": status_code,
+            "success": resp_data.get("success"),
+            "finished": resp_data.get("finished"),
+            "result_count": resp_data.get("resultCount"),
+            "upstream_sleep_ms": resp_data.get("sleepTime"),
+            "sleep_ms": None
+        })
+
+    def next_sleep(self, resp_data: dict) -> Optional[float]:
+        """计算下次轮询前的等待秒数；剩余预算不足以再完成一次轮询时返回 None"""
+        result_count = resp_data.get("resultCount")
+        if result_count is None:
+            result_count = len((resp_data.get("route") or {}).get("tripProducts") or [])
+        if result_count <= self._last_count:
+            self._stalls += 1
+        else:
+            self._stalls = 0
+        self._last_count = result_count
+
+        upstream_sleep = (resp_data.get("sleepTime") or 0) / 1000.0
+        base = upstream_sleep if upstream_sleep > 0 else self.min_sleep * (self.BACKOFF_FACTOR ** len(self.polls))
+        sleep = min(self.max_sleep, max(self.min_sleep, base * (self.BACKOFF_FACTOR ** self._stalls)))
+
+        # 等待之后至少要留出一次轮询的时间，否则直接结束
+        if sleep + self._avg_latency >= self.remaining():
+            return None
+        if self.polls:
+            self.polls[-1]["sleep_ms"] = round(sleep * 1000, 1)
+        return sleep
+
+    def summary(self) -> dict:
+        return {
+            "polls": len(self.polls),
+            "elapsed_ms": round(self.elapsed() * 1000, 1),
+            "budget_ms": round(self.budget * 1000, 1),
+            "timings": self.polls
+        }
+
+
+class PollingStats:
+    """最近若干次搜索的轮询统计，用于调整时间预算"""
+
+    def __init__(self, maxlen: int = 100):
+        self._recent: deque = deque(maxlen=maxlen)
+        self.searches = 0
+        self.timed_out = 0
+
+    def add(self, summary: dict, timed_out: bool):
+        self.searches += 1
+        if timed_out:
+            self.timed_out += 1
+        self._recent.append({**summary, "timed_out": timed_out})
+
+    def stats(self) -> dict:
+        recent = list(self._recent)
+        return {
+            "searches": self.searches,
+            "timed_out": self.timed_out,
+            "avg_polls": round(sum(r["polls"] for r in recent) / len(recent), 2) if recent else 0,
+            "avg_elapsed_ms": round(sum(r["elapsed_ms"] for r in recent) / len(recent), 1) if recent else 0,
+            "max_elapsed_ms": max((r["elapsed_ms"] for r in recent), default=0),
+            "last": recent[-1] if recent else None
+        }
+
+
+class HedgePolicy:
+    """对冲轮询策略：按最近轮询耗时的分位数决定何时发出对冲请求，并统计对冲效果"""
+
+    def __init__(
+        self,
+        percentile: float = None,
+        min_samples: int = None,
+        min_delay: float = None,
+        enabled: bool = None,
+        maxlen: int = 200
+    ):
+        self.percentile = percentile if percentile is not None else settings.SEARCH_HEDGE_PERCENTILE
+        self.min_samples = min_samples if min_samples is not None else settings.SEARCH_HEDGE_MIN_SAMPLES
+        self.min_delay = min_delay if min_delay is not None else settings.SEARCH_HEDGE_MIN_DELAY
+        self.enabled = enabled if enabled is not None else settings.SEARCH_HEDGE_ENABLED
+        self._latencies: deque = deque(maxlen=maxlen)
+        self.polls = 0
+        self.hedged = 0
+        self.hedge_wins = 0
+
+    def record(self, latency: float):
+        """记录一次成功轮询的耗时"""
+        self._latencies.append(latency)
+
+    def threshold(self) -> Optional[float]:
+        """当前的对冲等待阈值（秒）；未开启或样本不足时返回 None"""
+        if not self.enabled or len(self._latencies) < self.min_samples:
+            return None
+        latencies = sorted(self._latencies)
+        return max(self.min_delay, latencies[min(len(latencies) - 1, int(len(latencies) * self.percentile))])
+
+    def delay(self) -> Optional[float]:
+        """发出对冲请求前的等待秒数，None 表示不对冲"""
+        self.polls += 1
+        return self.threshold()
+
+    def stats(self) -> dict:
+        threshold = self.threshold()
+        return {
+            "enabled": self.enabled,
+            "percentile": self.percentile,
+            "samples": len(self._latencies),
+            "hedge_delay_ms": round(threshold * 1000, 1) if threshold is not None else None,
+            "polls": self.polls,
+            "hedged": self.hedged,
+            "hedge_wins": self.hedge_wins,
+            "hedge_rate": round(self.hedged / self.polls, 4) if self.polls else 0.0
+        }
@@ -0,0 +1,121 @@
+"""搜索预启动
+
+流式解析意图时，trip_info 在 JSON 中排在 clarify、message 之前。status 为 complete、
+trip_info 已完整生成且航线/日期齐全时，就用与会话合并后的行程信息提前启动搜索，
+LLM 继续生成回复文本的同时上游已在轮询。最终解析结果得到的搜索参数一致时接着消费
+预启动的搜索事件（已产出的事件会先被重放），不一致或不需要搜索时取消预启动的搜索。
+"""
+import asyncio
+import time
+from typing import Callable, Optional
+
+from app.core.config import settings
+from app.services.flight_search import flight_search_service
+
+
+class SpeculativeSearch:
+    """一次预启动的搜索：后台消费搜索事件流并缓冲，供之后重放"""
+
+    def __init__(self, key: tuple, stream):
+        self.key = key
+        self.started_at = time.monotonic()
+        self._events: asyncio.Queue = asyncio.Queue()
+        self._task = asyncio.ensure_future(self._drain(stream))
+
+    async def _drain(self, stream):
+        try:
+            async for event in stream:
+                self._events.put_nowait(event)
+        finally:
+            await stream.aclose()  # 被取消时关闭搜索事件流，上游轮询随之取消
+            self._events.put_nowait(None)
+
+    async def events(self):
+        """按原顺序产出搜索事件；后台搜索抛出异常时在这里重新抛出
+
+        调用方提前停止迭代（如 Mock 胜出）时取消后台搜索。
+        """
+        try:
+            while True:
+                event = await self._events.get()
+                if event is None:
+                    break
+                yield event
+        finally:
+            self.cancel()
+        if not self._task.cancelled() and self._task.exception() is not None:
+            raise self._task.exception()
+
+    def cancel(self):
+        if not self._task.done():
+            self._task.cancel()
+
+
+class SearchSpeculation:
+    """判断何时预启动搜索，并统计预启动的收益"""
+
+    def __init__(self, key_of: Callable[[dict], tuple]):
+        self.key_of = key_of  # 行程信息 -> 决定搜索结果的参数
+        self.started = 0
+        self.used = 0
+        self.discarded = 0
+        self.head_start_seconds = 0.0  # 被采用的预启动搜索比原流程提前的时间
+
+    @staticmethod
+    def ready(status: Optional[str], trip_info: dict) -> bool:
+        """流式结果是否已足够确定搜索参数"""
+        if not settings.SEARCH_SPECULATIVE or status != "complete":
+            return False
+        if trip_info.get("flight_no") or trip_info.get("transfer_cities"):
+            return False  # 指定航班号/中转城市直接 Mock，不搜索
+        travel_type = trip_info.get("travel_type", "OW")
+        if travel_type == "OJ":
+            return bool(trip_info.get("legs"))
+        if not (trip_info.get("departure_code") and trip_info.get("arrival_code") and trip_info.get("dep_date")):
+            return False
+        return travel_type != "RT" or bool(trip_info.get("return_date"))
+
+    def start(self, trip_info: dict, stream_factory: Callable[[dict], object]) -> SpeculativeSearch:
+        self.started += 1
+        if settings.DEBUG:
+            print(f"[Search] 意图流式解析中预启动搜索: {trip_info.get('departure_code')} -> {trip_info.get('arrival_code')}")
+        return SpeculativeSearch(self.key_of(trip_info), stream_factory(trip_info))
+
+    def claim(self, speculative: Optional[SpeculativeSearch], trip_info: Optional[dict]) -> Optional[SpeculativeSearch]:
+        """最终解析结果确定后调用：参数一致时返回可继续使用的预启动搜索，否则取消并返回 None
+
+        trip_info 为 None 表示本轮不需要搜索（需要澄清、强制 Mock 或解析失败）。
+        """
+        if speculative is None:
+            return None
+        if trip_info is not None and self.key_of(trip_info) == speculative.key:
+            self.used += 1
+            self.head_start_seconds += time.monotonic() - speculative.started_at
+            return speculative
+        speculative.cancel()
+        self.discarded += 1
+        if settings.DEBUG:
+            print("[Search] 最终解析结果与预启动时不一致，取消预启动的搜索")
+        return None
+
+    def stats(self) -> dict:
+        return {
+            "enabled": settings.SEARCH_SPECULATIVE,
+            "started": self.started,
+            "used": self.used,
+            "discarded": self.discarded,
+            "head_start_seconds": round(self.head_start_seconds, 3)
+        }
+
+
+def _search_key(trip_info: dict) -> tuple:
+    # 搜索缓存键会把机场码归一到城市码，这里额外带上原始代码：指定机场时搜索会按机场扇出
+    return (
+        flight_search_service.search_cache_key(trip_info),
+        trip_info.get("departure_code"),
+        trip_info.get("arrival_code")
+    )
+
+
+# 全局单例
+search_speculation = SearchSpeculation(_search_key)
@@ -0,0 +1,96 @@
+"""连接池基准：每次新建 AsyncClient vs 共享连接池
+
+在本地起一个模拟搜索接口的 HTTP/1.1 服务，对比单次请求延迟。
+
+用法（backend 目录下）:
+    python -m benchmarks.bench_connection_pool [请求数]
+"""
+import asyncio
+import json
+import statistics
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import httpx
+
+from app.core.http_client import UpstreamClient
+
+RESPONSE_BODY = json.dumps({
+    "data": {"success": True, "finished": True, "sleepTime": 0, "resultCount": 0, "route": {}}
+}).encode("utf-8")
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    """模拟搜索接口：读取请求体并立即返回 finished=true"""
+
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        self.rfile.read(length)
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(RESPONSE_BODY)))
+        self.end_headers()
+        self.wfile.write(RESPONSE_BODY)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_server() -> tuple[ThreadingHTTPServer, str]:
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StandInHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    host, port = server.server_address
+    return server, f"http://{host}:{port}/search"
+
+
+async def per_call_client(url: str, n: int) -> list[float]:
+    """基线：每次请求新建 client（原实现）"""
+    latencies = []
+    for _ in range(n):
+        start = time.perf_counter()
+        async with httpx.AsyncClient(timeout=90.0) as client:
+            await client.post(url, json={"traceId": "bench"})
+        latencies.append((time.perf_counter() - start) * 1000)
+    return latencies
+
+
+async def pooled_client(url: str, n: int) -> list[float]:
+    """优化：共享连接池"""
+    upstream = UpstreamClient("bench", timeout=90.0)
+    await upstream.start()
+    latencies = []
+    try:
+        for _ in range(n):
+            start = time.perf_counter()
+            await upstream.client.post(url, json={"traceId": "bench"})
+            latencies.append((time.perf_counter() - start) * 1000)
+    finally:
+        await upstream.aclose()
+    return latencies
+
+
+def report(name: str, latencies: list[float]):
+    ordered = sorted(latencies)
+    p95 = ordered[int(len(ordered) * 0.95) - 1]
+    print(f"{name:<12} mean={statistics.mean(latencies):7.3f}ms "
+          f"p50={statistics.median(latencies):7.3f}ms p95={p95:7.3f}ms")
+
+
+async def main(n: int):
+    server, url = start_server()
+    try:
+        # 预热，排除首次导入/解析开销
+        await per_call_client(url, 5)
+        report("per-call", await per_call_client(url, n))
+        report("pooled", await pooled_client(url, n))
+    finally:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 200))
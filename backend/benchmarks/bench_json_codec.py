@@ -0,0 +1,95 @@
+"""SSE final 帧编码基准：原 json.dumps（ensure_ascii=True）vs 标准库紧凑 UTF-8 / 紧凑 ASCII vs orjson
+
+用法（backend 目录下）:
+    python -m benchmarks.bench_json_codec
+"""
+import json
+import timeit
+
+from app.core import json_codec
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def make_flight(i: int) -> dict:
+    """典型的单程中转航班（两段，含中文城市/机场名）"""
+    segments = []
+    for seq, (dep, dep_city, arr, arr_city) in enumerate(
+        [("PVG", "上海", "HKG", "香港"), ("HKG", "香港", "NRT", "东京")], start=1
+    ):
+        segments.append({
+            "sequence": seq,
+            "flight_no": f"MU{5000 + i}{seq}",
+            "airline": {"code": "MU", "name": "中国东方航空"},
+            "departure": {"code": dep, "city": dep_city, "name": f"{dep_city}国际机场", "terminal": "T1",
+                          "time": f"2026-10-01 {8 + seq:02d}:00:00"},
+            "arrival": {"code": arr, "city": arr_city, "name": f"{arr_city}国际机场", "terminal": "T2",
+                        "time": f"2026-10-01 {10 + seq:02d}:30:00"},
+            "duration": "150",
+            "equip": "空客A320",
+            "is_transfer": seq > 1
+        })
+    return {
+        "id": f"trip-{i}",
+        "type": "INTL_NORMAL",
+        "travel_type": "OW",
+        "segments": segments,
+        "is_transfer": True,
+        "cabin_class": "Y",
+        "cabin_name": "经济舱",
+        "cabin_num": "9",
+        "price": {
+            "total": str(1800 + i * 7), "base": str(1500 + i * 7), "tax": "300", "foreign_total": "0",
+            "currency": "CNY",
+            "passenger_prices": [{"type": "ADT", "count": 1, "base": str(1500 + i * 7), "tax": "300",
+                                  "total": str(1800 + i * 7)}]
+        },
+        "services": [],
+        "labels": [{"name": "行李直挂"}, {"name": "免费改期"}]
+    }
+
+
+def final_payload(n: int = 200) -> dict:
+    return {
+        "type": "final",
+        "session_id": "0b8e3c1e-6f4a-4d7e-9a61-2c8f1a6b1f3d",
+        "response_type": "result",
+        "message": "为您找到上海到东京 10月1日的航班，经济舱 1 成人",
+        "trip_info": {"travel_type": "OW", "departure_city": "上海", "departure_code": "SHA",
+                      "arrival_city": "东京", "arrival_code": "TYO", "dep_date": "2026-10-01"},
+        "clarify": None,
+        "flights": [make_flight(i) for i in range(n)],
+        "total": n,
+        "is_mocked": False,
+        "debug_info": None
+    }
+
+
+def main(number: int = 200):
+    payload = final_payload()
+    encoders = {
+        "json.dumps (ensure_ascii, 原实现)": lambda: f"data: {json.dumps(payload)}\n\n".encode(),
+        "stdlib compact utf-8": lambda: b"data: " + json.dumps(
+            payload, ensure_ascii=False, separators=(",", ":")).encode("utf-8") + b"\n\n",
+        "stdlib compact ascii": lambda: f"data: {json.dumps(payload, separators=(',', ':'))}\n\n".encode("ascii"),
+    }
+    if orjson is not None:
+        encoders["orjson"] = lambda: b"data: " + orjson.dumps(payload) + b"\n\n"
+    encoders[f"json_codec.sse_event ({json_codec.BACKEND})"] = lambda: json_codec.sse_event(payload)
+
+    baseline = None
+    print(f"payload: {len(payload['flights'])} flights")
+    for name, encode in encoders.items():
+        frame = encode()
+        assert json.loads(frame[6:]) == payload
+        seconds = min(timeit.repeat(encode, number=number // 5, repeat=5)) / (number // 5)
+        baseline = baseline or (seconds, len(frame))
+        print(f"{name:38s} {seconds * 1e3:7.3f} ms/frame  {len(frame):8d} bytes  "
+              f"({baseline[0] / seconds:4.1f}x time, {len(frame) / baseline[1]:.0%} size)")
+
+
+if __name__ == "__main__":
+    main()
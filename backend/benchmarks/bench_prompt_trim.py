@@ -0,0 +1,123 @@
+"""系统提示词基准：完整参考表 vs 按对话裁剪的参考表
+
+比较典型对话下两种系统提示词的长度（字符数与估算 token 数）和组装耗时。
+token 数优先用 tiktoken（cl100k_base）计算，未安装时按 CJK 字符 1 token、其余字符 4 个 1 token 估算。
+加 --live 时用当前 .env 配置的模型各实际调用 N 次，比较端到端延迟与接口返回的输入 token 数。
+
+用法（backend 目录下）:
+    python -m benchmarks.bench_prompt_trim [--live] [N]
+"""
+import asyncio
+import re
+import statistics
+import sys
+import time
+
+from app.services.llm_service import build_system_prompt, llm_service
+from app.services.prompt_assembler import prompt_assembler
+
+try:
+    import tiktoken
+    _ENCODING = tiktoken.get_encoding("cl100k_base")
+except Exception:  # pragma: no cover - 取决于运行环境
+    _ENCODING = None
+
+_CJK = re.compile(r"[　-鿿＀-￯]")
+
+CASES = [
+    ("明天上海到香港", None, None),
+    ("2月15号从上海浦东到东京成田，2个大人1个小孩，东航商务舱", None, None),
+    ("查一下MU5001/MU5002，上海到新加坡，经曼谷中转，明天的", None, None),
+    ("用微信H5渠道查下周三北京到纽约的往返", None, None),
+    ("改成后天",
+     {"departure_city": "成都", "departure_code": "CTU", "arrival_city": "悉尼", "arrival_code": "SYD",
+      "dep_date": "2026-03-01"},
+     [{"role": "user", "content": "3月1号成都到悉尼"}, {"role": "assistant", "content": "已为您找到航班"}]),
+]
+
+
+def count_tokens(text: str) -> int:
+    if _ENCODING is not None:
+        return len(_ENCODING.encode(text))
+    cjk = len(_CJK.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+def full_prompt() -> str:
+    return build_system_prompt(
+        prompt_assembler.full_city_reference,
+        prompt_assembler.full_airline_reference,
+        prompt_assembler.full_flat_type_reference
+    )
+
+
+def trimmed_prompt(message: str, trip_info: dict, history: list) -> str:
+    return build_system_prompt(**prompt_assembler.references(message, trip_info, history))
+
+
+def measure(fn, repeat: int = 200) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        fn()
+    return (time.perf_counter() - start) / repeat
+
+
+async def live_latency(system_prompt: str, message: str, history: list, n: int) -> tuple:
+    """实际调用模型 n 次，返回 (延迟中位数, 接口返回的输入 token 数)"""
+    latencies = []
+    input_tokens = None
+    for _ in range(n):
+        start = time.perf_counter()
+        if llm_service.protocol == "anthropic":
+            response = await llm_service.client.messages.create(
+                model=llm_service.model, system=system_prompt, max_tokens=2000, temperature=0.7,
+                messages=[*(history or []), {"role": "user", "content": message}]
+            )
+            input_tokens = getattr(getattr(response, "usage", None), "input_tokens", None)
+        else:
+            response = await llm_service.client.chat.completions.create(
+                model=llm_service.model, max_tokens=2000, temperature=0.7,
+                messages=[
+                    {"role": "system", "content": system_prompt},
+                    *(history or []),
+                    {"role": "user", "content": message},
+                ]
+            )
+            input_tokens = getattr(getattr(response, "usage", None), "prompt_tokens", None)
+        latencies.append(time.perf_counter() - start)
+    return statistics.median(latencies), input_tokens
+
+
+def main():
+    args = [a for a in sys.argv[1:] if a != "--live"]
+    live = "--live" in sys.argv
+    n = int(args[0]) if args else 3
+
+    print(f"token counter: {'tiktoken cl100k_base' if _ENCODING else 'CJK=1 / other=4 chars heuristic'}")
+    full = full_prompt()
+    full_tokens = count_tokens(full)
+    full_build = measure(full_prompt)
+    print(f"{'full prompt':36s} {len(full):6d} chars {full_tokens:6d} tokens  build {full_build * 1e6:6.1f} us")
+
+    saved = []
+    for message, trip_info, history in CASES:
+        prompt = trimmed_prompt(message, trip_info, history)
+        tokens = count_tokens(prompt)
+        build = measure(lambda message=message, trip_info=trip_info, history=history:
+                        trimmed_prompt(message, trip_info, history))
+        saved.append(1 - tokens / full_tokens)
+        print(f"{message[:18]:18s}{'':18s} {len(prompt):6d} chars {tokens:6d} tokens  "
+              f"build {build * 1e6:6.1f} us  (-{saved[-1]:.0%})")
+    print(f"average input tokens saved: {statistics.mean(saved):.0%}")
+
+    if live:
+        for message, trip_info, history in CASES:
+            old, old_tokens = asyncio.run(live_latency(full, message, history, n))
+            trimmed = trimmed_prompt(message, trip_info, history)
+            new, new_tokens = asyncio.run(live_latency(trimmed, message, history, n))
+            print(f"{message[:18]:18s} full {old * 1e3:7.0f} ms ({old_tokens} in)  "
+                  f"trimmed {new * 1e3:7.0f} ms ({new_tokens} in)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,42 @@
+"""机场 -> 城市码查找基准：原线性扫描 vs 预计算索引
+
+用法（backend 目录下）:
+    python -m benchmarks.bench_reference_index
+"""
+import timeit
+
+from app.core.reference_index import reference_index
+
+CITY_MAPPING = {"cities": list(reference_index.cities)}
+
+# 覆盖首个城市、末尾城市的非主机场、城市码本身和未知代码
+CODES = ["SHA", "PVG", "PKX", "HKG", "NRT", "HND", reference_index.cities[-1]["airports"][-1]["code"], "XXX"]
+
+
+def linear_scan(airport_code: str) -> str:
+    """原 FlightSearchService.get_city_code_by_airport 实现"""
+    if not airport_code:
+        return airport_code
+    for city in CITY_MAPPING.get("cities", []):
+        if city.get("city_code") == airport_code:
+            return airport_code
+        for airport in city.get("airports", []):
+            if airport.get("code") == airport_code:
+                return city.get("city_code")
+    return airport_code
+
+
+def main(number: int = 20000):
+    for code in CODES:
+        assert linear_scan(code) == reference_index.city_code_of(code), code
+
+    scan = timeit.timeit(lambda: [linear_scan(c) for c in CODES], number=number)
+    index = timeit.timeit(lambda: [reference_index.city_code_of(c) for c in CODES], number=number)
+    lookups = number * len(CODES)
+    print(f"cities={len(reference_index.cities)} lookups={lookups}")
+    print(f"linear scan: {scan / lookups * 1e9:8.1f} ns/lookup")
+    print(f"index:       {index / lookups * 1e9:8.1f} ns/lookup  ({scan / index:.0f}x)")
+
+
+if __name__ == "__main__":
+    main()
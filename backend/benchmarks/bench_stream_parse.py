@@ -0,0 +1,124 @@
+"""搜索响应解析内存基准：整体解析（response.json）vs 流式解析
+
+构造一个数 MB 的 finished 响应（航段/产品带有大量转换用不到的字段，接近真实热门国际航线），
+经 httpx MockTransport 分块返回，用 tracemalloc 统计一次搜索的内存峰值与搜索结束后结果占用的内存。
+
+用法（backend 目录下）:
+    python -m benchmarks.bench_stream_parse
+"""
+import asyncio
+import gc
+import json
+import time
+import tracemalloc
+
+import httpx
+
+from app.core.config import settings
+from app.services.flight_search import FlightSearchService
+
+TRIP_INFO = {
+    "travel_type": "OW",
+    "departure_code": "SHA",
+    "arrival_code": "LHR",
+    "dep_date": "2026-10-01",
+    "passengers": [{"type": "ADT", "count": 1}],
+}
+
+
+def make_station(code: str, city: str) -> dict:
+    return {
+        "stationCode": code, "cityName": city, "stationName": f"{city}国际机场", "terminal": "T2",
+        "cityCode": code, "countryCode": "CN", "countryName": "中国", "timeZone": "+08:00",
+        "latitude": "31.1443", "longitude": "121.8083", "airportType": "INTL"
+    }
+
+
+def make_response(products: int = 1500, segments: int = 3000) -> dict:
+    segments_map = {}
+    for i in range(segments):
+        segments_map[f"seg{i}"] = {
+            "lineNo": f"MU{1000 + i}", "mktCode": "MU", "mktName": "东方航空", "oprCode": "MU", "oprName": "东方航空",
+            "depStation": make_station("PVG", "上海"), "arrStation": make_station("LHR", "伦敦"),
+            "depDate": "2026-10-01 08:00:00", "arrDate": "2026-10-01 14:00:00", "travelTime": 780,
+            "equip": {"craftName": "波音787", "craftType": "789", "wideBody": True, "seats": 280},
+            "meal": "正餐", "stops": [], "shareFlag": False, "codeShares": [f"FM{i}", f"KL{i}"],
+            "baggage": {"checked": "2PC", "carryOn": "1PC", "desc": "每件不超过23公斤，三边之和不超过158厘米"},
+        }
+    trip_products = []
+    for i in range(products):
+        keys = [f"seg{(i * 2) % segments}", f"seg{(i * 2 + 1) % segments}"]
+        price = {"totalPrice": 5000 + i, "price": 4000 + i, "tax": 1000, "foreignTotalPrice": 0,
+                 "currency": "CNY", "fareBasis": "YOW1Y", "rules": "退改收费，以航司规定为准"}
+        trip_products.append({
+            "trip": {
+                "id": f"trip{i}", "type": "INTL_NORMAL", "hasTransferItem": True,
+                "items": [{"flightKeys": [
+                    {"flightKey": k, "sequence": n + 1, "index": n + 1} for n, k in enumerate(keys)
+                ]}],
+            },
+            "priceQuote": {
+                "cabinClassCode": "Y", "cabinNum": "9",
+                "totalPrice": {"adultPrice": price, "childPrice": price, "infantPrice": price},
+                "policies": [
+                    {"policyId": f"P{i}-{n}", "desc": "儿童票按成人票价 75% 计算，婴儿不占座"} for n in range(3)
+                ],
+            },
+            "labels": [{"name": "行李直挂"}],
+            "ext": {"shoppingKey": "x" * 120, "sourceType": "GDS"},
+        })
+    return {"data": {
+        "success": True, "finished": True, "sleepTime": 0, "resultCount": products,
+        "route": {"segments": segments_map, "tripProducts": trip_products},
+    }}
+
+
+async def run_search(body: bytes, stream_parse: bool, chunk_size: int = 64 * 1024) -> tuple:
+    settings.SEARCH_STREAM_PARSE = stream_parse
+    service = FlightSearchService()
+
+    async def chunks():
+        view = memoryview(body)
+        for start in range(0, len(body), chunk_size):
+            yield bytes(view[start:start + chunk_size])
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        return httpx.Response(200, stream=ChunkStream())
+
+    class ChunkStream(httpx.AsyncByteStream):
+        async def __aiter__(self):
+            async for chunk in chunks():
+                yield chunk
+
+    service.http._client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    gc.collect()
+    tracemalloc.start()
+    base = tracemalloc.get_traced_memory()[0]
+    start = time.perf_counter()
+    result = await service.search(TRIP_INFO, trace_id="AI-BENCH")
+    elapsed = time.perf_counter() - start
+    gc.collect()
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    assert result["success"] and len(result["flights"]) > 0
+    first_page = result["flights"].select(sort="price", limit=20)
+    assert len(first_page) == 20
+    return elapsed, peak - base, current - base, len(result["flights"])
+
+
+def main():
+    settings.DEBUG = False
+    body = json.dumps(make_response(), ensure_ascii=False).encode("utf-8")
+    print(f"response body: {len(body) / 1e6:.1f} MB")
+    rows = {}
+    for name, stream_parse in (("full parse (response.json)", False), ("streaming parse", True)):
+        elapsed, peak, retained, flights = asyncio.run(run_search(body, stream_parse))
+        rows[name] = peak
+        print(f"{name:28s} {elapsed * 1e3:7.0f} ms  peak {peak / 1e6:6.1f} MB  retained {retained / 1e6:6.1f} MB  "
+              f"({flights} flights)")
+    full, streamed = rows.values()
+    print(f"peak reduction: {1 - streamed / full:.0%}")
+
+
+if __name__ == "__main__":
+    main()
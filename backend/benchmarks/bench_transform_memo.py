@@ -0,0 +1,102 @@
+"""响应转换基准：逐产品转换 vs 航段/价格记忆化转换
+
+构造一个航段复用率很高的 finished 响应（少量航段被大量 tripProduct 组合引用、
+价格档位有限，接近真实热门航线的中转组合），比较不带缓存与带 TransformCache 时
+transform_response 的耗时与转换结果的内存占用。
+
+用法（backend 目录下）:
+    python -m benchmarks.bench_transform_memo
+"""
+import gc
+import time
+import tracemalloc
+
+from app.services.flight_search import FlightSearchService, TransformCache
+from benchmarks.bench_stream_parse import make_station
+
+PASSENGERS = [{"type": "ADT", "count": 2}, {"type": "CHD", "count": 1}]
+
+
+def make_response(products: int = 20000, segments: int = 200, price_levels: int = 50) -> dict:
+    segments_map = {}
+    for i in range(segments):
+        segments_map[f"seg{i}"] = {
+            "lineNo": f"MU{1000 + i}", "mktCode": "MU", "mktName": "东方航空",
+            "depStation": make_station("PVG", "上海"), "arrStation": make_station("LHR", "伦敦"),
+            "depDate": "2026-10-01 08:00:00", "arrDate": "2026-10-01 14:00:00", "travelTime": 780,
+            "equip": {"craftName": "波音787"},
+        }
+    trip_products = []
+    for i in range(products):
+        keys = [f"seg{i % segments}", f"seg{(i * 7 + 1) % segments}"]
+        level = i % price_levels
+        price = {"totalPrice": str(5000 + level * 10), "price": str(4000 + level * 10), "tax": "1000"}
+        trip_products.append({
+            "trip": {
+                "id": f"trip{i}", "type": "INTL_NORMAL",
+                "items": [{"flightKeys": [
+                    {"flightKey": k, "sequence": n + 1, "index": n + 1} for n, k in enumerate(keys)
+                ]}],
+            },
+            "priceQuote": {
+                "cabinClassCode": "Y", "cabinNum": "9",
+                "totalPrice": {"adultPrice": price, "childPrice": price},
+            },
+        })
+    return {"success": True, "finished": True, "route": {"segments": segments_map, "tripProducts": trip_products}}
+
+
+def transform_uncached(service: FlightSearchService, resp: dict) -> list:
+    """改造前的转换方式：每个 tripProduct 独立转换航段与价格"""
+    req_travel_type, passenger_counts = service._transform_context(resp, "OW", PASSENGERS)
+    segments_map = resp["route"]["segments"]
+    return [
+        service._transform_trip_product(trip_product, segments_map, req_travel_type, passenger_counts)
+        for trip_product in resp["route"]["tripProducts"]
+    ]
+
+
+def measure(fn, repeat: int = 5) -> tuple:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    gc.collect()
+    tracemalloc.start()
+    result = fn()
+    retained = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del result
+    return best, retained
+
+
+def main():
+    service = FlightSearchService()
+    resp = make_response()
+    products = len(resp["route"]["tripProducts"])
+    print(f"{products} trip products, {len(resp['route']['segments'])} segments")
+
+    cached = service.transform_response(resp, "OW", PASSENGERS)
+    assert cached == transform_uncached(service, resp)
+
+    rows = {
+        "per-product transform": measure(lambda: transform_uncached(service, resp)),
+        "memoized transform": measure(lambda: service.transform_response(resp, "OW", PASSENGERS)),
+    }
+    for name, (elapsed, retained) in rows.items():
+        print(f"{name:24s} {elapsed * 1e3:7.1f} ms  retained {retained / 1e6:6.1f} MB")
+    (old, old_mem), (new, new_mem) = rows.values()
+    print(f"speedup: {old / new:.2f}x  memory: -{1 - new_mem / old_mem:.0%}")
+
+    cache = TransformCache()
+    req_travel_type, passenger_counts = service._transform_context(resp, "OW", PASSENGERS)
+    for trip_product in resp["route"]["tripProducts"]:
+        service._transform_trip_product(
+            trip_product, resp["route"]["segments"], req_travel_type, passenger_counts, cache
+        )
+    print(f"segment hits {cache.segment_hits}, price hits {cache.price_hits}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,6 @@
 """FastAPI 主入口"""
+from contextlib import asynccontextmanager
+
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from dotenv import load_dotenv
@@ -8,11 +10,30 @@ load_dotenv(override=True)
 
 from app.core.config import settings
 from app.api.chat import router as chat_router
+from app.api.metrics import router as metrics_router
+from app.api.calendar import router as calendar_router
+from app.api.debug import router as debug_router
+from app.services.flight_search import flight_search_service
+from app.services.flight_mock import flight_mock_service
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """应用生命周期：创建/关闭二方接口连接池"""
+    await flight_search_service.http.start()
+    await flight_mock_service.http.start()
+    try:
+        yield
+    finally:
+        await flight_search_service.http.aclose()
+        await flight_mock_service.http.aclose()
+
 
 app = FastAPI(
     title=settings.APP_NAME,
     description="AI 航班搜索测试提效系统",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 # CORS 配置
@@ -26,6 +47,9 @@ app.add_middleware(
 
 # 注册路由
 app.include_router(chat_router, prefix="/api", tags=["chat"])
+app.include_router(calendar_router, prefix="/api", tags=["calendar"])
+app.include_router(debug_router, prefix="/api", tags=["debug"])
+app.include_router(metrics_router, prefix="/api", tags=["metrics"])
 
 
 @app.get("/")
@@ -0,0 +1,113 @@
+import asyncio
+
+import pytest
+
+from app.core.admission import PRIORITY_BATCH, PRIORITY_INTERACTIVE, AdmissionController, AdmissionRejectedError
+
+
+@pytest.mark.asyncio
+async def test_slots_are_limited_and_granted_by_priority():
+    """测试并发名额受限，名额空出时按优先级（交互优先于批量）放行排队的调用"""
+    controller = AdmissionController({"search": (1, 4)})
+    order = []
+    release = asyncio.Event()
+
+    async def call(name: str, priority: int):
+        async with controller.slot("search", priority):
+            order.append(name)
+            await release.wait()
+
+    holder = asyncio.ensure_future(call("holder", PRIORITY_INTERACTIVE))
+    await asyncio.sleep(0)
+    waiters = [
+        asyncio.ensure_future(call("batch", PRIORITY_BATCH)),
+        asyncio.ensure_future(call("chat", PRIORITY_INTERACTIVE)),
+    ]
+    await asyncio.sleep(0)
+    stats = controller.stats()["search"]
+    assert stats["active"] == 1 and stats["queue_depth"] == 2
+
+    release.set()
+    await asyncio.gather(holder, *waiters)
+    assert order == ["holder", "chat", "batch"]
+    assert controller.stats()["search"]["active"] == 0
+
+
+@pytest.mark.asyncio
+async def test_full_queue_sheds_lower_priority_or_rejects():
+    """测试队列已满时交互请求挤掉排队的批量请求，否则直接拒绝"""
+    controller = AdmissionController({"llm": (1, 1)})
+    release = asyncio.Event()
+
+    async def call(priority: int):
+        async with controller.slot("llm", priority):
+            await release.wait()
+
+    holder = asyncio.ensure_future(call(PRIORITY_INTERACTIVE))
+    await asyncio.sleep(0)
+    batch = asyncio.ensure_future(call(PRIORITY_BATCH))
+    await asyncio.sleep(0)
+
+    # 队列已满：交互请求挤掉排队中的批量任务
+    chat = asyncio.ensure_future(call(PRIORITY_INTERACTIVE))
+    await asyncio.sleep(0)
+    with pytest.raises(AdmissionRejectedError):
+        await batch
+
+    # 同优先级直接拒绝
+    with pytest.raises(AdmissionRejectedError):
+        await call(PRIORITY_INTERACTIVE)
+
+    release.set()
+    await asyncio.gather(holder, chat)
+    stats = controller.stats()["llm"]
+    assert stats["shed"] == 1 and stats["rejected"] == 1 and stats["admitted"] == 2
+
+
+@pytest.mark.asyncio
+async def test_cancelled_waiter_leaves_queue():
+    """测试排队中被取消的调用离开队列，不占用名额"""
+    controller = AdmissionController({"mock": (1, 2)})
+    release = asyncio.Event()
+
+    async def call():
+        async with controller.slot("mock"):
+            await release.wait()
+
+    holder = asyncio.ensure_future(call())
+    await asyncio.sleep(0)
+    waiter = asyncio.ensure_future(call())
+    await asyncio.sleep(0)
+    waiter.cancel()
+    with pytest.raises(asyncio.CancelledError):
+        await waiter
+    assert controller.stats()["mock"]["queue_depth"] == 0
+
+    release.set()
+    await holder
+    assert controller.stats()["mock"]["active"] == 0
+
+
+@pytest.mark.asyncio
+async def test_mock_upload_reports_overload_without_uploading(monkeypatch):
+    """测试 Mock 准入队列已满时不上传，返回 uploaded=False 和 OVERLOADED 错误码"""
+    from app.services import flight_mock
+
+    controller = AdmissionController({"mock": (1, 0)})
+    monkeypatch.setattr(flight_mock, "admission", controller)
+    service = flight_mock.FlightMockService()
+    release = asyncio.Event()
+
+    async def hold():
+        async with controller.slot("mock"):
+            await release.wait()
+
+    holder = asyncio.ensure_future(hold())
+    await asyncio.sleep(0)
+    result = await service.upload_mock({"traceId": "MOCK-TEST"})
+    release.set()
+    await holder
+
+    assert result["code"] == "OVERLOADED"
+    assert result["uploaded"] is False and result["success"] is False
+    assert result["mock_request"] == {"traceId": "MOCK-TEST"}
@@ -0,0 +1,88 @@
+from app.core.circuit_breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def test_breaker_opens_on_failure_rate_and_probes_after_cooldown():
+    """测试失败率超过阈值后熔断，冷却结束只放行一次探测，探测结果决定恢复或重新熔断"""
+    clock = FakeClock()
+    breaker = CircuitBreaker(window=10, min_calls=4, failure_rate=0.5, slow_call=5.0, cooldown=10.0, clock=clock)
+
+    for success in (True, False, True):
+        permit = breaker.allow()
+        assert permit
+        breaker.record(success, 0.1, permit)
+    assert breaker.state == CLOSED  # 样本不足
+
+    breaker.record(False, 0.1, breaker.allow())
+    assert breaker.state == OPEN
+    assert breaker.allow() is None
+
+    clock.now = 10.0
+    probe = breaker.allow()  # 冷却结束，放行一次探测
+    assert probe and probe.probe
+    assert breaker.state == HALF_OPEN
+    assert breaker.allow() is None  # 探测进行中，其余调用仍被拒绝
+    breaker.record(True, 6.0, probe)  # 慢调用探测视为失败
+    assert breaker.state == OPEN
+
+    clock.now = 20.0
+    probe = breaker.allow()
+    breaker.release(probe)  # 探测被取消，不影响下一次探测
+    probe = breaker.allow()
+    assert probe
+    breaker.record(True, 0.1, probe)
+    breaker.release(probe)
+    assert breaker.state == CLOSED
+    assert breaker.stats()["opened"] == 2
+    assert breaker.stats()["rejected"] == 2
+
+
+def test_breaker_opens_on_slow_calls():
+    """测试慢调用率超过阈值时熔断"""
+    breaker = CircuitBreaker(window=5, min_calls=5, slow_call=1.0, slow_rate=0.8)
+    for latency in (2.0, 2.0, 0.1, 2.0, 2.0):
+        breaker.record(True, latency)
+    assert breaker.state == OPEN
+
+
+def test_half_open_probe_is_tied_to_its_own_call():
+    """测试半开状态下只有探测调用本身能释放探测位或改变状态，熔断前放行的调用结束时不影响"""
+    clock = FakeClock()
+    breaker = CircuitBreaker(min_calls=1, cooldown=10.0, clock=clock)
+
+    stale = breaker.allow()  # 熔断前放行、仍在进行中的调用
+    breaker.record(False, 0.1, breaker.allow())
+    assert breaker.state == OPEN
+
+    clock.now = 10.0
+    probe = breaker.allow()
+    assert probe.probe and breaker.state == HALF_OPEN
+
+    # 过期调用结束：既不能释放探测位放进第二个探测，也不能用自己的结果关闭熔断器
+    breaker.record(True, 0.1, stale)
+    breaker.release(stale)
+    assert breaker.state == HALF_OPEN
+    assert breaker.allow() is None
+
+    breaker.record(False, 0.1, probe)
+    breaker.release(probe)
+    assert breaker.state == OPEN
+
+    # 探测失败后的下一轮探测
+    clock.now = 20.0
+    second_probe = breaker.allow()
+    breaker.record(True, 0.1, probe)  # 上一轮探测的重复记录被忽略
+    assert breaker.state == HALF_OPEN
+    breaker.record(True, 0.1, second_probe)
+    assert breaker.state == CLOSED
+
+    # 恢复后，过期调用的结果不进入新窗口
+    breaker.record(False, 0.1, stale)
+    assert breaker.stats()["calls"] == 0
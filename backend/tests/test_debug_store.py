@@ -0,0 +1,53 @@
+import zlib
+
+from fastapi.testclient import TestClient
+
+from app.core.debug_store import DebugStore, debug_store
+from main import app
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_debug_store_compresses_and_evicts():
+    """测试压缩存储、字段大小、按字节/条数上限淘汰与过期"""
+    clock = FakeClock()
+    store = DebugStore(max_bytes=10_000, max_entries=2, ttl=60, clock=clock)
+    payload = {"mock_request": {"segments": ["MU5101"] * 500}, "search_response": None}
+
+    first = store.put(payload)
+    assert first["sizes"]["compressed"] < first["sizes"]["mock_request"]
+    assert "search_response" not in first["sizes"]
+    assert store.get(first["debug_id"]) == payload
+    assert b"".join(DebugStore.iter_decompressed(store.get_compressed(first["debug_id"]))) == zlib.decompress(
+        store.get_compressed(first["debug_id"])
+    )
+
+    second = store.put(payload)
+    third = store.put(payload)
+    assert store.get(first["debug_id"]) is None  # 超出条数上限，淘汰最久未使用的
+    assert len(store) == 2 and store.evictions == 1
+
+    clock.now = 61
+    assert store.get(second["debug_id"]) is None
+    assert store.get(third["debug_id"]) is None
+    assert store.stats()["bytes"] == 0
+
+
+def test_debug_endpoint_serves_payload_on_demand():
+    """测试 /api/debug/{id} 返回原始数据，未知 id 返回 404"""
+    summary = debug_store.put({"mock_request": {"traceId": "AI-TEST"}, "search_response": {"success": False}})
+    client = TestClient(app)
+
+    response = client.get(f"/api/debug/{summary['debug_id']}")
+    assert response.status_code == 200
+    assert response.json() == {"mock_request": {"traceId": "AI-TEST"}, "search_response": {"success": False}}
+    assert response.headers["vary"] == "Accept-Encoding"
+    identity = client.get(f"/api/debug/{summary['debug_id']}", headers={"Accept-Encoding": "identity"})
+    assert identity.headers["vary"] == "Accept-Encoding" and "content-encoding" not in identity.headers
+    assert client.get("/api/debug/unknown").status_code == 404
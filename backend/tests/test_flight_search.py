@@ -0,0 +1,479 @@
+import asyncio
+import json
+
+import httpx
+import pytest
+from fastapi import HTTPException
+
+from app.core.circuit_breaker import CircuitBreaker
+from app.core.config import settings
+from app.core.json_stream import CompressedJson
+from app.services.flight_filter import FilterPlan, FlightResultSet
+from app.services.flight_search import FlightSearchService
+from app.services.search_polling import HedgePolicy, SearchPoller
+
+
+def make_segment(flight_no: str, dep: str = "PVG", arr: str = "HKG") -> dict:
+    return {
+        "lineNo": flight_no,
+        "mktCode": flight_no[:2],
+        "mktName": flight_no[:2],
+        "depStation": {"stationCode": dep, "cityName": dep},
+        "arrStation": {"stationCode": arr, "cityName": arr},
+        "depDate": "2026-10-01 08:00:00",
+        "arrDate": "2026-10-01 11:00:00",
+        "travelTime": 180,
+    }
+
+
+def make_product(trip_id: str, flight_key: str, price: int) -> dict:
+    return {
+        "trip": {"id": trip_id, "items": [{"flightKeys": [{"flightKey": flight_key, "sequence": 1, "index": 1}]}]},
+        "priceQuote": {
+            "cabinClassCode": "Y",
+            "totalPrice": {"adultPrice": {"totalPrice": price, "price": price - 100, "tax": 100}},
+        },
+    }
+
+
+def make_poll(products: list, finished: bool) -> dict:
+    segments = {p["trip"]["items"][0]["flightKeys"][0]["flightKey"]: make_segment(f"MU{p['trip']['id']}") for p in products}
+    return {
+        "data": {
+            "success": True,
+            "finished": finished,
+            "sleepTime": 1,
+            "route": {"segments": segments, "tripProducts": products},
+        }
+    }
+
+
+@pytest.fixture
+def search_service(monkeypatch):
+    monkeypatch.setattr(settings, "SEARCH_POLL_MIN_SLEEP", 0.01)
+    return FlightSearchService()
+
+
+def use_polls(service: FlightSearchService, polls: list) -> list:
+    """让服务依次返回给定的轮询响应，返回收到的请求体列表"""
+    requests = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        requests.append(json.loads(request.content))
+        return httpx.Response(200, json=polls[min(len(requests), len(polls)) - 1])
+
+    service.http._client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    return requests
+
+
+TRIP_INFO = {
+    "travel_type": "OW",
+    "departure_code": "SHA",
+    "arrival_code": "HKG",
+    "dep_date": "2026-10-01",
+    "passengers": [{"type": "ADT", "count": 1}],
+}
+
+
+@pytest.mark.asyncio
+async def test_search_stream_emits_only_new_products(search_service):
+    """测试轮询中间结果只下发新出现的航班，最终结果包含完整集合"""
+    a, b, c = make_product("1", "k1", 500), make_product("2", "k2", 600), make_product("3", "k3", 700)
+    use_polls(search_service, [
+        make_poll([a], finished=False),
+        make_poll([a, b], finished=False),
+        make_poll([a, b, c], finished=True),
+    ])
+
+    events = [event async for event in search_service.search_stream(TRIP_INFO)]
+
+    partials = [[f["id"] for f in e["flights"]] for e in events if e["type"] == "partial"]
+    assert partials == [["1"], ["2"]]
+    done = events[-1]
+    assert done["type"] == "done"
+    assert [f["id"] for f in done["result"]["flights"]] == ["1", "2", "3"]
+    assert done["result"]["flights"][0]["price"]["total"] == "500"
+
+
+@pytest.mark.asyncio
+async def test_search_returns_best_so_far_when_budget_exhausted(search_service):
+    """测试预算耗尽时返回已有结果，且请求体只序列化一次、保持不变"""
+    requests = use_polls(search_service, [make_poll([make_product("1", "k1", 500)], finished=False)])
+
+    result = await search_service.search(TRIP_INFO, time_budget=0.2, trace_id="AI-TEST")
+
+    assert result["success"] is True
+    assert result["timed_out"] is True
+    assert [f["id"] for f in result["flights"]] == ["1"]
+    assert len(requests) >= 2
+    assert all(r == requests[0] for r in requests)
+    assert len(result["polling"]["timings"]) == len(requests)
+
+
+@pytest.mark.asyncio
+async def test_timed_out_search_is_not_cached(search_service, monkeypatch):
+    """测试预算耗尽返回的不完整结果不写入缓存，下一次搜索重新轮询上游"""
+    monkeypatch.setattr(settings, "SEARCH_CACHE_ENABLED", True)
+    polls = [make_poll([make_product("1", "k1", 500)], finished=False)]
+    requests = use_polls(search_service, polls)
+
+    partial = await search_service.search(TRIP_INFO, time_budget=0.1)
+    assert partial["timed_out"] is True
+    assert len(search_service.cache) == 0
+
+    polled = len(requests)
+    polls[:] = [make_poll([make_product("1", "k1", 500), make_product("2", "k2", 600)], finished=True)]
+    complete = await search_service.search(TRIP_INFO)
+    assert len(requests) > polled
+    assert complete["timed_out"] is False
+    assert sorted(f["id"] for f in complete["flights"]) == ["1", "2"]
+
+    cached = await search_service.search(TRIP_INFO)
+    assert cached is complete and len(requests) == polled + 1
+
+
+@pytest.mark.asyncio
+async def test_reduced_budget_search_does_not_merge_with_full_search(search_service, monkeypatch):
+    """测试缩短预算的搜索（如低价日历）不与同参数的对话搜索合并，对话搜索不会拿到被截断的结果"""
+    monkeypatch.setattr(settings, "SEARCH_CACHE_ENABLED", True)
+    polls = [make_poll([make_product("1", "k1", 500)], finished=False)] * 3
+    polls.append(make_poll([make_product("1", "k1", 500), make_product("2", "k2", 600)], finished=True))
+    use_polls(search_service, polls)
+
+    calendar, chat = await asyncio.gather(
+        search_service.search(TRIP_INFO, time_budget=0.02),
+        search_service.search(TRIP_INFO),
+    )
+
+    assert calendar["timed_out"] is True
+    assert chat["timed_out"] is False
+    assert sorted(f["id"] for f in chat["flights"]) == ["1", "2"]
+    assert search_service._inflight.shared == 0
+
+
+def test_poller_clamps_and_backs_off():
+    """测试等待间隔夹紧到上限，结果不增长时退避，剩余预算不足时停止"""
+    now = [0.0]
+    poller = SearchPoller(budget=10, min_sleep=0.1, max_sleep=2, poll_timeout=5, clock=lambda: now[0])
+
+    poller.record(0.05, {"sleepTime": 60000, "resultCount": 1})
+    assert poller.next_sleep({"sleepTime": 60000, "resultCount": 1}) == 2
+
+    poller.record(0.05, {"sleepTime": 200, "resultCount": 2})
+    assert poller.next_sleep({"sleepTime": 200, "resultCount": 2}) == pytest.approx(0.2)
+    poller.record(0.05, {"sleepTime": 200, "resultCount": 2})
+    assert poller.next_sleep({"sleepTime": 200, "resultCount": 2}) == pytest.approx(0.3)
+
+    now[0] = 9.9
+    assert poller.request_timeout() == pytest.approx(0.1)
+    assert poller.next_sleep({"sleepTime": 200, "resultCount": 3}) is None
+
+
+def test_flight_table_filters_on_columns_and_materializes_selected_rows(search_service):
+    """测试列式结果表的过滤/排序与 dict 过滤一致，且只物化被选中的行"""
+    products = [make_product(str(i), f"k{i}", 1000 - i * 10) for i in range(6)]
+    resp = make_poll(products, finished=True)["data"]
+    resp["route"]["segments"]["k1"]["mktCode"] = "CA"
+    resp["route"]["segments"]["k2"]["depStation"]["stationCode"] = "SHA"
+
+    table = search_service.build_flight_table(resp, "OW", TRIP_INFO["passengers"])
+    flights = search_service.transform_response(resp, "OW", TRIP_INFO["passengers"])
+
+    options = {"airline_code": "MU", "dep_airport_code": "PVG", "direct_only": True}
+    rows = table.select(**options, sort="price", limit=2)
+    assert table.stats()["materialized"] == 0
+    assert [f["id"] for f in table.materialize(rows)] == ["5", "4"]
+    assert table.stats()["materialized"] == 2
+
+    expected = search_service.filter_flights(flights, **options)
+    assert search_service.filter_flights(table, **options) == expected
+
+
+def test_table_filter_masks_match_dict_filter(search_service):
+    """测试列掩码求交（多航司行、航班号子串、候选行顺序）与 dict 过滤结果一致"""
+    products = [make_product(str(i), f"k{i}", 1000 - i * 10) for i in range(8)]
+    resp = make_poll(products, finished=True)["data"]
+    for key in ("k1", "k3", "k6"):
+        resp["route"]["segments"][key]["mktCode"] = "CA"
+    resp["route"]["segments"]["k5"]["depStation"]["stationCode"] = "SHA"
+    table = search_service.build_flight_table(resp, "OW", TRIP_INFO["passengers"])
+    flights = search_service.transform_response(resp, "OW", TRIP_INFO["passengers"])
+    flights[2]["is_transfer"] = True
+    table.transfer[2] = 1
+
+    for options in ({"airline_code": "CA"}, {"airline_code": "MU", "direct_only": True, "dep_airport_code": "PVG"},
+                    {"flight_no": "mu7", "direct_only": True}, {"airline_code": "ZZ"}):
+        expected = [f["id"] for f in search_service.filter_flights(flights, **options)]
+        assert [f["id"] for f in table.materialize(table.select(**options))] == expected
+
+    assert FlightResultSet.build(table, airline_code="MU").rows == [0, 2, 4, 5, 7]
+    assert FilterPlan(airline_code="CA").apply_table(table, [7, 6, 3, 1, 0]) == [6, 3, 1]
+
+
+def test_filter_flights_single_pass_sort_and_top_k(search_service):
+    """测试过滤计划的排序、取前 K 条与分页"""
+    products = [make_product(str(i), f"k{i}", price) for i, price in enumerate([800, 500, 900, 600, 700])]
+    flights = search_service.transform_response(make_poll(products, finished=True)["data"], "OW", TRIP_INFO["passengers"])
+
+    cheapest = search_service.filter_flights(flights, direct_only=True, flight_no="mu", sort_by="price", limit=2)
+    assert [f["price"]["total"] for f in cheapest] == ["500", "600"]
+
+    second_page = search_service.filter_flights(flights, sort_by="price", descending=True, limit=2, offset=2)
+    assert [f["price"]["total"] for f in second_page] == ["700", "600"]
+
+    with pytest.raises(ValueError):
+        search_service.filter_flights(flights, sort_by="unknown")
+
+
+def test_result_set_pages_without_research(search_service):
+    """测试结果集按需分页/换排序，只物化当前页"""
+    products = [make_product(str(i), f"k{i}", price) for i, price in enumerate([800, 500, 900, 600, 700])]
+    resp = make_poll(products, finished=True)["data"]
+    resp["route"]["segments"]["k4"]["mktCode"] = "CA"
+    table = search_service.build_flight_table(resp, "OW", TRIP_INFO["passengers"])
+
+    result_set = FlightResultSet.build(table, airline_code="MU")
+    assert len(result_set) == 4
+
+    first = result_set.page(0, 2, sort="price")
+    assert [f["price"]["total"] for f in first] == ["500", "600"]
+    assert table.stats()["materialized"] == 2
+    assert [f["price"]["total"] for f in result_set.page(2, 2, sort="price")] == ["800", "900"]
+    assert [f["price"]["total"] for f in result_set.page(0, 1, sort="price", descending=True)] == ["900"]
+    assert result_set.page(4, 2, sort="price") == []
+
+
+@pytest.mark.asyncio
+async def test_session_result_sets_expire(search_service, monkeypatch):
+    """测试会话结果集按 TTL 淘汰，淘汰后翻页返回 410，从未搜索过返回 404"""
+    from app.api import chat
+    from app.core.cache import TTLCache
+
+    now = [0.0]
+    monkeypatch.setattr(chat, "result_sets", TTLCache(maxsize=2, ttl=60, clock=lambda: now[0]))
+    monkeypatch.setitem(chat.sessions, "s1", {"history": [], "trip_info": {}, "has_flight_results": True})
+    monkeypatch.setitem(chat.sessions, "s2", {"history": [], "trip_info": {}})
+    table = search_service.build_flight_table(make_poll([make_product("1", "k1", 500)], finished=True)["data"],
+                                              "OW", TRIP_INFO["passengers"])
+    chat.result_sets.set("s1", {"result_set": FlightResultSet(table), "is_mocked": False})
+
+    page = await chat.get_session_flights("s1", offset=0, limit=10, sort=None)
+    assert page["total"] == 1
+
+    now[0] = 61
+    with pytest.raises(HTTPException) as expired:
+        await chat.get_session_flights("s1", offset=0, limit=10, sort=None)
+    assert expired.value.status_code == 410
+    with pytest.raises(HTTPException) as missing:
+        await chat.get_session_flights("s2", offset=0, limit=10, sort=None)
+    assert missing.value.status_code == 404
+
+
+@pytest.mark.asyncio
+async def test_round_trip_searches_legs_concurrently_and_joins(search_service, monkeypatch):
+    """测试往返拆分为两程并发轮询，按衔接时间拼接并按总价排序"""
+    monkeypatch.setattr(settings, "SEARCH_SPLIT_RT", True)
+    outbound = make_poll([make_product("1", "k1", 500), make_product("2", "k2", 800)], finished=True)
+    inbound = make_poll([make_product("3", "k3", 300)], finished=True)
+    inbound["data"]["route"]["segments"]["k3"].update(depDate="2026-10-05 09:00:00", arrDate="2026-10-05 12:00:00")
+    requests = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        body = json.loads(request.content)
+        requests.append(body)
+        line = body["reqUserLines"][0]
+        return httpx.Response(200, json=outbound if line["depCityCode"] == "SHA" else inbound)
+
+    search_service.http._client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    trip_info = {**TRIP_INFO, "travel_type": "RT", "return_date": "2026-10-05"}
+
+    result = await search_service.search(trip_info)
+
+    assert result["success"] is True
+    assert sorted(r["reqUserLines"][0]["depDate"] for r in requests) == ["2026-10-01", "2026-10-05"]
+    assert all(r["travelType"] == "OW" for r in requests)
+    flights = list(result["flights"])
+    assert [f["id"] for f in flights] == ["1+3", "2+3"]
+    assert flights[0]["price"]["total"] == "800"
+    assert flights[0]["travel_type"] == "RT"
+    assert [seg["leg"] for seg in flights[0]["segments"]] == [1, 2]
+
+
+def test_open_jaw_legs_build_request_lines(search_service):
+    """测试缺口程按 legs 生成逐程 trip_info 与请求行程"""
+    trip_info = {
+        **TRIP_INFO,
+        "travel_type": "OJ",
+        "legs": [
+            {"departure_code": "SHA", "arrival_code": "NRT", "dep_date": "2026-10-01"},
+            {"departure_code": "KIX", "arrival_code": "SHA", "dep_date": "2026-10-08"},
+        ],
+    }
+    assert search_service.split_legs(trip_info)
+    legs = search_service.trip_legs(trip_info)
+    assert [(leg["travel_type"], leg["departure_code"], leg["arrival_code"]) for leg in legs] == [
+        ("OW", "SHA", "NRT"), ("OW", "KIX", "SHA")
+    ]
+    lines = search_service.build_search_request(trip_info)["reqUserLines"]
+    assert [line["depDate"] for line in lines] == ["2026-10-01", "2026-10-08"]
+
+
+@pytest.mark.asyncio
+async def test_city_search_fans_out_per_airport_and_reuses_pair_cache(search_service, monkeypatch):
+    """测试城市级搜索按机场对扇出、按机场与签名去重，之后的单机场搜索复用机场对缓存"""
+    monkeypatch.setattr(settings, "SEARCH_AIRPORT_FANOUT", True)
+    poll = make_poll([make_product("1", "k1", 500), make_product("2", "k2", 600), make_product("3", "k3", 700)], finished=True)
+    poll["data"]["route"]["segments"]["k2"]["depStation"]["stationCode"] = "SHA"
+    poll["data"]["route"]["segments"]["k3"]["lineNo"] = "MU1"  # 与 1 号航班签名相同，价格更高
+    requests = use_polls(search_service, [poll])
+
+    result = await search_service.search(TRIP_INFO)
+
+    assert sorted(r["reqUserLines"][0]["depCityCode"] for r in requests) == ["PVG", "SHA"]
+    assert sorted(f["id"] for f in result["flights"]) == ["1", "2"]
+    assert set(result["raw_response"]["pairs"]) == {"SHA-HKG", "PVG-HKG"}
+
+    pvg_only = await search_service.search({**TRIP_INFO, "departure_code": "PVG"})
+    assert len(requests) == 2
+    assert [f["id"] for f in pvg_only["flights"]] == ["1"]
+
+
+@pytest.mark.asyncio
+async def test_streaming_parse_matches_full_parse_and_compresses_raw(search_service, monkeypatch):
+    """测试流式解析与整体解析得到相同航班，原始响应以压缩形式保存"""
+    poll = make_poll([make_product(str(i), f"k{i}", 500 + i) for i in range(5)], finished=True)
+    for segment in poll["data"]["route"]["segments"].values():
+        segment["unused"] = {"payload": "x" * 200}
+    use_polls(search_service, [poll])
+    monkeypatch.setattr(settings, "SEARCH_STREAM_CHUNK_SIZE", 97)
+    streamed = await search_service.search(TRIP_INFO, trace_id="AI-STREAM")
+
+    monkeypatch.setattr(settings, "SEARCH_STREAM_PARSE", False)
+    full = await search_service.search(TRIP_INFO, trace_id="AI-FULL")
+
+    assert list(streamed["flights"]) == list(full["flights"])
+    assert isinstance(streamed["raw_response"], CompressedJson)
+    assert streamed["raw_response"].load() == poll
+    assert len(streamed["raw_response"].data) < streamed["raw_response"].size
+
+
+def test_transform_converts_shared_segments_once(search_service):
+    """测试共享航段和价格的 tripProduct 只转换一次，结果与逐个转换一致"""
+    shared = make_product("t1", "seg1", 900)
+    products = [shared, {**make_product("t2", "seg1", 900), "trip": {**shared["trip"], "id": "t2"}}]
+    resp = {"success": True, "route": {"segments": {"seg1": make_segment("MU501")}, "tripProducts": products}}
+    passengers = [{"type": "ADT", "count": 2}]
+
+    flights = search_service.transform_response(resp, "OW", passengers)
+    req_travel_type, passenger_counts = search_service._transform_context(resp, "OW", passengers)
+    uncached = [
+        search_service._transform_trip_product(p, resp["route"]["segments"], req_travel_type, passenger_counts)
+        for p in products
+    ]
+    assert flights == uncached
+    assert flights[0]["price"]["total"] == "1800"
+    # 航段主体只转换一次，嵌套结构在航班之间共享
+    assert flights[0]["segments"][0]["airline"] is flights[1]["segments"][0]["airline"]
+    assert flights[0]["price"]["passenger_prices"] is flights[1]["price"]["passenger_prices"]
+
+
+@pytest.mark.asyncio
+async def test_slow_poll_is_hedged_and_breaker_short_circuits(search_service, monkeypatch):
+    """测试轮询超过对冲延迟时发出相同的对冲请求并取先返回的，熔断后不再请求上游"""
+    monkeypatch.setattr(settings, "SEARCH_CACHE_ENABLED", False)
+    calls = []
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        calls.append(request.content)
+        if len(calls) == 1:
+            await asyncio.sleep(5)  # 第一次轮询卡住，对冲请求先返回
+        return httpx.Response(200, json=make_poll([make_product("1", "k1", 900)], finished=True))
+
+    search_service.http._client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    search_service.hedging = HedgePolicy(percentile=0.9, min_samples=3, min_delay=0.05, enabled=True)
+    for _ in range(3):
+        search_service.hedging.record(0.01)
+
+    result = await search_service.search(TRIP_INFO)
+    assert result["success"] and len(result["flights"]) == 1
+    assert len(calls) == 2 and calls[0] == calls[1]  # 同一请求体（同一 traceId）
+    assert search_service.hedging.stats()["hedge_wins"] == 1
+
+    # 熔断后不再请求上游
+    search_service.breaker = CircuitBreaker(min_calls=1, cooldown=60)
+    search_service.breaker.record(False, 0.1)
+    result = await search_service.search(TRIP_INFO)
+    assert not result["success"] and result["circuit_open"]
+    assert len(calls) == 2
+
+
+@pytest.mark.asyncio
+async def test_half_open_breaker_admits_one_probe_while_stale_search_finishes(search_service, monkeypatch):
+    """测试半开状态下熔断前发起的搜索结束时不会放进第二个探测，也不会替探测决定熔断器状态"""
+    monkeypatch.setattr(settings, "SEARCH_CACHE_ENABLED", False)
+    now = [0.0]
+    search_service.breaker = CircuitBreaker(min_calls=1, cooldown=10, clock=lambda: now[0])
+    gates = [asyncio.Event(), asyncio.Event()]
+    calls = []
+
+    async def handler(request: httpx.Request) -> httpx.Response:
+        calls.append(request)
+        await gates[min(len(calls), 2) - 1].wait()
+        return httpx.Response(200, json=make_poll([make_product("1", "k1", 900)], finished=True))
+
+    search_service.http._client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+
+    stale = asyncio.ensure_future(search_service.search(TRIP_INFO))  # 熔断前放行
+    while not calls:
+        await asyncio.sleep(0)
+    search_service.breaker.record(False, 0.1)
+    now[0] = 10
+    probe = asyncio.ensure_future(search_service.search(TRIP_INFO))
+    while len(calls) < 2:
+        await asyncio.sleep(0)
+    assert search_service.breaker.state == "half_open"
+
+    gates[0].set()
+    assert (await stale)["success"]
+    assert search_service.breaker.state == "half_open"
+    rejected = await search_service.search(TRIP_INFO)
+    assert rejected["circuit_open"] and len(calls) == 2
+
+    gates[1].set()
+    assert (await probe)["success"]
+    assert search_service.breaker.state == "closed"
+
+
+@pytest.mark.asyncio
+async def test_closing_search_stream_cancels_upstream_polling(search_service, monkeypatch):
+    """测试关闭搜索事件流后上游不再被轮询并释放准入名额；合并的搜索仍有其他等待方时继续轮询"""
+    from app.core.admission import admission
+
+    monkeypatch.setattr(settings, "SEARCH_CACHE_ENABLED", True)
+    requests = use_polls(search_service, [make_poll([make_product("1", "k1", 500)], finished=False)])
+
+    async def polls_after_settle() -> int:
+        await asyncio.sleep(0.05)
+        count = len(requests)
+        await asyncio.sleep(0.2)
+        return count
+
+    # 唯一的等待方关闭事件流（如 Mock 胜出）：轮询任务被取消
+    stream = search_service.search_stream(TRIP_INFO)
+    assert (await stream.__anext__())["type"] == "partial"
+    await stream.aclose()
+    assert await polls_after_settle() == len(requests)
+    assert admission.gates["search"].active == 0
+    assert search_service._inflight.cancelled == 1
+
+    # 领头的调用方离开，合并进来的调用方仍在等待：继续轮询，它也离开后才取消
+    leader = search_service.search_stream(TRIP_INFO)
+    await leader.__anext__()
+    follower = asyncio.ensure_future(search_service.search(TRIP_INFO))
+    await asyncio.sleep(0.02)
+    await leader.aclose()
+    assert await polls_after_settle() < len(requests)
+    follower.cancel()
+    assert await polls_after_settle() == len(requests)
+    assert admission.gates["search"].active == 0
+    assert search_service._inflight.cancelled == 2
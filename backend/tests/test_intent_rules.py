@@ -0,0 +1,52 @@
+from datetime import date
+
+import pytest
+
+from app.services.intent_rules import rule_intent_parser
+
+TODAY = date(2026, 10, 17)  # 星期六
+
+
+def test_formulaic_query_skips_llm():
+    """测试格式化的常见查询（日期+城市对）由规则直接解析，无需调用 LLM"""
+    result = rule_intent_parser.parse("明天上海到香港", today=TODAY)
+    assert result["status"] == "complete" and result["clarify"] is None
+    trip = result["trip_info"]
+    assert (trip["departure_code"], trip["arrival_code"], trip["dep_date"]) == ("SHA", "HKG", "2026-10-18")
+    assert trip["passengers"] == [{"type": "ADT", "count": 1}]
+    assert (trip["cabin_class"], trip["cabin_name"]) == ("Y", "经济舱")
+
+
+def test_codes_passengers_cabin_airline_and_channel():
+    """测试规则识别机场三字码、乘客人数、舱位、航司和渠道"""
+    result = rule_intent_parser.parse("下周三 PVG 到 ICN 2大1小 商务舱 东航 微信H5", today=TODAY)
+    trip = result["trip_info"]
+    assert (trip["departure_city"], trip["departure_code"], trip["arrival_code"]) == ("上海", "PVG", "ICN")
+    assert trip["dep_date"] == "2026-10-21"
+    assert trip["passengers"] == [{"type": "ADT", "count": 2}, {"type": "CHD", "count": 1}]
+    assert (trip["cabin_class"], trip["airline_code"], trip["channel"]) == ("C", "MU", "WX")
+
+
+def test_round_trip_and_missing_date_clarify():
+    """测试往返行程的解析，以及缺少出发日期时返回日期澄清选项"""
+    trip = rule_intent_parser.parse("10月20日上海浦东到东京往返，10月25日回", today=TODAY)["trip_info"]
+    assert (trip["travel_type"], trip["departure_code"], trip["dep_date"], trip["return_date"]) == \
+        ("RT", "PVG", "2026-10-20", "2026-10-25")
+
+    result = rule_intent_parser.parse("上海到香港", today=TODAY)
+    assert result["status"] == "need_clarify"
+    assert result["clarify"]["field"] == "dep_date"
+    assert result["clarify"]["options"][0]["value"] == "2026-10-18"
+
+
+@pytest.mark.parametrize("message", [
+    "明天上海经曼谷到伦敦",  # 中转
+    "MU5101 明天上海到北京",  # 航班号
+    "15号上海到北京",  # 只有日，不确定月份
+    "周五上海到成都",  # 本周五已过
+    "去香港，明天从上海出发",  # 倒装
+    "帮我订张便宜点的票",
+])
+def test_ambiguous_messages_fall_through_to_llm(message):
+    """测试规则无法确定的消息（中转、航班号、模糊日期等）返回 None，交给 LLM 解析"""
+    assert rule_intent_parser.parse(message, today=TODAY) is None
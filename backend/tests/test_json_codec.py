@@ -0,0 +1,56 @@
+from app.core import json_codec
+
+
+def test_sse_event_is_compact_utf8_bytes():
+    """测试 SSE 帧为紧凑 UTF-8 bytes，orjson 下中文不转义，可原样解码"""
+    event = {
+        "type": "progress",
+        "message": "正在检索实时航线信息...",
+        "flights": [{"id": "1", "price": {"total": "500"}}],
+    }
+    frame = json_codec.sse_event(event)
+
+    assert isinstance(frame, bytes)
+    assert frame.startswith(b"data: {") and frame.endswith(b"}\n\n")
+    if json_codec.BACKEND == "orjson":
+        assert "正在检索".encode() in frame and b"\\u" not in frame
+    else:
+        assert frame.isascii()
+    assert b", " not in frame and b": " not in frame[6:]
+    assert json_codec.loads(frame[6:]) == event
+    assert json_codec.loads(json_codec.dumps_str(event)) == event
+
+
+def test_json_splitter_yields_target_items_across_chunk_boundaries():
+    """测试增量解析：任意分块下逐个交出目标容器元素，骨架中不保留目标容器"""
+    import json
+
+    from app.core.json_stream import JsonSplitter
+
+    doc = {
+        "data": {
+            "success": True,
+            "sleepTime": 1000,
+            "route": {
+                "segments": {
+                    f"k{i}": {"lineNo": f"MU{i}", "depStation": {"cityName": "上海\"浦东\""}} for i in range(20)
+                },
+                "tripProducts": [{"trip": {"id": str(i)}, "price": i * 1.5} for i in range(10)],
+                "resultCount": 10,
+            },
+        }
+    }
+    body = json.dumps(doc, ensure_ascii=False, indent=1).encode("utf-8")
+    targets = {("data", "route", "segments"), ("data", "route", "tripProducts")}
+
+    for chunk_size in (1, 5, 4096):
+        items = []
+        splitter = JsonSplitter(targets, lambda path, key, value, items=items: items.append((path[-1], key, value)))
+        for start in range(0, len(body), chunk_size):
+            splitter.feed(body[start:start + chunk_size])
+        skeleton = splitter.close()
+
+        assert {k: v for p, k, v in items if p == "segments"} == doc["data"]["route"]["segments"]
+        products = list(enumerate(doc["data"]["route"]["tripProducts"]))
+        assert [(k, v) for p, k, v in items if p == "tripProducts"] == products
+        assert skeleton == {"data": {"success": True, "sleepTime": 1000, "route": {"resultCount": 10}}}
@@ -0,0 +1,54 @@
+import json
+
+from app.core.json_stream import PartialJsonParser
+
+
+def test_parser_reports_fields_as_they_complete():
+    """分块输入时按完成顺序返回字段，跳过代码块标记，最终结果与整体解析一致"""
+    doc = {
+        "status": "complete",
+        "trip_info": {"departure_city": "上海", "passengers": [{"type": "ADT", "count": 2}], "return_date": None, "ok": True},
+        "message": "提取\"出行\"信息\n第二行é",
+        "clarify": None
+    }
+    text = "```json\n" + json.dumps(doc, ensure_ascii=True, indent=2) + "\n```"
+    parser = PartialJsonParser()
+    completed = []
+    partial_messages = []
+    for i in range(0, len(text), 5):
+        completed += parser.feed(text[i:i + 5])
+        partial = parser.partial_string()
+        if partial and partial[0] == ("message",):
+            partial_messages.append(partial[1])
+
+    assert parser.done and not parser.failed
+    assert parser.root == doc
+    paths = [path for path, _ in completed]
+    assert paths.index(("trip_info", "departure_city")) < paths.index(("trip_info",)) < paths.index(("message",))
+    assert ("trip_info", "passengers", 0, "count") in paths
+    assert partial_messages and all(doc["message"].startswith(m) for m in partial_messages)
+
+
+def test_parser_stops_on_invalid_input():
+    """测试遇到非法 JSON 时标记解析失败而不抛异常，最终结果仍由完整文本解析"""
+    parser = PartialJsonParser()
+    parser.feed('{"status": complete}')
+    assert parser.failed and not parser.done
+
+
+def test_escaped_surrogate_pair_decodes_to_one_character():
+    """测试转义的代理对（ensure_ascii 输出的 emoji）合并为一个字符，逐字输入时前缀中也不出现单独的代理"""
+    text = json.dumps({"message": "hi 😀 ok", "lone": "\ud83d"})
+    assert "\\ud83d\\ude00" in text
+    parser = PartialJsonParser()
+    partial_messages = []
+    for char in text:
+        parser.feed(char)
+        partial = parser.partial_string()
+        if partial and partial[0] == ("message",):
+            partial_messages.append(partial[1])
+
+    assert parser.root == json.loads(text)
+    assert parser.root["message"] == "hi 😀 ok"
+    assert all(not any(0xD800 <= ord(c) <= 0xDFFF for c in m) for m in partial_messages)
+    assert "hi 😀" in partial_messages
@@ -1,7 +1,16 @@
-import pytest
+import asyncio
 import json
-from unittest.mock import AsyncMock, patch
-from app.services.llm_service import LLMService
+from contextlib import aclosing
+from datetime import date
+from types import SimpleNamespace
+from unittest.mock import AsyncMock
+
+import pytest
+
+from app.services import llm_service as llm_module
+from app.services.intent_schema import INTENT_SCHEMA
+from app.services.llm_service import STATIC_PROMPT, LLMService, build_system_prompt
+
 
 @pytest.fixture
 def llm_service():
@@ -113,3 +122,220 @@ def test_merge_trip_info(llm_service):
     assert result["departure_city"] == "上海"
     assert result["dep_date"] == "2026-02-23"
     assert result["passengers"][0]["count"] == 2
+
+
+def _mock_completion(mocker, content: dict):
+    mock_response = mocker.Mock()
+    mock_response.choices = [mocker.Mock()]
+    mock_response.choices[0].message.content = json.dumps(content)
+    return mock_response
+
+
+@pytest.mark.asyncio
+async def test_parse_intent_cache_shares_identical_calls(llm_service, mocker):
+    """相同输入只调用一次 LLM：并发调用合并，之后的调用命中缓存，返回值互不影响"""
+    mock_content = {"status": "complete", "trip_info": {"departure_city": "上海", "arrival_city": "东京"}, "clarify": None, "message": "OK"}
+
+    async def slow_create(**kwargs):
+        await asyncio.sleep(0.01)
+        return _mock_completion(mocker, mock_content)
+
+    create = mocker.patch.object(llm_service.client.chat.completions, 'create', new_callable=AsyncMock, side_effect=slow_create)
+
+    first, second = await asyncio.gather(
+        llm_service.parse_intent("明天上海到东京"),
+        llm_service.parse_intent("明天上海到东京")
+    )
+    first["trip_info"]["departure_city"] = "北京"
+    third = await llm_service.parse_intent("明天上海到东京")
+    await llm_service.parse_intent("明天上海到东京", current_trip_info={"cabin_class": "C"})
+
+    assert create.await_count == 2
+    assert second["trip_info"]["departure_city"] == "上海"
+    assert third["trip_info"]["departure_city"] == "上海"
+    stats = llm_service.cache_stats()
+    assert stats["shared"] == 1
+    assert stats["memory_hits"] == 1
+    assert stats["misses"] == 3
+
+
+@pytest.mark.asyncio
+async def test_parse_intent_cache_persists_to_sqlite(mocker, monkeypatch, tmp_path):
+    """SQLite 持久层在新实例（模拟重启）中仍可命中，错误结果不缓存"""
+    monkeypatch.setattr(llm_module.settings, "LLM_CACHE_DB_PATH", str(tmp_path / "llm_cache.sqlite3"))
+    mock_content = {"status": "complete", "trip_info": {"departure_city": "上海"}, "clarify": None, "message": "OK"}
+
+    service = LLMService()
+    create = mocker.patch.object(service.client.chat.completions, 'create', new_callable=AsyncMock,
+                                 return_value=_mock_completion(mocker, mock_content))
+    await service.parse_intent("后天上海到大阪")
+    create.side_effect = RuntimeError("upstream down")
+    await service.parse_intent("后天上海到首尔")
+
+    restarted = LLMService()
+    create = mocker.patch.object(restarted.client.chat.completions, 'create', new_callable=AsyncMock,
+                                 return_value=_mock_completion(mocker, mock_content))
+    result = await restarted.parse_intent("后天上海到大阪")
+    await restarted.parse_intent("后天上海到首尔")
+
+    assert result["trip_info"]["departure_city"] == "上海"
+    assert create.await_count == 1
+    assert restarted.cache_stats()["disk_hits"] == 1
+
+
+def test_system_prompt_static_prefix_is_date_independent():
+    """静态前缀不含当天日期，日期只出现在最后的动态段落"""
+    first = build_system_prompt("- 上海: SHA", "- MU: 东方航空", "- 用户未指定渠道", today=date(2026, 3, 1))
+    second = build_system_prompt("- 上海: SHA", "- MU: 东方航空", "- 用户未指定渠道", today=date(2026, 3, 2))
+    assert first.startswith(STATIC_PROMPT) and second.startswith(STATIC_PROMPT)
+    assert "今天是 2026-03-01（星期日）" in first
+    assert "下周各天为：周一 2026-03-02" in first
+    assert "明天\"，转换为 2026-03-03" in second
+
+    blocks = LLMService.system_blocks("明天上海到香港")
+    assert blocks[0]["text"] == STATIC_PROMPT
+    assert blocks[0]["cache_control"] == {"type": "ephemeral"}
+    assert "cache_control" not in blocks[1] and "cache_control" not in blocks[2]
+
+
+@pytest.mark.asyncio
+async def test_anthropic_call_sends_cached_prefix_and_records_usage(llm_service, mocker):
+    """Anthropic 协议传入带 cache_control 的 system 块，并记录缓存读/写 token"""
+    mock_response = mocker.Mock()
+    mock_response.content = [mocker.Mock(text='{"status": "complete", "trip_info": {}, "clarify": null, "message": "OK"}')]
+    mock_response.usage = mocker.Mock(input_tokens=120, cache_read_input_tokens=3400,
+                                      cache_creation_input_tokens=0, output_tokens=80)
+    llm_service.client = mocker.Mock()
+    llm_service.client.messages.create = AsyncMock(return_value=mock_response)
+
+    blocks = LLMService.system_blocks("明天上海到香港")
+    await llm_service._call_anthropic(blocks, "明天上海到香港", None)
+
+    assert llm_service.client.messages.create.await_args.kwargs["system"][0]["cache_control"] == {"type": "ephemeral"}
+    stats = llm_service.usage_stats()
+    assert stats["calls"] == 1
+    assert stats["cache_read_tokens"] == 3400 and stats["input_tokens"] == 120
+    assert stats["cache_read_rate"] == round(3400 / 3520, 4)
+
+
+@pytest.mark.asyncio
+async def test_parse_intent_stream_emits_fields_before_result(llm_service, mocker, monkeypatch):
+    """流式解析在生成过程中推送 trip_info 字段和回复文本，最终结果写入缓存"""
+    monkeypatch.setattr(llm_module.settings, "LLM_STREAM_EVENT_INTERVAL", 0.0)
+    text = json.dumps({
+        "status": "complete",
+        "trip_info": {"departure_city": "上海", "arrival_city": "札幌", "dep_date": "2026-02-23"},
+        "clarify": None,
+        "message": "提取出行信息：明天上海至札幌"
+    }, ensure_ascii=False)
+
+    async def stream():
+        for i in range(0, len(text), 8):
+            yield SimpleNamespace(usage=None, choices=[SimpleNamespace(delta=SimpleNamespace(content=text[i:i + 8]))])
+        yield SimpleNamespace(usage=SimpleNamespace(prompt_tokens=3000, completion_tokens=60,
+                                                    prompt_tokens_details=SimpleNamespace(cached_tokens=2800)), choices=[])
+
+    create = mocker.patch.object(llm_service.client.chat.completions, 'create', new_callable=AsyncMock, return_value=stream())
+
+    events = [event async for event in llm_service.parse_intent_stream("明天上海到札幌")]
+    progress = [e for e in events if e["type"] == "progress"]
+
+    assert create.await_args.kwargs["stream"] is True
+    assert events[-1]["type"] == "result"
+    assert events[-1]["result"]["trip_info"]["arrival_city"] == "札幌"
+    assert progress[0]["trip_info"] == {"departure_city": "上海"}
+    assert any(e["message"] and e["message"] != "提取出行信息：明天上海至札幌" for e in progress)
+    assert progress[-1]["message"] == "提取出行信息：明天上海至札幌"
+    assert llm_service.usage_stats()["cache_read_tokens"] == 2800
+
+    cached = [event async for event in llm_service.parse_intent_stream("明天上海到札幌")]
+    assert cached == [events[-1]] and create.await_count == 1
+
+
+@pytest.mark.asyncio
+async def test_parse_intent_stream_shares_concurrent_identical_calls(llm_service, mocker, monkeypatch):
+    """相同输入的并发流式解析只调用一次 LLM，所有调用方都收到进度和相同的结果，提前关闭的调用方不影响其他人"""
+    monkeypatch.setattr(llm_module.settings, "LLM_STREAM_EVENT_INTERVAL", 0.0)
+    text = json.dumps({
+        "status": "complete",
+        "trip_info": {"departure_city": "上海", "arrival_city": "香港", "dep_date": "2026-02-23"},
+        "clarify": None,
+        "message": "提取出行信息：明天上海至香港"
+    }, ensure_ascii=False)
+
+    async def stream():
+        for i in range(0, len(text), 8):
+            await asyncio.sleep(0.001)
+            yield SimpleNamespace(usage=None, choices=[SimpleNamespace(delta=SimpleNamespace(content=text[i:i + 8]))])
+
+    create = mocker.patch.object(llm_service.client.chat.completions, 'create', new_callable=AsyncMock,
+                                 side_effect=lambda **kwargs: stream())
+
+    async def collect():
+        return [event async for event in llm_service.parse_intent_stream("明天上海到香港")]
+
+    async def first_progress_then_close():
+        async with aclosing(llm_service.parse_intent_stream("明天上海到香港")) as events:
+            return await anext(events)
+
+    results = await asyncio.gather(collect(), collect(), collect(), first_progress_then_close())
+
+    assert create.await_count == 1
+    assert llm_service.cache_stats()["shared"] == 3
+    assert results[3]["type"] == "progress"
+    for events in results[:3]:
+        assert events[0]["type"] == "progress"
+        assert events[-1] == results[0][-1]
+        assert events[-1]["result"]["trip_info"]["arrival_city"] == "香港"
+    assert results[0][-1]["result"] is not results[1][-1]["result"]
+    assert not llm_service._broadcasts
+
+
+def test_intent_schema_flattens_trip_info():
+    """工具调用 schema 由 TripInfo/ClarifyInfo 生成，出发/到达展开为扁平字段且不含 $ref"""
+    trip_info = INTENT_SCHEMA["properties"]["trip_info"]["properties"]
+    assert {"departure_city", "departure_code", "arrival_city", "arrival_code", "dep_date", "passengers"} <= set(trip_info)
+    assert "departure" not in trip_info
+    assert "$ref" not in json.dumps(INTENT_SCHEMA) and "$defs" not in json.dumps(INTENT_SCHEMA)
+    assert INTENT_SCHEMA["required"] == ["status", "trip_info", "clarify", "message"]
+
+
+@pytest.mark.asyncio
+async def test_tool_mode_reads_function_arguments(llm_service, mocker, monkeypatch):
+    """工具调用模式传入 tools 和更小的 max_tokens，从函数参数中读取结果并按模式统计"""
+    monkeypatch.setattr(llm_module.settings, "LLM_OUTPUT_MODE", "tool")
+    arguments = json.dumps({"status": "complete", "trip_info": {"departure_city": "上海", "arrival_city": "香港"},
+                            "clarify": None, "message": "好的"}, ensure_ascii=False)
+    call = SimpleNamespace(function=SimpleNamespace(name="submit_intent", arguments=arguments))
+    response = SimpleNamespace(
+        choices=[SimpleNamespace(message=SimpleNamespace(content=None, tool_calls=[call]))],
+        usage=SimpleNamespace(prompt_tokens=3000, completion_tokens=45, prompt_tokens_details=None)
+    )
+    create = mocker.patch.object(llm_service.client.chat.completions, 'create', new_callable=AsyncMock, return_value=response)
+
+    result = await llm_service.parse_intent("明天上海到香港")
+
+    kwargs = create.await_args.kwargs
+    assert kwargs["tools"][0]["function"]["name"] == "submit_intent"
+    assert kwargs["tool_choice"]["function"]["name"] == "submit_intent"
+    assert kwargs["max_tokens"] == llm_module.settings.LLM_TOOL_MAX_TOKENS
+    assert "submit_intent" in kwargs["messages"][0]["content"]
+    assert result["trip_info"]["arrival_city"] == "香港"
+    stats = llm_service.output_stats()
+    assert stats["tool"]["turns"] == 1 and stats["tool"]["avg_output_tokens"] == 45
+    assert stats["text"]["turns"] == 0
+
+
+@pytest.mark.asyncio
+async def test_parse_failure_is_counted(llm_service, mocker):
+    """模型输出无法解析时返回 PARSE_FAILED 并计入解析失败率"""
+    mock_response = mocker.Mock()
+    mock_response.choices = [mocker.Mock()]
+    mock_response.choices[0].message.content = "抱歉，我没有理解您的意思"
+    mocker.patch.object(llm_service.client.chat.completions, 'create', new_callable=AsyncMock, return_value=mock_response)
+
+    result = await llm_service.parse_intent("随便聊聊")
+
+    assert result["code"] == "PARSE_FAILED"
+    stats = llm_service.output_stats()["text"]
+    assert stats["turns"] == 1 and stats["parse_failures"] == 1 and stats["parse_failure_rate"] == 1.0
@@ -0,0 +1,139 @@
+import asyncio
+
+import pytest
+
+from app.core.config import settings
+from app.services.mock_speculation import MockSpeculation, race_mock
+
+TRIP_INFO = {"travel_type": "OW", "departure_code": "SHA", "arrival_code": "HKG", "dep_date": "2026-10-01"}
+
+
+def test_speculates_on_narrow_requests_and_empty_route_history(monkeypatch):
+    """测试渠道/航司舱位等窄条件以及航线连续无结果时预判需要 Mock"""
+    monkeypatch.setattr(settings, "MOCK_SPECULATIVE_EMPTY_STREAK", 2)
+    speculation = MockSpeculation()
+    assert speculation.reason(TRIP_INFO) is None
+    assert speculation.reason({**TRIP_INFO, "channel": "WX"})
+    assert speculation.reason({**TRIP_INFO, "airline_code": "MU", "cabin_class": "C"})
+    assert speculation.reason({**TRIP_INFO, "airline_code": "MU", "cabin_class": "Y"}) is None
+
+    speculation.record(TRIP_INFO, has_results=False)
+    assert speculation.reason(TRIP_INFO) is None
+    speculation.record(TRIP_INFO, has_results=False)
+    assert speculation.reason(TRIP_INFO)
+    speculation.record(TRIP_INFO, has_results=True)
+    assert speculation.reason(TRIP_INFO) is None
+
+
+@pytest.mark.asyncio
+async def test_race_yields_mock_first_and_closes_search():
+    """测试 Mock 先完成时插入 mock 事件，调用方停止迭代后关闭搜索事件流"""
+    closed = []
+
+    async def slow_search():
+        try:
+            yield {"type": "partial", "flights": []}
+            await asyncio.sleep(5)
+            yield {"type": "done", "result": {"success": True}}
+        finally:
+            closed.append(True)
+
+    async def mock():
+        await asyncio.sleep(0.01)
+        return {"success": True, "mock_request": {}}
+
+    events = []
+    race = race_mock(slow_search(), asyncio.ensure_future(mock()))
+    async for event in race:
+        events.append(event["type"])
+        if event["type"] == "mock":
+            break
+    await race.aclose()
+    assert events == ["partial", "mock"]
+    assert closed == [True]
+
+
+@pytest.mark.asyncio
+async def test_race_skips_cancelled_mock():
+    """测试 Mock 任务被取消后不产出 mock 事件，搜索事件照常产出"""
+    async def search():
+        yield {"type": "partial", "flights": [1]}
+        await asyncio.sleep(0.01)
+        yield {"type": "done", "result": {"success": True}}
+
+    mock_task = asyncio.ensure_future(asyncio.sleep(5))
+    events = []
+    async for event in race_mock(search(), mock_task):
+        events.append(event["type"])
+        mock_task.cancel()
+    assert events == ["partial", "done"]
+
+
+@pytest.mark.asyncio
+async def test_open_jaw_mock_builds_one_segment_per_leg():
+    """测试缺口程 Mock 按 legs 逐程生成航段，缺少各程信息时明确失败"""
+    from app.api.chat import build_mock_params, extract_mock_flights
+    from app.services.flight_mock import flight_mock_service
+
+    trip_info = {
+        "travel_type": "OJ",
+        "departure_code": "SHA",
+        "arrival_code": "SHA",
+        "legs": [
+            {"departure_code": "SHA", "arrival_code": "NRT", "dep_date": "2026-10-01"},
+            {"departure_code": "KIX", "arrival_code": "SHA", "dep_date": "2026-10-08"},
+        ],
+        "passengers": [{"type": "ADT", "count": 1}],
+    }
+    result = await flight_mock_service.mock_flight(**build_mock_params(trip_info), upload=False)
+
+    assert result["success"] is True
+    lines = result["mock_request"]["searchParamRequest"]["userCommonReq"]["reqUserLines"]
+    assert [(line["depCityCode"], line["arrCityCode"]) for line in lines] == [("SHA", "NRT"), ("KIX", "SHA")]
+    flights = extract_mock_flights(result["mock_request"], "OJ", trip_info["passengers"])
+    assert len(flights) == 1
+    segments = flights[0]["segments"]
+    assert [(s["departure"]["code"], s["arrival"]["code"]) for s in segments] == [("SHA", "NRT"), ("KIX", "SHA")]
+    assert segments[1]["departure"]["time"].startswith("2026-10-08")
+
+    missing = await flight_mock_service.mock_flight(**build_mock_params({**trip_info, "legs": None}), upload=False)
+    assert missing["success"] is False and missing["mock_request"] == {}
+
+
+@pytest.mark.asyncio
+async def test_client_disconnect_cancels_speculative_mock(monkeypatch):
+    """测试预判的 Mock 已启动、开始检索前客户端断开时取消 Mock 任务，不再上传无人使用的数据"""
+    from app.api import chat
+    from app.schemas.chat import ChatRequest
+
+    monkeypatch.setattr(settings, "INTENT_FAST_PATH", False)
+    monkeypatch.setattr(settings, "LLM_STREAMING", False)
+    monkeypatch.setattr(settings, "MOCK_SPECULATIVE", True)
+    trip_info = {**TRIP_INFO, "channel": "WX"}
+    mock_calls = []
+
+    async def parse_intent(user_message, history=None, current_trip_info=None):
+        return {"status": "complete", "trip_info": trip_info, "clarify": None, "message": "明天上海到香港"}
+
+    async def mock_flight(**kwargs):
+        mock_calls.append("started")
+        try:
+            await asyncio.sleep(5)
+            mock_calls.append("uploaded")
+        except asyncio.CancelledError:
+            mock_calls.append("cancelled")
+            raise
+
+    monkeypatch.setattr(chat.llm_service, "parse_intent", parse_intent)
+    monkeypatch.setattr(chat.flight_mock_service, "mock_flight", mock_flight)
+
+    response = await chat.chat(ChatRequest(message="明天上海到香港"))
+    frames = response.body_iterator
+    async for frame in frames:
+        if b'"SEARCHING"' in frame:
+            await asyncio.sleep(0.01)
+            break
+    await frames.aclose()
+    await asyncio.sleep(0.01)
+
+    assert mock_calls == ["started", "cancelled"]
@@ -0,0 +1,99 @@
+import asyncio
+from datetime import datetime, timedelta
+
+import pytest
+
+from app.core.config import settings
+from app.services import price_calendar
+from app.services.flight_table import FlightTable
+from app.services.price_calendar import PriceCalendarService, shift_trip
+
+
+def make_flight(flight_id: str, price: int, airline: str = "MU") -> dict:
+    return {
+        "id": flight_id,
+        "is_transfer": False,
+        "price": {"total": str(price)},
+        "segments": [{
+            "flight_no": f"{airline}{flight_id}",
+            "airline": {"code": airline},
+            "departure": {"code": "PVG", "time": "2026-10-01 08:00:00"},
+            "arrival": {"code": "HKG", "time": "2026-10-01 11:00:00"},
+            "duration": "180",
+        }],
+    }
+
+
+def test_shift_trip_moves_all_dates():
+    """测试整体平移出发、返程与各程日期"""
+    trip = {"dep_date": "2026-10-01", "return_date": "2026-10-05", "legs": [{"dep_date": "2026-10-01"}, {"dep_date": "2026-10-08"}]}
+    shifted = shift_trip(trip, -1)
+    assert shifted["dep_date"] == "2026-09-30"
+    assert shifted["return_date"] == "2026-10-04"
+    assert [leg["dep_date"] for leg in shifted["legs"]] == ["2026-09-30", "2026-10-07"]
+    assert trip["dep_date"] == "2026-10-01"
+
+
+@pytest.mark.asyncio
+async def test_calendar_streams_cells_with_bounded_concurrency(monkeypatch):
+    """测试日历并发受限、逐格下发、按价格列聚合，重复查询命中格子缓存"""
+    monkeypatch.setattr(settings, "CALENDAR_MAX_CONCURRENCY", 2)
+    center = (datetime.now() + timedelta(days=30)).strftime("%Y-%m-%d")
+    running = 0
+    peak = 0
+    searched = []
+
+    async def fake_search(trip_info, time_budget=None, **kwargs):
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        await asyncio.sleep(0.01)
+        running -= 1
+        searched.append(trip_info["dep_date"])
+        day = int(trip_info["dep_date"][-2:])
+        flights = [make_flight("1", 100 * day), make_flight("2", 100 * day + 40), make_flight("3", 50, airline="CA")]
+        return {"success": True, "flights": FlightTable.from_flights(flights)}
+
+    monkeypatch.setattr(price_calendar.flight_search_service, "search", fake_search)
+    service = PriceCalendarService()
+    trip_info = {"travel_type": "OW", "departure_code": "SHA", "arrival_code": "HKG", "dep_date": center}
+
+    events = [e async for e in service.stream(trip_info, days=2, filter_options={"airline_code": "MU"})]
+
+    cells = [e["cell"] for e in events if e["type"] == "cell"]
+    assert len(cells) == 5 and len(searched) == 5
+    assert peak <= 2
+    done = events[-1]
+    assert [c["offset"] for c in done["cells"]] == [-2, -1, 0, 1, 2]
+    center_cell = done["cells"][2]
+    day = int(center[-2:])
+    assert center_cell["min_price"] == 100 * day
+    assert center_cell["median_price"] == 100 * day + 20
+    assert center_cell["count"] == 2
+
+    again = [e async for e in service.stream(trip_info, days=1, filter_options={"airline_code": "MU"})]
+    assert all(e["cell"]["cached"] for e in again if e["type"] == "cell")
+    assert len(searched) == 5
+
+
+@pytest.mark.asyncio
+async def test_timed_out_cells_are_not_cached(monkeypatch):
+    """测试预算耗尽的格子只有部分航班，不写入格子缓存，下次查询重新搜索"""
+    center = (datetime.now() + timedelta(days=30)).strftime("%Y-%m-%d")
+    searched = []
+
+    async def fake_search(trip_info, time_budget=None, **kwargs):
+        searched.append(trip_info["dep_date"])
+        assert time_budget == settings.CALENDAR_TIME_BUDGET
+        return {"success": True, "flights": FlightTable.from_flights([make_flight("1", 500)]), "timed_out": True}
+
+    monkeypatch.setattr(price_calendar.flight_search_service, "search", fake_search)
+    service = PriceCalendarService()
+    trip_info = {"travel_type": "OW", "departure_code": "SHA", "arrival_code": "HKG", "dep_date": center}
+
+    first = [e async for e in service.stream(trip_info, days=0)]
+    second = [e async for e in service.stream(trip_info, days=0)]
+
+    assert first[0]["cell"]["timed_out"] is True and first[0]["cell"]["min_price"] == 500
+    assert second[0]["cell"]["cached"] is False
+    assert searched == [center, center]
@@ -0,0 +1,43 @@
+from app.core.config import settings
+from app.core.reference_index import reference_index
+from app.services.llm_service import LLMService
+from app.services.prompt_assembler import CORE_CITIES, PromptAssembler
+
+
+def test_references_keep_only_relevant_rows():
+    """参考表只保留消息、已收集信息和历史中涉及的城市/航司/渠道，外加固定的常用城市"""
+    assembler = PromptAssembler(reference_index)
+    refs = assembler.references(
+        "改成后天，东航，微信H5渠道",
+        current_trip_info={"departure_code": "CTU", "arrival_city": "悉尼", "flight_no": "CZ3001"},
+        history=[{"role": "user", "content": "从浦东出发去NRT"}]
+    )
+
+    city = refs["city_reference"]
+    assert "- 成都: CTU" in city and "- 悉尼: SYD" in city
+    assert "- 东京:" in city and "- 上海:" in city
+    assert "- 开罗:" not in city
+    assert len(city.splitlines()) == len(CORE_CITIES) + 3  # 核心城市 + 成都 + 悉尼 + "其他城市"提示行
+    assert refs["airline_reference"] == "- MU: 东方航空\n- CZ: 南方航空"
+    assert refs["flat_type_reference"] == "- TOC: 微信H5(WX)"
+
+
+def test_references_fall_back_to_full_tables_on_unmatched_hints():
+    """提到航司/渠道但没有识别出具体条目时给出完整的航司/渠道表"""
+    assembler = PromptAssembler(reference_index)
+    refs = assembler.references("上海到香港，想要某个航空公司的，走特别的渠道")
+    assert refs["airline_reference"] == assembler.full_airline_reference
+    assert refs["flat_type_reference"] == assembler.full_flat_type_reference
+
+    refs = assembler.references("明天上海到香港")
+    assert "用户未提及航司" in refs["airline_reference"]
+    assert assembler.stats()["avg_reference_chars"] < assembler.full_chars
+
+
+def test_system_prompt_respects_trim_setting(monkeypatch):
+    """关闭裁剪时使用完整参考表"""
+    trimmed = LLMService.system_prompt("明天上海到香港")
+    monkeypatch.setattr(settings, "LLM_PROMPT_TRIM", False)
+    full = LLMService.system_prompt("明天上海到香港")
+    assert "- 开罗:" in full and "- 开罗:" not in trimmed
+    assert len(trimmed) < len(full)
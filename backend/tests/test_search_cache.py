@@ -0,0 +1,128 @@
+import asyncio
+
+import pytest
+
+from app.core.cache import SingleFlight, TTLCache
+from app.services.flight_search import FlightSearchService
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture
+def search_service():
+    return FlightSearchService()
+
+
+def test_ttl_cache_expiry_and_lru():
+    """测试 TTL 过期与 LRU 淘汰"""
+    clock = FakeClock()
+    cache = TTLCache(maxsize=2, ttl=10, clock=clock)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1  # a 变为最近使用
+    cache.set("c", 3)  # 淘汰 b
+    assert cache.get("b") is None
+    assert cache.get("c") == 3
+
+    clock.now = 11
+    assert cache.get("a") is None
+    stats = cache.stats()
+    assert stats["hits"] == 2
+    assert stats["misses"] == 2
+    assert stats["evictions"] == 1
+
+
+@pytest.mark.asyncio
+async def test_single_flight_collapses_concurrent_calls():
+    """测试并发相同调用只执行一次"""
+    flight = SingleFlight()
+    calls = 0
+
+    async def work():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        return "done"
+
+    results = await asyncio.gather(*[flight.do("k", work) for _ in range(10)])
+    assert results == ["done"] * 10
+    assert calls == 1
+    assert flight.shared == 9
+
+
+@pytest.mark.asyncio
+async def test_single_flight_cancels_only_when_last_waiter_leaves():
+    """测试等待方被取消只影响自己，最后一个等待方离开时取消调用本身"""
+    flight = SingleFlight()
+    started, cancelled = asyncio.Event(), []
+
+    async def work():
+        started.set()
+        try:
+            await asyncio.sleep(5)
+        except asyncio.CancelledError:
+            cancelled.append(True)
+            raise
+
+    first = asyncio.ensure_future(flight.do("k", work))
+    second = asyncio.ensure_future(flight.do("k", work))
+    await started.wait()
+    assert flight.waiters("k") == 2
+
+    first.cancel()
+    await asyncio.sleep(0)
+    assert flight.in_flight("k") and not cancelled
+
+    second.cancel()
+    await asyncio.sleep(0.01)
+    assert cancelled == [True]
+    assert not flight.in_flight("k") and flight.cancelled == 1
+
+
+def test_search_cache_key_normalization(search_service):
+    """测试缓存键只取请求实际使用的字段，并归一化机场与乘客"""
+    base = {
+        "travel_type": "OW",
+        "departure_code": "SHA",
+        "arrival_code": "HKG",
+        "dep_date": "2026-10-01",
+        "passengers": [{"type": "ADT", "count": 1}],
+        "cabin_class": "Y",
+    }
+    same = {
+        **base,
+        "departure_code": "PVG",  # 与 SHA 同城，请求中都是 SHA
+        "departure_city": "上海",
+        "return_date": "2026-10-05",  # 单程不使用
+        "passengers": [{"type": "ADT", "count": 1}, {"type": "CHD", "count": 0}],
+        "channel": "WX",
+    }
+    different = {**base, "cabin_class": "C"}
+
+    assert search_service.search_cache_key(base) == search_service.search_cache_key(same)
+    assert search_service.search_cache_key(base) != search_service.search_cache_key(different)
+
+
+@pytest.mark.asyncio
+async def test_search_uses_cache_and_single_flight(search_service, mocker):
+    """测试相同搜索并发只打一次上游，之后命中缓存"""
+    async def fake_upstream(*args, **kwargs):
+        await asyncio.sleep(0.01)
+        yield {"type": "done", "result": {"success": True, "flights": [{"id": "1"}], "raw_response": {}, "error": None}}
+
+    upstream = mocker.patch.object(search_service, "_search_upstream_stream", side_effect=fake_upstream)
+    trip_info = {"travel_type": "OW", "departure_code": "SHA", "arrival_code": "HKG", "dep_date": "2026-10-01"}
+
+    results = await asyncio.gather(*[search_service.search(trip_info) for _ in range(10)])
+    assert all(r["flights"] == [{"id": "1"}] for r in results)
+    assert upstream.call_count == 1
+
+    await search_service.search(trip_info)
+    assert upstream.call_count == 1
+    assert search_service.cache_stats()["hits"] == 1
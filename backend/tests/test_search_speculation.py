@@ -0,0 +1,171 @@
+import asyncio
+import json
+
+import httpx
+import pytest
+
+from app.core.admission import admission
+from app.core.config import settings
+from app.services.flight_search import FlightSearchService
+from app.services.search_speculation import SearchSpeculation
+
+TRIP_INFO = {"travel_type": "OW", "departure_code": "SHA", "arrival_code": "HKG", "dep_date": "2026-10-01"}
+
+# 上游始终未完成的轮询响应，含一个航班
+UNFINISHED_POLL = {
+    "data": {
+        "success": True,
+        "finished": False,
+        "sleepTime": 1,
+        "route": {
+            "segments": {"k1": {
+                "lineNo": "MU501", "mktCode": "MU", "mktName": "MU",
+                "depStation": {"stationCode": "PVG", "cityName": "PVG"},
+                "arrStation": {"stationCode": "HKG", "cityName": "HKG"},
+                "depDate": "2026-10-01 08:00:00", "arrDate": "2026-10-01 11:00:00", "travelTime": 180,
+            }},
+            "tripProducts": [{
+                "trip": {"id": "1", "items": [{"flightKeys": [{"flightKey": "k1", "sequence": 1, "index": 1}]}]},
+                "priceQuote": {
+                    "cabinClassCode": "Y",
+                    "totalPrice": {"adultPrice": {"totalPrice": 500, "price": 400, "tax": 100}},
+                },
+            }],
+        },
+    }
+}
+
+
+def make_stream(events: list, closed: list, delay: float = 0.0):
+    """构造按给定间隔产出事件的搜索流，关闭时记录出发日期"""
+    async def search_stream(trip_info: dict):
+        try:
+            for event in events:
+                await asyncio.sleep(delay)
+                yield event
+        finally:
+            closed.append(trip_info["dep_date"])
+    return search_stream
+
+
+def test_ready_requires_fixed_route_and_dates():
+    """测试只有航线和日期都已确定（往返还需返程日期）且不指定航班号时才预启动搜索"""
+    ready = SearchSpeculation.ready
+    assert ready("complete", TRIP_INFO)
+    assert not ready("need_clarify", TRIP_INFO)
+    assert not ready("complete", {**TRIP_INFO, "dep_date": None})
+    assert not ready("complete", {**TRIP_INFO, "travel_type": "RT"})
+    assert ready("complete", {**TRIP_INFO, "travel_type": "RT", "return_date": "2026-10-05"})
+    assert not ready("complete", {**TRIP_INFO, "flight_no": "MU5001"})
+
+
+@pytest.mark.asyncio
+async def test_matching_final_parse_replays_speculative_events():
+    """测试最终解析结果与预启动参数一致时按原顺序重放已缓冲的搜索事件"""
+    speculation = SearchSpeculation(lambda trip_info: (trip_info["dep_date"],))
+    closed = []
+    events = [{"type": "partial", "flights": [1]}, {"type": "done", "result": {"success": True}}]
+    speculative = speculation.start(TRIP_INFO, make_stream(events, closed))
+    await asyncio.sleep(0.01)  # 最终解析完成前搜索已经跑完
+
+    claimed = speculation.claim(speculative, dict(TRIP_INFO))
+    assert claimed is speculative
+    assert [event async for event in claimed.events()] == events
+    assert speculation.stats()["used"] == 1
+
+
+@pytest.mark.asyncio
+async def test_mismatch_or_early_stop_cancels_speculative_search():
+    """测试参数不一致或调用方提前停止迭代时关闭预启动的搜索流"""
+    speculation = SearchSpeculation(lambda trip_info: (trip_info["dep_date"],))
+    closed = []
+    events = [{"type": "partial", "flights": [1]}, {"type": "done", "result": {"success": True}}]
+
+    speculative = speculation.start(TRIP_INFO, make_stream(events, closed, delay=5))
+    await asyncio.sleep(0.01)
+    assert speculation.claim(speculative, {**TRIP_INFO, "dep_date": "2026-10-02"}) is None
+    await asyncio.sleep(0.01)
+    assert closed == ["2026-10-01"]
+
+    speculative = speculation.start(TRIP_INFO, make_stream(events, closed, delay=0.05))
+    replay = speculation.claim(speculative, TRIP_INFO).events()
+    assert await replay.__anext__() == events[0]
+    await replay.aclose()  # 调用方提前停止（如 Mock 胜出）
+    await asyncio.sleep(0.01)
+    assert closed == ["2026-10-01", "2026-10-01"]
+    assert speculation.stats() == {**speculation.stats(), "started": 2, "used": 1, "discarded": 1}
+
+
+@pytest.mark.asyncio
+async def test_discarded_speculation_stops_real_search_polling(monkeypatch):
+    """测试丢弃或提前停止预启动搜索后，真实的搜索流不再轮询上游并释放准入名额"""
+    monkeypatch.setattr(settings, "SEARCH_POLL_MIN_SLEEP", 0.01)
+    service = FlightSearchService()
+    requests = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        requests.append(json.loads(request.content))
+        return httpx.Response(200, json=UNFINISHED_POLL)
+
+    service.http._client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    speculation = SearchSpeculation(lambda trip_info: (trip_info["dep_date"],))
+    trip_info = {**TRIP_INFO, "passengers": [{"type": "ADT", "count": 1}]}
+
+    async def polls_after_settle() -> int:
+        await asyncio.sleep(0.05)
+        count = len(requests)
+        await asyncio.sleep(0.2)
+        return count
+
+    # 最终解析结果与预启动参数不一致
+    speculative = speculation.start(trip_info, service.search_stream)
+    await asyncio.sleep(0.05)
+    assert requests
+    assert speculation.claim(speculative, {**trip_info, "dep_date": "2026-10-02"}) is None
+    assert await polls_after_settle() == len(requests)
+    assert admission.gates["search"].active == 0
+
+    # 参数一致，但调用方读到第一条事件后就停止（如 Mock 胜出）
+    polled = len(requests)
+    speculative = speculation.start(trip_info, service.search_stream)
+    await asyncio.sleep(0.05)
+    assert len(requests) > polled
+    replay = speculation.claim(speculative, trip_info).events()
+    await replay.__anext__()
+    await replay.aclose()
+    assert await polls_after_settle() == len(requests)
+    assert admission.gates["search"].active == 0
+    assert service._inflight.cancelled == 2
+
+
+@pytest.mark.asyncio
+async def test_client_disconnect_after_claim_cancels_speculative_search(monkeypatch):
+    """测试预启动搜索被采用后、开始消费前客户端断开，对话生成器关闭时取消预启动的搜索"""
+    from app.api import chat
+    from app.schemas.chat import ChatRequest
+
+    monkeypatch.setattr(settings, "INTENT_FAST_PATH", False)
+    monkeypatch.setattr(settings, "LLM_STREAMING", True)
+    monkeypatch.setattr(settings, "SEARCH_SPECULATIVE", True)
+    closed = []
+    result = {"status": "complete", "trip_info": TRIP_INFO, "clarify": None, "message": "明天上海到香港"}
+
+    async def parse_intent_stream(user_message, history=None, current_trip_info=None):
+        yield {"type": "progress", "status": "complete", "message": "", "trip_info": TRIP_INFO,
+               "trip_info_complete": True}
+        yield {"type": "result", "result": result}
+
+    events = [{"type": "partial", "flights": []}, {"type": "done", "result": {"success": True}}]
+    monkeypatch.setattr(chat.llm_service, "parse_intent_stream", parse_intent_stream)
+    monkeypatch.setattr(chat.flight_search_service, "search_stream", make_stream(events, closed, delay=5))
+
+    response = await chat.chat(ChatRequest(message="明天上海到香港"))
+    frames = response.body_iterator
+    async for frame in frames:
+        if "明天上海到香港".encode() in frame:
+            await asyncio.sleep(0.01)  # 预启动的搜索已在后台轮询
+            break  # 已采用预启动搜索，尚未开始检索
+    await frames.aclose()
+    await asyncio.sleep(0.01)
+
+    assert closed == ["2026-10-01"]
@@ -1,5 +1,5 @@
 import axios from 'axios'
-import type { ChatResponse } from '../types'
+import type { ChatResponse, DebugPayload, FlightPage } from '../types'
 
 // API 基础配置
 const api = axios.create({
@@ -30,6 +30,25 @@ export async function getSession(sessionId: string) {
   return response.data
 }
 
+// 分页获取会话最近一次的航班结果（sort 前缀 - 表示倒序）
+export async function getSessionFlights(
+  sessionId: string,
+  offset: number,
+  limit: number,
+  sort?: string
+): Promise<FlightPage> {
+  const response = await api.get<FlightPage>(`/session/${sessionId}/flights`, {
+    params: { offset, limit, sort }
+  })
+  return response.data
+}
+
+// 按需获取调试数据（Mock 请求、搜索原始响应）
+export async function getDebugPayload(debugId: string): Promise<DebugPayload> {
+  const response = await api.get<DebugPayload>(`/debug/${debugId}`)
+  return response.data
+}
+
 // 创建新会话
 export async function createSession() {
   const response = await api.post<{ session_id: string }>('/session/new')
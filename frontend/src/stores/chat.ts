@@ -1,6 +1,7 @@
 import { defineStore } from 'pinia'
 import { ref, computed } from 'vue'
-import type { ChatMessage, TripInfo, FlightInfo, ClarifyInfo, DebugInfo } from '../types'
+import type { ChatMessage, TripInfo, FlightInfo, ClarifyInfo, DebugInfo, DebugPayload } from '../types'
+import { getDebugPayload, getSessionFlights } from '../api/chat'
 
 export const useChatStore = defineStore('chat', () => {
   // 状态
@@ -12,11 +13,19 @@ export const useChatStore = defineStore('chat', () => {
   const isLoading = ref(false)
   const isMocked = ref(false)
   const debugInfo = ref<DebugInfo | null>(null)
+  const debugPayload = ref<DebugPayload | null>(null)
+  const debugError = ref('')
   const currentProgress = ref<string>('')
+  // 分页：final 只下发第一页，其余按需从 /session/{id}/flights 拉取
+  const totalFlights = ref(0)
+  const pageSize = ref(20)
+  const flightSort = ref('price')
+  const isLoadingMore = ref(false)
 
   // 计算属性
   const hasTrip = computed(() => tripInfo.value !== null)
   const hasFlights = computed(() => flights.value.length > 0)
+  const hasMoreFlights = computed(() => flights.value.length < totalFlights.value)
   const needsClarify = computed(() => currentClarify.value !== null)
 
   // 生成消息ID
@@ -51,8 +60,11 @@ export const useChatStore = defineStore('chat', () => {
     // 清除上一次的搜索结果，防止新搜索时展示老数据
     tripInfo.value = null
     flights.value = []
+    totalFlights.value = 0
     isMocked.value = false
     debugInfo.value = null
+    debugPayload.value = null
+    debugError.value = ''
 
     // 立即创建一条助手消息用于展示进度（后续就地更新）
     const progressMsgId = generateId()
@@ -122,6 +134,15 @@ export const useChatStore = defineStore('chat', () => {
 
                 messages.value[idx] = updatedMsg
               }
+            } else if (data.type === 'intent') {
+              // LLM 仍在生成：展示已生成的回复文本
+              const idx = messages.value.findIndex(m => m.id === progressMsgId)
+              if (idx !== -1 && data.message) {
+                messages.value[idx] = { ...messages.value[idx], content: data.message } as ChatMessage
+              }
+            } else if (data.type === 'partial') {
+              // 搜索仍在轮询：先展示本轮新出现的航班，final 到达后整体替换
+              flights.value = [...flights.value, ...(data.flights || [])]
             } else if (data.type === 'final') {
               // 更新会话ID
               sessionId.value = data.session_id
@@ -131,6 +152,9 @@ export const useChatStore = defineStore('chat', () => {
 
               // 更新航班列表
               flights.value = data.flights || []
+              totalFlights.value = data.total ?? flights.value.length
+              pageSize.value = data.page_size || pageSize.value
+              flightSort.value = data.sort || flightSort.value
               isMocked.value = data.is_mocked || false
 
               // 更新调试信息
@@ -181,6 +205,49 @@ export const useChatStore = defineStore('chat', () => {
     }
   }
 
+  // 加载下一页航班
+  async function loadMoreFlights() {
+    if (!sessionId.value || isLoadingMore.value || !hasMoreFlights.value) return
+    isLoadingMore.value = true
+    try {
+      const page = await getSessionFlights(sessionId.value, flights.value.length, pageSize.value, flightSort.value)
+      flights.value = [...flights.value, ...page.flights]
+      totalFlights.value = page.total
+    } finally {
+      isLoadingMore.value = false
+    }
+  }
+
+  // 切换排序：结果不止一页时由服务端重新排序，从第一页开始
+  async function changeSort(sort: string) {
+    if (sort === flightSort.value) return
+    flightSort.value = sort
+    if (!sessionId.value || totalFlights.value <= flights.value.length) return
+    isLoadingMore.value = true
+    try {
+      const page = await getSessionFlights(sessionId.value, 0, pageSize.value, sort)
+      flights.value = page.flights
+      totalFlights.value = page.total
+    } finally {
+      isLoadingMore.value = false
+    }
+  }
+
+  // 按需加载调试数据（同一 debug_id 只请求一次）
+  async function loadDebugPayload() {
+    const debugId = debugInfo.value?.debug_id
+    if (!debugId || debugPayload.value) return
+    debugError.value = ''
+    try {
+      debugPayload.value = await getDebugPayload(debugId)
+    } catch (error: any) {
+      // 调试数据按容量/TTL 淘汰，过期后返回 404
+      debugError.value = error.response?.status === 404
+        ? '调试数据已过期，请重新搜索后查看'
+        : '调试数据加载失败，请稍后重试'
+    }
+  }
+
   // 选择澄清选项
   async function selectOption(option: { label: string; value: string }) {
     if (currentClarify.value) {
@@ -195,10 +262,13 @@ export const useChatStore = defineStore('chat', () => {
     messages.value = []
     tripInfo.value = null
     flights.value = []
+    totalFlights.value = 0
     currentClarify.value = null
     isLoading.value = false
     isMocked.value = false
     debugInfo.value = null
+    debugPayload.value = null
+    debugError.value = ''
     currentProgress.value = ''
   }
 
@@ -212,14 +282,22 @@ export const useChatStore = defineStore('chat', () => {
     isLoading,
     isMocked,
     debugInfo,
+    debugPayload,
+    debugError,
     currentProgress,
+    totalFlights,
+    isLoadingMore,
     // 计算属性
     hasTrip,
     hasFlights,
+    hasMoreFlights,
     needsClarify,
     // 方法
     send,
     selectOption,
+    loadMoreFlights,
+    loadDebugPayload,
+    changeSort,
     reset
   }
 })
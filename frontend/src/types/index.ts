@@ -30,6 +30,15 @@ export interface TripInfo {
   cabin_name?: string
   airline_code?: string
   flight_no?: string
+  legs?: TripLeg[]
+}
+
+export interface TripLeg {
+  departure_code: string
+  arrival_code: string
+  dep_date: string
+  departure_city?: string
+  arrival_city?: string
 }
 
 export interface ClarifyOption {
@@ -45,6 +54,7 @@ export interface ClarifyInfo {
 
 export interface FlightSegment {
   sequence: number
+  leg?: number  // 分程搜索拼接的行程中航段所属的程
   flight_no: string
   airline: {
     code: string
@@ -72,7 +82,7 @@ export interface FlightSegment {
 export interface FlightInfo {
   id: string
   type: string
-  travel_type: 'OW' | 'RT'
+  travel_type: 'OW' | 'RT' | 'OJ'
   segments: FlightSegment[]
   is_transfer: boolean
   cabin_class: string
@@ -108,7 +118,13 @@ export interface ChatMessage {
   progressStatus?: string
 }
 
+// final 事件只携带调试数据的 id 和大小，原始数据通过 /api/debug/{id} 按需获取
 export interface DebugInfo {
+  debug_id?: string | null
+  sizes?: Record<string, number>
+}
+
+export interface DebugPayload {
   mock_request?: Record<string, any>
   search_response?: Record<string, any>
 }
@@ -120,6 +136,18 @@ export interface ChatResponse {
   trip_info?: TripInfo
   clarify?: ClarifyInfo
   flights: FlightInfo[]
+  total?: number
   is_mocked: boolean
   debug_info?: DebugInfo
 }
+
+export interface FlightPage {
+  session_id: string
+  offset: number
+  limit: number
+  sort: string
+  total: number
+  has_more: boolean
+  is_mocked: boolean
+  flights: FlightInfo[]
+}